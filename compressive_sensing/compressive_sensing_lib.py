@@ -18,17 +18,22 @@ def sts_correlate(x):
     return corout
 
 
-def vtoeplitz(toprow):
-
+def vtoeplitz(toprow, dtype='complex64', read_only=False):
+    '''
+    Hermitian Toeplitz matrices whose first column is toprow, one per row of toprow, built as a strided view of the mirrored row
+    (no per-row loop). dtype=None keeps the precision of toprow, read_only=True skips the final copy.
+    '''
     Npts= toprow.shape[1]
     Nrow= toprow.shape[0]
-    
-    ACM= np.zeros((Nrow,Npts,Npts)).astype('complex64')
-    
-    for i in range(Npts):
-        ACM[:,i,i:]= toprow[:,0:Npts-i].conj()
-        ACM[:,i:,i]= toprow[:,0:Npts-i]
-    
+    if dtype is None:
+        dtype = np.result_type(toprow.dtype,np.complex64)
+    mirrored_row = np.hstack((toprow[:,::-1],toprow[:,1::].conj())).astype(dtype) # tN-1,..t1,t0,t1*,..tN-1*
+    row_stride, elem_stride = mirrored_row.strides
+    windows = np.lib.stride_tricks.as_strided(mirrored_row, shape=(Nrow,Npts,Npts), strides=(row_stride,elem_stride,elem_stride), writeable=False)
+    ACM = windows[:,::-1,:] # ACM[i,j] = t[i-j]
+    if not read_only:
+        ACM = np.ascontiguousarray(ACM)
+
     return ACM
 
 
@@ -101,7 +106,7 @@ def MP_covariance(dictionary_matrix, y_vec, threshold):
     dict_cov = dict_cov/np.linalg.norm(dict_cov,axis=0)
     y_vec_copy = y_vec.copy()
     y_vec_corr = sts_correlate(y_vec_copy.T)
-    y_vec_toeplitz = vtoeplitz(y_vec_corr) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
+    y_vec_toeplitz = vtoeplitz(y_vec_corr, read_only=True) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
     y_vec_toeplitz = y_vec_toeplitz[0,:,:]
     new_y_vec = y_vec_toeplitz[np.triu_indices(num_rows)][:,None]
     
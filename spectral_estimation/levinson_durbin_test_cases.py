@@ -6,7 +6,7 @@ Created on Mon Aug 12 15:27:05 2019
 """
 
 import numpy as np
-from spectral_estimation_lib import solve_levinson_durbin, sts_correlate, vtoeplitz
+from spectral_estimation_lib import solve_levinson_durbin, solve_levinson_toeplitz, sts_correlate, vtoeplitz
 import matplotlib.pyplot as plt
 from time import time
 import scipy.linalg
@@ -53,4 +53,29 @@ plt.title('Error in Imag Part of x_vec')
 plt.plot(np.imag(x_vec)-np.imag(x_vec_est_scipy),'-o',label='error from scipy package')
 plt.plot(np.imag(x_vec)-np.imag(x_vec_est),'-o',label='error from my implementation')
 plt.legend();
-plt.grid(True)
\ No newline at end of file
+plt.grid(True)
+
+
+
+### Benchmark of the multi rhs/multi system solver against scipy.linalg.solve_toeplitz
+num_rhs = 256
+num_systems = 64
+order = 64
+signals = np.random.randn(num_systems,order) + 1j*np.random.randn(num_systems,order)
+corr_vecs = sts_correlate(signals) # [num_systems, order], one Hermitian Toeplitz system per row
+y_mat = np.random.randn(num_systems,order,num_rhs) + 1j*np.random.randn(num_systems,order,num_rhs)
+
+t1 = time()
+x_mat_est_loop = np.array([solve_levinson_toeplitz(corr_vecs[ele,:], corr_vecs[ele,:].conj(), y_mat[ele,:,:]) for ele in np.arange(num_systems)])
+t2 = time()
+print('\nMulti rhs: one system at a time: {0:.1f} ms'.format((t2-t1)*1000))
+t1 = time()
+x_mat_est = solve_levinson_toeplitz(corr_vecs, corr_vecs.conj(), y_mat)
+t2 = time()
+print('Multi rhs + multi system in one call: {0:.1f} ms'.format((t2-t1)*1000))
+t1 = time()
+x_mat_est_scipy = np.array([scipy.linalg.solve_toeplitz((corr_vecs[ele,:], corr_vecs[ele,:].conj()), y_mat[ele,:,:]) for ele in np.arange(num_systems)])
+t2 = time()
+print('scipy.linalg.solve_toeplitz (loop over systems): {0:.1f} ms'.format((t2-t1)*1000))
+print('Max abs deviation from scipy: {0:.2e}'.format(np.amax(np.abs(x_mat_est-x_mat_est_scipy))))
+print('Max abs deviation between the batched and per system solves: {0:.2e}'.format(np.amax(np.abs(x_mat_est-x_mat_est_loop))))
@@ -5,8 +5,51 @@ Created on Tue Mar 19 21:06:12 2019
 @author: Sai Gunaranjan Pelluri
 """
 import numpy as np
+import hashlib
+import threading
+import contextlib
+from collections import OrderedDict
 
 
+_steering_cache = OrderedDict() # (num_rows, grid hash, sign, dtype) -> read-only steering matrix, oldest entry first
+_steering_cache_lock = threading.Lock()
+_steering_cache_state = {'max_bytes': 256*1024**2, 'bytes': 0, 'hits': 0, 'misses': 0}
+_steering_cache_local = threading.local() # per thread switch of uncached_steering
+_precision_policies = {'mixed': {'signal': None, 'covariance': 'complex64', 'steering': 'complex128'}, # signal None: used as given
+                       'complex64': {'signal': 'complex64', 'covariance': 'complex64', 'steering': 'complex64'},
+                       'complex128': {'signal': 'complex128', 'covariance': 'complex128', 'steering': 'complex128'}}
+_precision_state = {'policy': 'mixed'}
+
+
+def set_precision(policy):
+    '''
+    Sets the precision policy of the estimators
+     inputs:
+         policy: 'mixed' : complex64 auto-correlation matrices, complex128 steering matrices, signals used as given (historical behaviour)
+                 'complex64' : signals, auto-correlation matrices, steering matrices and spectra in single precision end-to-end
+                 'complex128' : everything in double precision
+    '''
+    if policy not in _precision_policies:
+        raise ValueError('policy must be one of {}'.format(', '.join(_precision_policies)))
+    _precision_state['policy'] = policy
+
+
+def get_precision():
+    return _precision_state['policy']
+
+
+def working_dtype(kind):
+    '''dtype used for kind = 'signal', 'covariance' or 'steering' under the current precision policy (None: signal used as given)'''
+    return _precision_policies[_precision_state['policy']][kind]
+
+
+def working_signal(received_signal):
+    '''received_signal cast to the signal dtype of the precision policy (no copy when it already has it)'''
+    signal_dtype = working_dtype('signal')
+    if signal_dtype is None:
+        return received_signal
+    return np.asarray(received_signal).astype(signal_dtype, copy=False)
+
 
 def sts_correlate(x):
     N= x.shape[1]
@@ -16,20 +59,437 @@ def sts_correlate(x):
     return corout
 
 
-def vtoeplitz(toprow):
-
+def vtoeplitz(toprow, dtype='policy', read_only=False):
+    '''
+    Hermitian Toeplitz matrices whose first column is toprow (and first row its conjugate), one per row of toprow
+     inputs:
+         toprow: numpy array of shape Nrow x Npts
+         dtype: dtype of the output. 'policy' (default) uses the covariance dtype of the precision policy (see set_precision),
+                None keeps the precision of toprow
+         read_only: if True, returns a read-only strided view of a mirrored copy of toprow (only 2*Npts-1 elements per row are
+                    stored). Use it when the caller only reads the matrix.
+     outputs:
+         ACM: numpy array of shape Nrow x Npts x Npts
+    '''
     Npts= toprow.shape[1]
-    Nrow= toprow.shape[0]
-    
-    ACM= np.zeros((Nrow,Npts,Npts)).astype('complex64')
-    
-    for i in range(Npts):
-        ACM[:,i,i:]= toprow[:,0:Npts-i].conj()
-        ACM[:,i:,i]= toprow[:,0:Npts-i]
-    
+    if dtype is None:
+        dtype = np.result_type(toprow.dtype,np.complex64)
+    elif dtype == 'policy':
+        dtype = working_dtype('covariance')
+    mirrored_row = np.hstack((toprow[:,::-1],toprow[:,1::].conj())).astype(dtype) # tN-1,..t1,t0,t1*,..tN-1*
+    ACM = hankel_view(mirrored_row, Npts)[:,::-1,:] # window i starts at tN-1-i and is row N-1-i, so flipping the windows gives ACM[i,j] = t[i-j]
+    if not read_only:
+        ACM = np.ascontiguousarray(ACM)
+
     return ACM
 
 
+def steering_matrix(num_rows, digital_freq_grid, sign=-1, dtype=None, cache=True):
+    '''
+    Vandermonde (steering) matrix exp(sign*1j*outer(arange(num_rows), digital_freq_grid)) served from a process-wide LRU cache
+     inputs:
+         num_rows: number of rows of the steering matrix (model order/signal length)
+         digital_freq_grid: numpy array of length num_freq
+         sign: -1 for exp(-1j*w*n) (MUSIC, Capon, APES) and +1 for exp(1j*w*n) (IAA)
+         dtype: complex dtype of the steering matrix. None uses the steering dtype of the precision policy (see set_precision)
+         cache: False for one-off grids: an already cached matrix is still served, but a new one is not stored, so it does not
+                push out the reused entries. Also False inside an uncached_steering() block
+     outputs:
+         vandermonde_matrix: read-only numpy array of shape num_rows x num_freq. The same array is handed to every caller,
+                             so it must not be modified in place
+
+        The cache holds at most set_steering_cache_size() bytes and evicts the least recently used matrix first.
+    '''
+    if dtype is None:
+        dtype = working_dtype('steering')
+    digital_freq_grid = np.ascontiguousarray(digital_freq_grid, dtype=np.float64)
+    grid_hash = hashlib.blake2b(digital_freq_grid.tobytes(), digest_size=16).hexdigest()
+    key = (int(num_rows), len(digital_freq_grid), grid_hash, int(np.sign(sign)), np.dtype(dtype).str)
+    with _steering_cache_lock:
+        vandermonde_matrix = _steering_cache.get(key)
+        if vandermonde_matrix is not None:
+            _steering_cache.move_to_end(key) # most recently used
+            _steering_cache_state['hits'] += 1
+            return vandermonde_matrix
+        _steering_cache_state['misses'] += 1
+    vandermonde_matrix = np.exp(np.sign(sign)*1j*np.outer(np.arange(num_rows),digital_freq_grid)).astype(dtype)
+    vandermonde_matrix.setflags(write=False)
+    if not (cache and getattr(_steering_cache_local, 'enabled', True)):
+        return vandermonde_matrix
+    with _steering_cache_lock:
+        if (key not in _steering_cache) and (vandermonde_matrix.nbytes <= _steering_cache_state['max_bytes']):
+            _steering_cache[key] = vandermonde_matrix
+            _steering_cache_state['bytes'] += vandermonde_matrix.nbytes
+            while _steering_cache_state['bytes'] > _steering_cache_state['max_bytes']:
+                evicted_key, evicted_matrix = _steering_cache.popitem(last=False) # least recently used
+                _steering_cache_state['bytes'] -= evicted_matrix.nbytes
+
+    return vandermonde_matrix
+
+
+@contextlib.contextmanager
+def uncached_steering():
+    '''
+    Within the block, the steering matrices built on this thread are not stored in the cache (see steering_matrix). Used for
+    one-off grids that reach steering_matrix through an estimator, e.g. the local grids of coarse_to_fine_peaks
+    '''
+    previous_state = getattr(_steering_cache_local, 'enabled', True)
+    _steering_cache_local.enabled = False
+    try:
+        yield
+    finally:
+        _steering_cache_local.enabled = previous_state
+
+
+def set_steering_cache_size(max_bytes):
+    '''Sets the memory bound (in bytes) of the steering matrix cache. Setting it to 0 disables caching'''
+    with _steering_cache_lock:
+        _steering_cache_state['max_bytes'] = max_bytes
+        while _steering_cache and (_steering_cache_state['bytes'] > max_bytes):
+            evicted_key, evicted_matrix = _steering_cache.popitem(last=False)
+            _steering_cache_state['bytes'] -= evicted_matrix.nbytes
+
+
+def clear_steering_cache():
+    with _steering_cache_lock:
+        _steering_cache.clear()
+        _steering_cache_state['bytes'] = 0
+        _steering_cache_state['hits'] = 0
+        _steering_cache_state['misses'] = 0
+
+
+def steering_cache_info():
+    '''Returns a dict with the number of cached matrices, the bytes held, the memory bound and the hit/miss counts'''
+    with _steering_cache_lock:
+        cache_info = dict(_steering_cache_state, entries=len(_steering_cache))
+    return cache_info
+
+
+def hankel_view(received_signal, snapshot_length):
+    '''
+    Zero-copy strided view of the data (Hankel) matrix of a batch of signals
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row)
+         snapshot_length: length of each snapshot
+     outputs:
+         data_matrix: read-only view of shape num_cells x (num_samples-snapshot_length+1) x snapshot_length
+                      whose row t is y[t:t+snapshot_length]. No data is copied.
+    '''
+    received_signal = np.asarray(received_signal)
+    num_cells, signal_length = received_signal.shape
+    num_snapshots = signal_length - snapshot_length + 1
+    cell_stride, sample_stride = received_signal.strides
+    data_matrix = np.lib.stride_tricks.as_strided(received_signal, shape=(num_cells,num_snapshots,snapshot_length),
+                                                  strides=(cell_stride,sample_stride,sample_stride), writeable=False)
+    return data_matrix
+
+
+def corr_matrix(received_signal, corr_mat_model_order, method='forward'):
+    '''
+    Sample auto-correlation matrix built from all the snapshots of the signal with a single (batched) matrix product
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell (e.g. one column per chirp of a virtual array). The columns are
+                          averaged, R = X X^H / L, after the spatial smoothing over subarrays of length corr_mat_model_order
+         corr_mat_model_order: size of the auto-correlation matrix (snapshot length). With snapshot columns,
+                               corr_mat_model_order = num_samples gives the plain X X^H / L without spatial smoothing
+         method: 'forward' : snapshots are y[t], y[t+1],..y[t+M-1] (forward filtering as in music_forward)
+                 'backward' : snapshots are y[t+M-1], y[t+M-2],..y[t] (as in music_backward)
+                 'forward_backward' : 0.5*(Rf + J Rf* J), the usual forward-backward averaged matrix
+     outputs:
+         auto_corr_matrix: numpy array of shape num_cells x M x M. This is the sum (not the mean) of the snapshot outer products
+                           over the subarrays, so each estimator applies its own normalisation
+    '''
+    received_signal = working_signal(received_signal)
+    if received_signal.ndim == 3:
+        num_cells, signal_length, num_columns = received_signal.shape
+        data_matrix = hankel_view(received_signal.transpose(0,2,1).reshape(num_cells*num_columns,signal_length), corr_mat_model_order)
+        data_matrix = data_matrix.reshape(num_cells, -1, corr_mat_model_order) # the subarrays of all the columns stacked, [num_cells, L*num_snapshots, M]
+    else:
+        data_matrix = hankel_view(received_signal, corr_mat_model_order) # [num_cells, num_snapshots, M]
+    auto_corr_matrix = np.matmul(data_matrix.transpose(0,2,1), data_matrix.conj()) # R[i,j] = sum_t y[t+i]y*[t+j] for all the lags (and columns) in one GEMM
+    if received_signal.ndim == 3:
+        auto_corr_matrix = auto_corr_matrix/num_columns
+    if method == 'backward':
+        auto_corr_matrix = auto_corr_matrix[:,::-1,::-1] # Reversing the snapshots is the same as flipping the forward matrix: J Rf J
+    elif method == 'forward_backward':
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    elif method != 'forward':
+        raise ValueError('method must be one of forward, backward or forward_backward')
+    auto_corr_matrix = auto_corr_matrix.astype(working_dtype('covariance'), copy=False) # complex64 unless the precision policy says otherwise (see set_precision)
+
+    return auto_corr_matrix
+
+
+def forward_backward_average(auto_corr_matrix):
+    '''
+    Forward-backward averaging 0.5*(R + J R* J) of a stack of auto-correlation matrices [..., M, M]. Averaging a backward
+    matrix J Rf J gives J (forward-backward averaged Rf) J, so the estimators apply it to either
+    '''
+    return 0.5*(auto_corr_matrix + auto_corr_matrix[...,::-1,::-1].conj())
+
+
+def corr_num_snapshots(received_signal, corr_mat_model_order):
+    '''Number of snapshots averaged into corr_matrix(received_signal, corr_mat_model_order), num_samples-M+1 for each snapshot column'''
+    num_columns = received_signal.shape[2] if received_signal.ndim == 3 else 1
+    return (received_signal.shape[1]-corr_mat_model_order+1)*num_columns
+
+
+def corr_matrix_2d(received_signal, corr_mat_model_orders, method='forward'):
+    '''
+    Sample auto-correlation matrix of the M1 x M2 subarrays of a 2D signal (2D spatial smoothing), built with a single
+    (batched) matrix product. The subarrays are vectorised row by row, x[m1*M2+m2] = y[t1+m1, t2+m2], so the matrix is
+    two-level Toeplitz-like (M1 x M1 blocks of M2 x M2) and its steering vectors are a1 kron a2
+     inputs:
+         received_signal: numpy array of shape num_cells x N1 x N2
+         corr_mat_model_orders: (M1, M2), subarray size
+         method: 'forward' : subarrays y[t1+m1, t2+m2]
+                 'backward' : subarrays y[t1+M1-1-m1, t2+M2-1-m2], i.e. J Rf J
+     outputs:
+         auto_corr_matrix: numpy array of shape num_cells x M1M2 x M1M2, the mean (not the sum) of the subarray outer products
+    '''
+    received_signal = working_signal(received_signal)
+    num_cells, signal_length_1, signal_length_2 = received_signal.shape
+    corr_mat_model_order_1, corr_mat_model_order_2 = corr_mat_model_orders
+    num_snapshots_1 = signal_length_1-corr_mat_model_order_1+1
+    num_snapshots_2 = signal_length_2-corr_mat_model_order_2+1
+    cell_stride, sample_stride_1, sample_stride_2 = received_signal.strides
+    data_matrix = np.lib.stride_tricks.as_strided(received_signal, shape=(num_cells,num_snapshots_1,num_snapshots_2,corr_mat_model_order_1,corr_mat_model_order_2),
+                                                  strides=(cell_stride,sample_stride_1,sample_stride_2,sample_stride_1,sample_stride_2), writeable=False)
+    data_matrix = data_matrix.reshape(num_cells, num_snapshots_1*num_snapshots_2, corr_mat_model_order_1*corr_mat_model_order_2) # one row per subarray
+    auto_corr_matrix = np.matmul(data_matrix.transpose(0,2,1), data_matrix.conj())/(num_snapshots_1*num_snapshots_2)
+    if method == 'backward':
+        auto_corr_matrix = auto_corr_matrix[:,::-1,::-1] # flipping both axes of the subarray reverses its vector
+    elif method != 'forward':
+        raise ValueError('method must be forward or backward')
+    auto_corr_matrix = auto_corr_matrix.astype(working_dtype('covariance'), copy=False) # see set_precision
+
+    return auto_corr_matrix
+
+
+def uniform_grid_fft_size(digital_freq_grid):
+    '''
+    Checks if the frequency grid is w0 + 2*pi*k/L, k = 0,1,..num_freq-1 for an integer L
+     outputs:
+         fft_size: L if the grid is uniform with a step of 2*pi/L (so that the grid can be evaluated with L point FFTs), else None
+    '''
+    digital_freq_grid = np.asarray(digital_freq_grid, dtype=np.float64)
+    num_freq = len(digital_freq_grid)
+    if (num_freq < 2) or (digital_freq_grid[1] <= digital_freq_grid[0]):
+        return None
+    fft_size = int(np.round(2*np.pi/(digital_freq_grid[1]-digital_freq_grid[0])))
+    if fft_size < 1:
+        return None
+    expected_grid = digital_freq_grid[0] + 2*np.pi*np.arange(num_freq)/fft_size
+    if np.amax(np.abs(digital_freq_grid - expected_grid)) > 1e-9*max(1,num_freq):
+        return None
+    return fft_size
+
+
+def diagonal_sums(matrix):
+    '''
+    Sums along all the diagonals of a (batch of) square matrices
+     inputs:
+         matrix: numpy array of shape ... x M x M
+     outputs:
+         diag_sums: numpy array of shape ... x 2M-1, where diag_sums[...,k+M-1] = sum over m-n=k of matrix[...,m,n], k = -(M-1),..M-1.
+                    The sums are accumulated at the steering precision of the policy (complex128 unless it is 'complex64')
+    '''
+    num_rows = matrix.shape[-1]
+    batch_shape = matrix.shape[:-2]
+    padded_matrix = np.zeros(batch_shape + (num_rows,2*num_rows), dtype=np.result_type(matrix.dtype,working_dtype('steering')))
+    padded_matrix[...,0:num_rows] = matrix[...,::-1] # after the column flip, element (m,n) sits in column M-1-n
+    skewed_matrix = padded_matrix.reshape(batch_shape + (2*num_rows*num_rows,))[...,0:num_rows*(2*num_rows-1)]
+    skewed_matrix = skewed_matrix.reshape(batch_shape + (num_rows,2*num_rows-1)) # row m is shifted right by m, so column m-n+M-1 holds all the elements of diagonal m-n
+    diag_sums = np.sum(skewed_matrix,axis=-2)
+
+    return diag_sums
+
+
+def grid_dtft(coefficients, first_index, digital_freq_grid, sign=-1, fft_size=None):
+    '''
+    Evaluates sum_n c[...,n]*exp(sign*1j*(first_index+n)*w) at every w of a uniform grid using one zero-padded/folded FFT
+     inputs:
+         coefficients: numpy array of shape ... x num_coeffs
+         first_index: time/lag index of coefficients[...,0] (can be negative)
+         digital_freq_grid: uniform grid (see uniform_grid_fft_size)
+         sign: sign of the exponent
+         fft_size: uniform_grid_fft_size(digital_freq_grid) when the caller already has it (e.g. inside an iteration). None
+                   checks the grid
+     outputs:
+         dtft: numpy array of shape ... x num_freq, at the steering precision of the policy like a product with steering_matrix
+               (complex128 under 'mixed' even for complex64 coefficients)
+    '''
+    if fft_size is None:
+        fft_size = uniform_grid_fft_size(digital_freq_grid)
+    if fft_size is None:
+        raise ValueError('grid_dtft needs a uniform grid with a step of 2*pi/L for an integer L')
+    num_coeffs = coefficients.shape[-1]
+    num_freq = len(digital_freq_grid)
+    lag_indices = first_index + np.arange(num_coeffs)
+    phased_coefficients = coefficients*np.exp(sign*1j*lag_indices*digital_freq_grid[0]).astype(np.result_type(coefficients.dtype,working_dtype('steering'))) # move the start of the grid to w = 0
+    fft_bins = lag_indices % fft_size
+    fft_input = np.zeros(coefficients.shape[:-1] + (fft_size,), dtype=np.result_type(phased_coefficients.dtype,np.complex64))
+    for chunk_start in np.arange(0,num_coeffs,fft_size): # more than one chunk only when the grid is coarser than the number of coefficients (time aliasing)
+        fft_input[...,fft_bins[chunk_start:chunk_start+fft_size]] += phased_coefficients[...,chunk_start:chunk_start+fft_size]
+    if sign < 0:
+        dtft = np.fft.fft(fft_input,axis=-1)
+    else:
+        dtft = np.fft.ifft(fft_input,axis=-1)*fft_size
+    dtft = dtft[...,np.arange(num_freq) % fft_size]
+
+    return dtft
+
+
+def steering_quadratic_form(matrix, digital_freq_grid, sign=-1, eval_mode='direct'):
+    '''
+    Evaluates a(w)^H Q a(w) for all the frequencies of the grid, where a(w) = exp(sign*1j*w*arange(M))
+     inputs:
+         matrix: Q, numpy array of shape ... x M x M
+         digital_freq_grid: numpy array of length num_freq
+         sign: sign of the exponent of the steering vector
+         eval_mode: 'direct' : sum(A.conj()*(Q@A)), O(M^2 num_freq)
+                    'fft' : FFT of the diagonal sums of Q, O(M^2 + num_freq log num_freq). Needs a uniform grid with a step of 2*pi/L,
+                            falls back to 'direct' for any other grid
+     outputs:
+         quad_form: numpy array of shape ... x num_freq
+    '''
+    num_rows = matrix.shape[-1]
+    if (eval_mode == 'fft') and (uniform_grid_fft_size(digital_freq_grid) is not None):
+        # a^H Q a = sum_k d_k exp(-sign*1j*k*w), d_k being the sum of the kth diagonal of Q
+        quad_form = grid_dtft(diagonal_sums(matrix), -(num_rows-1), digital_freq_grid, -sign)
+    else:
+        vandermonde_matrix = steering_matrix(num_rows, digital_freq_grid, sign)
+        quad_form = np.sum(vandermonde_matrix.conj()*np.matmul(matrix,vandermonde_matrix),axis=-2)
+
+    return quad_form
+
+
+def steering_inner_product(vectors, digital_freq_grid, sign=-1, eval_mode='direct'):
+    '''
+    Evaluates a(w)^H v for all the frequencies of the grid, where a(w) = exp(sign*1j*w*arange(M))
+     inputs:
+         vectors: numpy array of shape ... x M
+         eval_mode: 'direct' (matrix product with the steering matrix) or 'fft' (zero-padded FFT, uniform grids only)
+     outputs:
+         inner_prod: numpy array of shape ... x num_freq
+    '''
+    if (eval_mode == 'fft') and (uniform_grid_fft_size(digital_freq_grid) is not None):
+        inner_prod = grid_dtft(vectors, 0, digital_freq_grid, -sign)
+    else:
+        vandermonde_matrix = steering_matrix(vectors.shape[-1], digital_freq_grid, sign)
+        inner_prod = np.matmul(vectors, vandermonde_matrix.conj())
+
+    return inner_prod
+
+
+def steering_inner_product_2d(matrices, digital_freq_grids, sign=-1, eval_mode='direct'):
+    '''
+    Evaluates a(w1,w2)^H vec(X) on a 2D grid, where a(w1,w2) = a1(w1) kron a2(w2) is the separable steering vector of an
+    N1 x N2 array. Since a^H vec(X) = a1^H X conj(a2), it is applied one axis at a time (two 1D passes, i.e. a 2D FFT in 'fft' mode)
+     inputs:
+         matrices: X, numpy array of shape ... x N1 x N2
+         digital_freq_grids: (digital_freq_grid_1, digital_freq_grid_2), numpy arrays of lengths num_freq_1 and num_freq_2
+         sign, eval_mode: see steering_inner_product. 'fft' is applied to each axis whose grid is uniform
+     outputs:
+         inner_prod: numpy array of shape ... x num_freq_1 x num_freq_2
+    '''
+    digital_freq_grid_1, digital_freq_grid_2 = digital_freq_grids
+    inner_prod = steering_inner_product(matrices, digital_freq_grid_2, sign, eval_mode) # [..., N1, num_freq_2]
+    inner_prod = steering_inner_product(np.swapaxes(inner_prod,-1,-2), digital_freq_grid_1, sign, eval_mode) # [..., num_freq_2, num_freq_1]
+
+    return np.swapaxes(inner_prod,-1,-2)
+
+
+def steering_quadratic_form_2d(matrix, corr_mat_model_orders, digital_freq_grids, sign=-1, eval_mode='direct'):
+    '''
+    Evaluates a(w1,w2)^H Q a(w1,w2) on a 2D grid, where a = a1(w1) kron a2(w2) and Q acts on M1 x M2 subarrays vectorised
+    row by row (see corr_matrix_2d). Q is reduced to its two-level diagonal sums d[k1,k2] = sum over m1-n1=k1, m2-n2=k2, and
+    a^H Q a = sum_k d[k1,k2] exp(-sign*1j*(k1*w1+k2*w2)), a (2M1-1) x (2M2-1) 2D DTFT
+     inputs:
+         matrix: Q, numpy array of shape ... x M1M2 x M1M2
+         corr_mat_model_orders: (M1, M2)
+         digital_freq_grids: (digital_freq_grid_1, digital_freq_grid_2)
+         sign: sign of the exponent of the steering vectors
+         eval_mode: 'fft' : the 2D DTFT by zero-padded FFTs along every axis whose grid is uniform (see grid_dtft)
+                    'direct' : the 2D DTFT as products with the (2M-1) x num_freq lag phasors
+     outputs:
+         quad_form: numpy array of shape ... x num_freq_1 x num_freq_2
+    '''
+    corr_mat_model_order_1, corr_mat_model_order_2 = corr_mat_model_orders
+    batch_shape = matrix.shape[:-2]
+    blocks = matrix.reshape(batch_shape + (corr_mat_model_order_1,corr_mat_model_order_2,corr_mat_model_order_1,corr_mat_model_order_2)) # [..., m1, m2, n1, n2]
+    blocks = np.moveaxis(blocks, (-4,-2), (-2,-1)) # [..., m2, n2, m1, n1]
+    diag_sums = np.moveaxis(diagonal_sums(blocks), -1, -3) # sums over m1-n1, [..., 2M1-1, m2, n2]
+    diag_sums = diagonal_sums(diag_sums) # and over m2-n2, [..., 2M1-1, 2M2-1]
+    quad_form = diag_sums
+    for axis, num_rows, digital_freq_grid in ((-1,corr_mat_model_order_2,digital_freq_grids[1]), (-2,corr_mat_model_order_1,digital_freq_grids[0])):
+        quad_form = np.swapaxes(quad_form, axis, -1)
+        if (eval_mode == 'fft') and (uniform_grid_fft_size(digital_freq_grid) is not None):
+            quad_form = grid_dtft(quad_form, -(num_rows-1), digital_freq_grid, -sign)
+        else:
+            lag_phasor = np.exp(-sign*1j*np.outer(np.arange(-(num_rows-1),num_rows), digital_freq_grid)) # [2M-1, num_freq]
+            quad_form = np.matmul(quad_form, lag_phasor)
+        quad_form = np.swapaxes(quad_form, axis, -1)
+
+    return quad_form
+
+
+def solve_levinson_toeplitz(first_column, first_row, y_vec):
+    '''
+    Solves for Tx = y for a (batch of) general Toeplitz matrices and any number of right hand sides with the Levinson recursion
+     inputs:
+         first_column: numpy array of length N (or num_systems x N), first column t0,t1,..tN-1 of T
+         first_row: numpy array of length N (or num_systems x N), first row t0,t-1,..t-(N-1) of T
+         y_vec : numpy array of shape N or N x num_rhs (num_systems x N or num_systems x N x num_rhs for a batch of systems)
+     outputs:
+         solution x: numpy array of the same shape as y_vec
+
+        The forward/backward vectors do not depend on y, so they are computed once and every right hand side and every system
+        is updated together in each recursion step. All the work buffers are allocated once up front.
+        Refer wiki page: https://en.wikipedia.org/wiki/Levinson_recursion # for a simple and elegant understanding and implemenation of the algo
+    '''
+    first_column = np.asarray(first_column)
+    first_row = np.asarray(first_row)
+    y_vec = np.asarray(y_vec)
+    is_batch = first_column.ndim == 2
+    if not is_batch:
+        first_column = first_column[None,:]
+        first_row = first_row[None,:]
+        y_vec = y_vec[None,...]
+    is_vector_rhs = y_vec.ndim == 2
+    if is_vector_rhs:
+        y_vec = y_vec[:,:,None]
+    num_systems, num_iter = first_column.shape # N
+    dtype = np.result_type(first_column.dtype, first_row.dtype, y_vec.dtype, np.float64)
+    forward_vec = np.zeros((num_systems,num_iter), dtype=dtype)
+    backward_vec_buf = np.zeros((num_systems,num_iter+1), dtype=dtype) # backward vector lives at [:,1:n+1], so [:,0:n+1] is [0,backward_vec]
+    x_vec = np.zeros((num_systems,num_iter,y_vec.shape[2]), dtype=dtype)
+    inv_fact = 1/first_column[:,0] # 1/t0
+    forward_vec[:,0] = inv_fact
+    backward_vec_buf[:,1] = inv_fact
+    x_vec[:,0,:] = y_vec[:,0,:]*inv_fact[:,None] # x_vec = y[0]/t0
+    for iter_count in np.arange(2,num_iter+1):
+        prev_len = iter_count-1
+        forward_error = np.sum(first_column[:,prev_len:0:-1]*forward_vec[:,0:prev_len],axis=1) # inner product between the forward vector from previous iteration and a flipped version of the 0th column
+        backward_error = np.sum(first_row[:,1:iter_count]*backward_vec_buf[:,1:iter_count],axis=1) # inner product between the backward vector from previous iteration and the 0th row
+        error_fact = (1/(1-(backward_error*forward_error)))[:,None]
+        forward_vec_ext = forward_vec[:,0:iter_count] # [forward_vec,0]
+        backward_vec_ext = backward_vec_buf[:,0:iter_count] # [0,backward_vec]
+        new_forward_vec = error_fact*(forward_vec_ext - forward_error[:,None]*backward_vec_ext) # forward vector update
+        new_backward_vec = error_fact*(backward_vec_ext - backward_error[:,None]*forward_vec_ext) # backward vector update
+        forward_vec[:,0:iter_count] = new_forward_vec
+        backward_vec_buf[:,1:iter_count+1] = new_backward_vec
+        error_x_vec = np.matmul(first_column[:,None,prev_len:0:-1],x_vec[:,0:prev_len,:])[:,0,:] # error in the xvector for every rhs
+        x_vec[:,0:iter_count,:] += (y_vec[:,prev_len,:]-error_x_vec)[:,None,:]*new_backward_vec[:,:,None] # x_vec update
+
+    if is_vector_rhs:
+        x_vec = x_vec[:,:,0]
+    if not is_batch:
+        x_vec = x_vec[0,...]
+    return x_vec
+
+
 def solve_levinson_durbin(toeplitz_matrix, y_vec):
     '''
     Solves for Tx = y
@@ -38,27 +498,11 @@ def solve_levinson_durbin(toeplitz_matrix, y_vec):
          y_vec : numpy array of length N
      outputs:
          solution vector x: numpy array of length N
-     
-        Refer wiki page: https://en.wikipedia.org/wiki/Levinson_recursion # for a simple and elegant understanding and implemenation of the algo
-        Refer https://github.com/topisani/OTTO/pull/104/files/c5985545bb39de2a27689066150a5caac0c1fdf9 for the cpp implemenation of the algo
-    
+
+        Only the first column and row of T are read (see solve_levinson_toeplitz)
     '''
-    corr_mat = toeplitz_matrix.copy()
-    num_iter = corr_mat.shape[0] # N
-    inv_fact = 1/corr_mat[0,0] # 1/t0
-    backward_vec = inv_fact
-    forward_vec = inv_fact
-    x_vec = y_vec[0]*inv_fact # x_vec = y[0]/t0
-    for iter_count in np.arange(2,num_iter+1):
-        forward_error = np.dot(corr_mat[iter_count-1:0:-1,0],forward_vec) # inner product between the forward vector from previous iteration and a flipped version of the 0th column of the corr_mat 
-        backward_error = np.dot(corr_mat[0,1:iter_count],backward_vec) # inner product between the backward vector from previous iteration and the 0th row of the corr_mat 
-        error_fact = 1/(1-(backward_error*forward_error))
-        prev_iter_forward_vec = forward_vec.copy()
-        forward_vec = error_fact*np.append(forward_vec,0) - forward_error*error_fact*np.append(0,backward_vec) # forward vector update
-        backward_vec = error_fact*np.append(0,backward_vec) - backward_error*error_fact*np.append(prev_iter_forward_vec,0) # backward vector update
-        error_x_vec = np.dot(x_vec,corr_mat[iter_count-1,0:iter_count-1]) # error in the xvector
-        x_vec = np.append(x_vec,0) + (y_vec[iter_count-1]-error_x_vec)*backward_vec # x_vec update
-        
+    x_vec = solve_levinson_toeplitz(toeplitz_matrix[:,0], toeplitz_matrix[0,:], y_vec)
+
     return x_vec
 
 def solve_levinson_durbin_ymatrix(toeplitz_matrix, y_vector):
@@ -68,185 +512,883 @@ def solve_levinson_durbin_ymatrix(toeplitz_matrix, y_vector):
          toeplitz matrix (T): NxN
          y_vec : numpy array of shape N x M : M is the number of different y's
      outputs:
-         solution vector x: numpy array of length N
-     
-        Refer wiki page: https://en.wikipedia.org/wiki/Levinson_recursion # for a simple and elegant understanding and implemenation of the algo
-        Refer https://github.com/topisani/OTTO/pull/104/files/c5985545bb39de2a27689066150a5caac0c1fdf9 for the cpp implemenation of the algo
-    
+         solution matrix x: numpy array of shape N x M
+
+        All the M right hand sides are solved together in a single recursion (see solve_levinson_toeplitz)
     '''
-    corr_mat = toeplitz_matrix.copy()
-    y_vec = y_vector.copy()
-    num_iter = corr_mat.shape[0] # N
-    inv_fact = 1/corr_mat[0,0] # 1/t0
-    num_sols = y_vec.shape[1]
-    x_mat = np.zeros((0,num_iter)).astype('complex64')
-    for ele in np.arange(num_sols):
-        backward_vec = inv_fact
-        forward_vec = inv_fact
-        x_vec = y_vec[0,ele]*inv_fact # x_vec = y[0]/t0
-        for iter_count in np.arange(2,num_iter+1):
-            forward_error = np.dot(corr_mat[iter_count-1:0:-1,0],forward_vec) # inner product between the forward vector from previous iteration and a flipped version of the 0th column of the corr_mat 
-            backward_error = np.dot(corr_mat[0,1:iter_count],backward_vec) # inner product between the backward vector from previous iteration and the 0th row of the corr_mat 
-            error_fact = 1/(1-(backward_error*forward_error))
-            prev_iter_forward_vec = forward_vec.copy()
-            forward_vec = error_fact*np.append(forward_vec,0) - forward_error*error_fact*np.append(0,backward_vec) # forward vector update
-            backward_vec = error_fact*np.append(0,backward_vec) - backward_error*error_fact*np.append(prev_iter_forward_vec,0) # backward vector update
-            error_x_vec = np.dot(x_vec,corr_mat[iter_count-1,0:iter_count-1]) # error in the xvector
-            x_vec = np.append(x_vec,0) + (y_vec[iter_count-1,ele]-error_x_vec)*backward_vec # x_vec update
-        x_mat = np.vstack((x_mat,x_vec))
-    final_x_mat = x_mat.T
-    
+    final_x_mat = solve_levinson_toeplitz(toeplitz_matrix[:,0], toeplitz_matrix[0,:], y_vector)
+
     return final_x_mat
 
 
-def music_toeplitz(received_signal, num_sources, digital_freq_grid):
+def levinson_durbin_predictor(first_column):
+    '''
+    Levinson-Durbin recursion for the forward linear predictor of a (batch of) Hermitian Toeplitz matrices
+     inputs:
+         first_column: numpy array of shape num_cells x M, first column c0,c1,..cM-1 of each Hermitian Toeplitz matrix T
+     outputs:
+         predictor: numpy array of shape num_cells x M, a = [1,a1,..aM-1] which solves T a = [prediction_error,0,..0]
+         prediction_error: numpy array of length num_cells
+         reflection_coeffs: numpy array of shape num_cells x M-1
+    '''
+    first_column = np.asarray(first_column)
+    num_cells, num_rows = first_column.shape
+    predictor = np.zeros((num_cells,num_rows), dtype=np.result_type(first_column.dtype,np.complex64))
+    predictor[:,0] = 1
+    prediction_error = np.real(first_column[:,0])
+    reflection_coeffs = np.zeros((num_cells,num_rows-1), dtype=predictor.dtype)
+    column_rows = first_column[:,None,:] # [num_cells, 1, M] and [num_cells, M, 1] views, so that every order is one matmul
+    predictor_columns = predictor[:,:,None]
+    for order in range(num_rows-1): # few numpy calls per order, they dominate for a single cell
+        delta = np.matmul(column_rows[:,:,order+1:0:-1], predictor_columns[:,0:order+1])[:,0,0] # error of the order-p predictor on row p+1
+        reflection_coeff = -delta/prediction_error
+        predictor[:,0:order+2] += reflection_coeff[:,None]*predictor[:,order+1::-1].conj() # [a,0] + k*[0,J a*], the right side is a temporary
+        prediction_error = prediction_error*(1-np.abs(reflection_coeff)**2)
+        reflection_coeffs[:,order] = reflection_coeff
+
+    return predictor, prediction_error, reflection_coeffs
+
+
+def gohberg_semencul_solve(predictor, prediction_error, y_vec):
+    '''
+    Solves T x = y for a Hermitian Toeplitz T given its Levinson predictor, using the Gohberg-Semencul formula
+    T^-1 = (L(a)L(a)^H - L(b)L(b)^H)/prediction_error, L(v) being the lower triangular Toeplitz matrix with first column v and
+    b = [0, a*M-1,..a*1]. Each triangular Toeplitz product is a convolution, done here with FFTs.
+     inputs:
+         predictor, prediction_error: outputs of levinson_durbin_predictor
+         y_vec: numpy array of shape num_cells x M
+     outputs:
+         x_vec: numpy array of shape num_cells x M
+    '''
+    num_rows = predictor.shape[-1]
+    fft_size = int(2**np.ceil(np.log2(2*num_rows-1)))
+    generators = np.zeros((2,) + predictor.shape, dtype=predictor.dtype) # a and b stacked, one FFT call for both
+    generators[0] = predictor
+    generators[1,:,1::] = predictor[:,:0:-1].conj() # b
+    y_vec_flipped_fft = np.fft.fft(y_vec[:,::-1],fft_size,axis=1)
+    LH_y = np.fft.ifft(np.fft.fft(generators.conj(),fft_size,axis=-1)*y_vec_flipped_fft,axis=-1)[...,num_rows-1::-1] # L^H y = J (v* conv J y)
+    L_LH_y = np.fft.ifft(np.fft.fft(generators,fft_size,axis=-1)*np.fft.fft(LH_y,fft_size,axis=-1),axis=-1)[...,0:num_rows] # L z = v conv z
+    x_vec = (L_LH_y[0] - L_LH_y[1])/prediction_error[:,None]
+
+    return x_vec
+
+
+def gohberg_semencul_diagonal_sums(predictor, prediction_error):
+    '''
+    Diagonal sums of T^-1 (same layout as diagonal_sums) directly from the Levinson predictor in O(M log M), without forming T^-1.
+    For L(v)L(v)^H the kth diagonal sums to sum_j (M-k-j) v[j+k] v*[j], which is evaluated as two FFT correlations.
+    '''
+    num_rows = predictor.shape[-1]
+    fft_size = int(2**np.ceil(np.log2(2*num_rows-1)))
+    lags = np.arange(num_rows)
+    generators = np.zeros((2,) + predictor.shape, dtype=predictor.dtype) # a and b stacked, as in gohberg_semencul_solve
+    generators[0] = predictor
+    generators[1,:,1::] = predictor[:,:0:-1].conj()
+    generators_fft = np.fft.fft(np.stack((generators,lags*generators)),fft_size,axis=-1) # v and j v
+    xcorr, xcorr_weighted = np.fft.ifft(generators_fft[0]*generators_fft.conj(),axis=-1)[...,0:num_rows] # sum_j v[j+k] v*[j] and sum_j j v[j+k] v*[j]
+    diag_sums_both = (num_rows-lags)*xcorr - xcorr_weighted
+    diag_sums_pos_lags = (diag_sums_both[0] - diag_sums_both[1])/prediction_error[:,None] # lags k = 0,1,..M-1
+    diag_sums = np.hstack((diag_sums_pos_lags[:,:0:-1].conj(),diag_sums_pos_lags)) # T^-1 is Hermitian: d[-k] = d[k]*
+
+    return diag_sums
+
+
+def ar_spectrum(predictor, prediction_error, digital_freq_grid, eval_mode='fft'):
+    '''
+    Spectrum prediction_error/|A(w)|^2 of an AR model, A(w) = sum_k a_k exp(-1j*w*k) being the prediction error filter
+     inputs:
+         predictor, prediction_error: AR model [1,a1,..ap] and innovation power, as returned by levinson_durbin_predictor
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode: 'fft' : A(w) as one zero-padded FFT of the predictor, O(num_freq log num_freq). Needs a uniform grid,
+                            falls back to 'direct' for any other grid
+                    'direct' : matrix product with the steering matrix, O(p num_freq)
+     outputs:
+         psd: numpy array of shape num_cells x num_freq
+    '''
+    predictor_response = steering_inner_product(predictor, digital_freq_grid, 1, eval_mode) # sum_k a_k exp(-1j*w*k)
+    psd = prediction_error[:,None]/np.abs(predictor_response)**2
+    return psd
+
+
+def signal_subspace(auto_corr_matrix, num_sources, method='eigh', num_power_iter=3, oversampling=5):
+    '''
+    Dominant eigenvectors of Hermitian covariance matrices
+     inputs:
+         auto_corr_matrix: numpy array of shape [..., M, M]
+         num_sources: number of eigenvectors to return
+         method: 'svd' : full SVD (legacy)
+                 'eigh' : full Hermitian eigendecomposition
+                 'subset' : scipy.linalg.eigh restricted to the top num_sources indices (matrix by matrix)
+                 'randomized' : block subspace iteration on num_sources+oversampling vectors followed by a Rayleigh-Ritz
+                                step. Cheapest when num_sources << M
+         num_power_iter, oversampling: used only by 'randomized'
+     outputs:
+         us: numpy array of shape [..., M, num_sources], ordered by decreasing eigenvalue
+         eig_vals: numpy array of shape [..., num_sources]
+    '''
+    num_rows = auto_corr_matrix.shape[-1]
+    if method == 'svd':
+        u, s, vh = np.linalg.svd(auto_corr_matrix)
+        us, eig_vals = u[...,0:num_sources], s[...,0:num_sources]
+    elif method == 'eigh':
+        eig_vals, eig_vecs = np.linalg.eigh(auto_corr_matrix) # ascending eigenvalues
+        us, eig_vals = eig_vecs[...,::-1][...,0:num_sources], eig_vals[...,::-1][...,0:num_sources]
+    elif method == 'subset':
+        us, eig_vals = _eigh_subset(auto_corr_matrix, num_rows-num_sources, num_rows-1)
+        us, eig_vals = us[...,::-1], eig_vals[...,::-1]
+    elif method == 'randomized':
+        block_size = min(num_sources+oversampling, num_rows)
+        test_matrix = np.random.default_rng(0).standard_normal((num_rows,block_size)) # fixed seed so that repeated calls return the same subspace
+        basis, _ = np.linalg.qr(np.matmul(auto_corr_matrix, test_matrix.astype(auto_corr_matrix.dtype)))
+        for ele in range(num_power_iter):
+            basis, _ = np.linalg.qr(np.matmul(auto_corr_matrix, basis))
+        basis_h = np.swapaxes(basis.conj(),-1,-2)
+        eig_vals, eig_vecs = np.linalg.eigh(np.matmul(basis_h, np.matmul(auto_corr_matrix, basis))) # Rayleigh-Ritz on the block_size x block_size projection
+        us = np.matmul(basis, eig_vecs[...,::-1][...,0:num_sources])
+        eig_vals = eig_vals[...,::-1][...,0:num_sources]
+    else:
+        raise ValueError('Unknown subspace method {}'.format(method))
+
+    return us, eig_vals
+
+
+def noise_subspace(auto_corr_matrix, num_sources, method='eigh'):
+    '''
+    Eigenvectors of Hermitian covariance matrices orthogonal to the num_sources dominant ones
+     inputs:
+         auto_corr_matrix: numpy array of shape [..., M, M]
+         num_sources: dimension of the signal subspace
+         method: 'svd', 'eigh' or 'subset' (see signal_subspace)
+     outputs:
+         un: numpy array of shape [..., M, M-num_sources]
+    '''
+    num_rows = auto_corr_matrix.shape[-1]
+    if method == 'svd':
+        u, s, vh = np.linalg.svd(auto_corr_matrix)
+        un = u[...,num_sources::]
+    elif method == 'eigh':
+        eig_vals, eig_vecs = np.linalg.eigh(auto_corr_matrix)
+        un = eig_vecs[...,0:num_rows-num_sources]
+    elif method == 'subset':
+        un, eig_vals = _eigh_subset(auto_corr_matrix, 0, num_rows-num_sources-1)
+    else:
+        raise ValueError('Subspace method {} cannot return the noise subspace, use the signal subspace instead'.format(method))
+
+    return un
+
+
+def estimate_model_order(eig_vals, num_snapshots, criterion='mdl', snr_threshold_db=10):
+    '''
+    Number of sources from the eigenvalues of the auto-correlation matrix
+     inputs:
+         eig_vals: numpy array of shape [..., M], in any order
+         num_snapshots: number of snapshots averaged into the auto-correlation matrix
+         criterion: 'mdl' : minimum description length (Wax-Kailath)
+                    'aic' : Akaike information criterion
+                    'snr' : number of eigenvalues more than snr_threshold_db above the noise floor, taken as the median eigenvalue
+         snr_threshold_db: threshold of the 'snr' rule
+     outputs:
+         num_sources: integer numpy array of shape [...], between 0 and M-1
+    '''
+    num_rows = eig_vals.shape[-1]
+    eig_vals = np.sort(np.maximum(np.real(eig_vals),np.finfo(np.float64).tiny),axis=-1)[...,::-1] # descending and positive
+    if criterion == 'snr':
+        noise_floor = np.median(eig_vals,axis=-1)
+        num_sources = np.sum(eig_vals > noise_floor[...,None]*10**(snr_threshold_db/10),axis=-1)
+        return np.minimum(num_sources, num_rows-1)
+    if criterion not in ('mdl','aic'):
+        raise ValueError('criterion must be one of mdl, aic or snr')
+    candidate_order = np.arange(num_rows) # k = 0,1..M-1 sources
+    tail_length = num_rows - candidate_order # the M-k smallest eigenvalues are the noise eigenvalues
+    tail_sum = np.cumsum(eig_vals[...,::-1],axis=-1)[...,::-1]
+    tail_log_sum = np.cumsum(np.log(eig_vals[...,::-1]),axis=-1)[...,::-1]
+    neg_log_likelihood = num_snapshots*tail_length*(np.log(tail_sum/tail_length) - tail_log_sum/tail_length) # N(M-k) log(arithmetic mean/geometric mean)
+    num_free_params = candidate_order*(2*num_rows-candidate_order)
+    if criterion == 'mdl':
+        score = neg_log_likelihood + 0.5*num_free_params*np.log(num_snapshots)
+    else:
+        score = 2*neg_log_likelihood + 2*num_free_params
+    num_sources = np.argmin(score,axis=-1)
+
+    return num_sources
+
+
+def auto_order_eigh(auto_corr_matrix, num_sources, num_snapshots):
+    '''
+    Full eigendecomposition plus model order, for estimators called with num_sources = 'auto' (MDL), 'mdl', 'aic' or 'snr'
+     inputs:
+         auto_corr_matrix: numpy array of shape num_cells x M x M
+         num_sources: name of the model order rule, see estimate_model_order
+         num_snapshots: number of snapshots averaged into the auto-correlation matrix
+     outputs:
+         eig_vecs: numpy array of shape num_cells x M x M, ordered by decreasing eigenvalue
+         num_sources: integer numpy array of length num_cells
+    '''
+    if num_snapshots is None:
+        raise ValueError('Model order selection needs the number of snapshots')
+    criterion = 'mdl' if num_sources == 'auto' else num_sources
+    eig_vals, eig_vecs = np.linalg.eigh(auto_corr_matrix)
+    num_sources = estimate_model_order(eig_vals, num_snapshots, criterion)
+
+    return eig_vecs[...,::-1], num_sources
+
+
+def signal_model_order(received_signal, corr_mat_model_order, criterion='mdl'):
+    '''
+    Number of sources in every cell, from the eigenvalues of the forward auto-correlation matrix
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L (see corr_matrix)
+         corr_mat_model_order : must be strictly less than half the signal length
+         criterion: 'auto' (same as 'mdl'), 'mdl', 'aic' or 'snr', see estimate_model_order
+     outputs:
+         num_sources: integer numpy array of length num_cells
+    '''
+    num_snapshots = corr_num_snapshots(received_signal, corr_mat_model_order)
+    auto_corr_matrix = corr_matrix(received_signal, corr_mat_model_order, 'forward')
+    eig_vals = np.linalg.eigvalsh(auto_corr_matrix)
+    num_sources = estimate_model_order(eig_vals, num_snapshots, 'mdl' if criterion == 'auto' else criterion)
+
+    return num_sources
+
+
+def _eigh_subset(auto_corr_matrix, first_index, last_index):
+    import scipy.linalg # only this path needs scipy
+    num_rows = auto_corr_matrix.shape[-1]
+    batch_shape = auto_corr_matrix.shape[:-2]
+    flat_matrix = auto_corr_matrix.reshape(-1,num_rows,num_rows)
+    num_vecs = last_index - first_index + 1
+    eig_vals = np.zeros((flat_matrix.shape[0],num_vecs), dtype=flat_matrix.real.dtype)
+    eig_vecs = np.zeros((flat_matrix.shape[0],num_rows,num_vecs), dtype=flat_matrix.dtype)
+    for ele in range(flat_matrix.shape[0]):
+        eig_vals[ele], eig_vecs[ele] = scipy.linalg.eigh(flat_matrix[ele], subset_by_index=[first_index,last_index])
+
+    return eig_vecs.reshape(batch_shape+(num_rows,num_vecs)), eig_vals.reshape(batch_shape+(num_vecs,))
+
+
+def subspace_steering_energy(basis, digital_freq_grid, eval_mode='direct', vandermonde_matrix=None):
+    '''
+    Energy of the steering vectors (sign -1) captured by orthonormal bases, a^H U U^H a
+     inputs:
+         basis: numpy array of shape num_cells x M x dim, orthonormal columns
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode : 'direct' or 'fft' (see steering_quadratic_form)
+         vandermonde_matrix: precomputed M x num_freq steering matrix for 'direct' (e.g. from a SpectralPlan). None uses steering_matrix
+     outputs:
+         energy: numpy array of shape num_cells x num_freq
+    '''
+    if vandermonde_matrix is None:
+        vandermonde_matrix = steering_matrix(basis.shape[1], digital_freq_grid, -1)
+    if eval_mode == 'fft':
+        energy = steering_quadratic_form(np.matmul(basis,basis.conj().transpose(0,2,1)), digital_freq_grid, -1, eval_mode) # from the diagonal sums of UU*
+    else:
+        UhA = np.matmul(basis.conj().transpose(0,2,1), vandermonde_matrix) # projects the vandermond matrix on the subspace
+        energy = np.sum(np.abs(UhA)**2,axis=1)
+
+    return energy
+
+
+def music_null_spectrum(auto_corr_matrix, num_sources, digital_freq_grid, subspace='noise', subspace_method='eigh', eval_mode='direct', num_snapshots=None,
+                        vandermonde_matrix=None, unitary=False):
+    '''
+    Denominator of the MUSIC pseudo spectrum, a^H Un Un^H a, for a stack of covariance matrices
+     inputs:
+         auto_corr_matrix: numpy array of shape num_cells x M x M
+         num_sources: number of sources, or 'auto'/'mdl'/'aic'/'snr' to estimate it for every cell from the eigenvalues of the
+                      same decomposition (see estimate_model_order). subspace and subspace_method are then not used
+         digital_freq_grid: numpy array of length num_freq
+         subspace: 'noise' : project the steering vectors on the M-num_sources noise eigenvectors
+                   'signal' : use M - ||Us^H a||^2, which needs only the num_sources dominant eigenvectors
+         subspace_method: see signal_subspace / noise_subspace
+         eval_mode : 'direct' or 'fft' (see steering_quadratic_form)
+         num_snapshots: number of snapshots averaged into auto_corr_matrix, needed only for the model order selection
+         vandermonde_matrix: see subspace_steering_energy
+         unitary: unitary MUSIC. The decomposition runs in real arithmetic on unitary_real_covariance(auto_corr_matrix), which
+                  also applies forward-backward averaging, and the real eigenvectors are rotated back by Q
+                  (see unitary_transform_matrix). Same spectrum as forward-backward MUSIC
+     outputs:
+         AhGGhA: numpy array of shape num_cells x num_freq
+    '''
+    num_rows = auto_corr_matrix.shape[-1]
+    unitary_matrix = None
+    if unitary:
+        unitary_matrix = unitary_transform_matrix(num_rows).astype(np.result_type(auto_corr_matrix.dtype,np.complex64), copy=False)
+        auto_corr_matrix = unitary_real_covariance(auto_corr_matrix) # real symmetric, a quarter of the complex decomposition cost
+    def complex_basis(basis): # eigenvectors of Q^H Rfb Q -> eigenvectors of Rfb
+        if unitary_matrix is None:
+            return basis
+        return np.matmul(unitary_matrix, basis)
+    if isinstance(num_sources, str):
+        eig_vecs, num_sources = auto_order_eigh(auto_corr_matrix, num_sources, num_snapshots)
+        noise_mask = np.arange(num_rows)[None,:] >= num_sources[:,None] # the noise subspace size differs from cell to cell
+        AhGGhA = subspace_steering_energy(complex_basis(eig_vecs*noise_mask[:,None,:]), digital_freq_grid, eval_mode, vandermonde_matrix) # zeroed columns add nothing to the energy
+    elif subspace == 'signal':
+        us, signal_eig_vals = signal_subspace(auto_corr_matrix, num_sources, subspace_method)
+        AhGGhA = num_rows - subspace_steering_energy(complex_basis(us), digital_freq_grid, eval_mode, vandermonde_matrix) # ||a||^2 = M for the unit modulus steering vectors
+    else:
+        un = noise_subspace(auto_corr_matrix, num_sources, subspace_method)
+        AhGGhA = subspace_steering_energy(complex_basis(un), digital_freq_grid, eval_mode, vandermonde_matrix) # A*GG*A
+
+    return AhGGhA
+
+
+def steering_polynomial_roots(matrix, num_roots):
+    '''
+    Gridless minimisers of a(w)^H Q a(w), a(w) = exp(-1j*w*arange(M)), as used by root-MUSIC and root-Capon.
+    With z = exp(1j*w), a^H Q a = sum_k d_k z^k where d_k are the diagonal sums of Q, so the minima sit at the roots of
+    z^(M-1) * sum_k d_k z^k closest to the unit circle. The 2M-2 roots come in (z, 1/z*) pairs, so only the ones inside the
+    circle are kept. The roots are the eigenvalues of the companion matrices, computed for all the cells at once.
+     inputs:
+         matrix: Q, numpy array of shape num_cells x M x M (Hermitian)
+         num_roots: number of frequencies to return
+     outputs:
+         est_freq: numpy array of shape num_cells x num_roots, ordered by the distance of the root to the unit circle
+    '''
+    diag_sums = diagonal_sums(matrix) # coefficients of z^-(M-1),..z^(M-1)
+    poly_coeffs = diag_sums[...,::-1] # highest power first
+    poly_degree = poly_coeffs.shape[-1] - 1
+    companion_matrix = np.zeros(poly_coeffs.shape[:-1] + (poly_degree,poly_degree), dtype=np.result_type(poly_coeffs.dtype,np.complex64))
+    companion_matrix[...,0,:] = -poly_coeffs[...,1::]/poly_coeffs[...,0:1]
+    companion_matrix[...,np.arange(1,poly_degree),np.arange(poly_degree-1)] = 1
+    roots = np.linalg.eigvals(companion_matrix)
+    dist_from_circle = 1 - np.abs(roots)
+    dist_from_circle[dist_from_circle < 0] = np.inf # outside the circle: mirror image of a root inside
+    closest_roots = np.take_along_axis(roots, np.argsort(dist_from_circle,axis=-1)[...,0:num_roots], axis=-1)
+    est_freq = np.angle(closest_roots)
+
+    return est_freq
+
+
+def music_toeplitz(received_signal, num_sources, digital_freq_grid, subspace='noise', subspace_method='eigh'):
+    '''num_sources, subspace, subspace_method : see music_null_spectrum ('auto' estimates the number of sources)'''
+    if isinstance(num_sources, str): # the noise eigenvalues of the N x N Toeplitz matrix are too spread for MDL/AIC, use a forward covariance instead
+        num_sources = signal_model_order(received_signal[None,:,:], len(received_signal)//3, num_sources)[0]
+    auto_corr_vec = np.mean(sts_correlate(received_signal.T),axis=0,keepdims=True) # Generate the auto-correlation vector of the same length as the signal, averaged over the snapshot columns
+    auto_corr_matrix = vtoeplitz(auto_corr_vec, read_only=True) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
+    AhGGhA = music_null_spectrum(auto_corr_matrix, num_sources, digital_freq_grid, subspace, subspace_method)[0,:] # Project the vandermond matrix (which spans the signal subspace) on the noise subspace
+    pseudo_spectrum = 1/np.abs(AhGGhA) # Pseudo spectrum
+    return pseudo_spectrum
+
+
+def music_forward(received_signal, num_sources, corr_mat_model_order, digital_freq_grid, eval_mode='direct', subspace='noise', subspace_method='eigh', forward_backward=False, unitary=False):
+    '''eval_mode : 'direct' or 'fft' (see steering_quadratic_form)
+       num_sources, subspace, subspace_method, unitary : see music_null_spectrum ('auto' estimates the number of sources)
+       corr_mat_model_order : must be strictly less than half then signal length
+       received_signal : num_samples x L, L snapshot columns (see corr_matrix). forward_backward : see forward_backward_average'''
     signal_length = len(received_signal)
-    auto_corr_vec = sts_correlate(received_signal.T) # Generate the auto-correlation vector of the same length as the signal
-    auto_corr_matrix = vtoeplitz(auto_corr_vec) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
-    auto_corr_matrix = auto_corr_matrix[0,:,:]
-    u, s, vh = np.linalg.svd(auto_corr_matrix) # Perform SVD of the Auto-correlation matrix
-    noise_subspace = u[:,num_sources::] # The first # number of sources eigen vectors belong to the signal subspace and the remaining eigen vectors of U belong to the noise subspace which is orthogonal to the signal subspace. Hence pick these eigen vectors
-    vandermonde_matrix = np.exp(-1j*np.outer(np.arange(signal_length),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies
-    GhA = np.matmul(noise_subspace.T.conj(),vandermonde_matrix) #G*A essentially projects the vandermond matrix (which spans the signal subspace) on the noise subspace
-    AhG = GhA.conj() # A*G
-    AhGGhA = np.sum(AhG*GhA,axis=0) # A*GG*A
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order, 'forward') # Generate the auto-correlation matrix using the expectation method. here we use the forward filtering i.e. y[0:m], y[1:m+1]...
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/signal_length # Divide the auto-correlation matrix by the signal length
+    AhGGhA = music_null_spectrum(auto_corr_matrix, num_sources, digital_freq_grid, subspace, subspace_method, eval_mode, corr_num_snapshots(received_signal[None,:,:], corr_mat_model_order),
+                                 None, unitary)[0,:] # A*GG*A
     pseudo_spectrum = 1/np.abs(AhGGhA) # Pseudo spectrum
     return pseudo_spectrum
 
+def music_backward(received_signal, num_sources, corr_mat_model_order, digital_freq_grid, eval_mode='direct', subspace='noise', subspace_method='eigh', forward_backward=False, unitary=False):
+    '''eval_mode : 'direct' or 'fft' (see steering_quadratic_form)
+       num_sources, subspace, subspace_method, unitary : see music_null_spectrum ('auto' estimates the number of sources)
+       corr_mat_model_order : must be strictly less than half the signal length
+       received_signal : num_samples x L, L snapshot columns (see corr_matrix). forward_backward : see forward_backward_average'''
+    signal_length = len(received_signal)
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order, 'backward') # snapshots y[m-1], y[m-2],..y[0] and so on
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/signal_length # Divide the auto-correlation matrix by the signal length
+    AhGGhA = music_null_spectrum(auto_corr_matrix, num_sources, digital_freq_grid, subspace, subspace_method, eval_mode, corr_num_snapshots(received_signal[None,:,:], corr_mat_model_order),
+                                 None, unitary)[0,:] # A*GG*A
+    pseudo_spectrum = 1/np.abs(AhGGhA) # Pseudo spectrum
+    return pseudo_spectrum
+
+def root_music_forward(received_signal, num_sources, corr_mat_model_order, subspace='noise', subspace_method='eigh'):
+    '''
+    Gridless MUSIC: the frequencies at which music_forward peaks, from the roots of the noise subspace polynomial (see steering_polynomial_roots)
+     inputs:
+         received_signal: numpy array of shape num_samples x 1, or num_samples x L for L snapshot columns (see corr_matrix)
+         num_sources: number of sources
+         corr_mat_model_order : must be strictly less than half the signal length
+         subspace, subspace_method: see music_null_spectrum
+     outputs:
+         est_freq: numpy array of length num_sources
+    '''
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order, 'forward')/len(received_signal)
+    est_freq = steering_polynomial_roots(music_noise_projector(auto_corr_matrix, num_sources, subspace, subspace_method), num_sources)[0,:]
+    return est_freq
+
+
+def root_music_backward(received_signal, num_sources, corr_mat_model_order, subspace='noise', subspace_method='eigh'):
+    '''Gridless version of music_backward, see root_music_forward'''
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order, 'backward')/len(received_signal)
+    est_freq = steering_polynomial_roots(music_noise_projector(auto_corr_matrix, num_sources, subspace, subspace_method), num_sources)[0,:]
+    return est_freq
+
+
+def music_noise_projector(auto_corr_matrix, num_sources, subspace='noise', subspace_method='eigh'):
+    '''Un Un^H, or I - Us Us^H when subspace is 'signal', for a stack of covariance matrices (num_cells x M x M)'''
+    if subspace == 'signal':
+        us, signal_eig_vals = signal_subspace(auto_corr_matrix, num_sources, subspace_method)
+        projector = np.eye(auto_corr_matrix.shape[-1],dtype=us.dtype) - np.matmul(us,us.conj().transpose(0,2,1))
+    else:
+        un = noise_subspace(auto_corr_matrix, num_sources, subspace_method)
+        projector = np.matmul(un,un.conj().transpose(0,2,1))
+    return projector
+
+
+def shift_invariance_solve(us1, us2, solver='qr'):
+    '''
+    Solves the shift invariance equation us1 phi = us2 for a stack of subspace blocks
+     inputs:
+         us1, us2: numpy arrays of shape [..., M-1, num_sources]
+         solver: 'qr' : least squares through the reduced QR factorisation of us1, phi = R^-1 Q^H us2
+                 'tls' : total least squares. phi = -V12 V22^-1 from the eigenvectors V of [us1 us2]^H [us1 us2] (2*num_sources square),
+                         ordered by decreasing eigenvalue
+                 'pinv' : phi = pinv(us1) us2, one SVD of us1 (legacy)
+     outputs:
+         phi: numpy array of shape [..., num_sources, num_sources]
+    '''
+    num_sources = us1.shape[-1]
+    if solver == 'qr':
+        q_mat, r_mat = np.linalg.qr(us1) # [..., M-1, num_sources] and [..., num_sources, num_sources]
+        phi = np.linalg.solve(r_mat, np.matmul(np.swapaxes(q_mat.conj(),-1,-2), us2))
+    elif solver == 'tls':
+        us12 = np.concatenate((us1,us2),axis=-1)
+        eig_vals, eig_vecs = np.linalg.eigh(np.matmul(np.swapaxes(us12.conj(),-1,-2), us12)) # ascending, so the noise half comes first
+        v12 = eig_vecs[...,0:num_sources,0:num_sources]
+        v22 = eig_vecs[...,num_sources::,0:num_sources]
+        phi = -np.matmul(v12, np.linalg.inv(v22))
+    elif solver == 'pinv':
+        phi = np.matmul(np.linalg.pinv(us1), us2) # phi = pinv(us1)*us2
+    else:
+        raise ValueError('solver must be one of qr, tls or pinv')
+
+    return phi
+
+
+def esprit_shift_invariance(us, solver='qr', return_eigvecs=False):
+    '''
+    ESPRIT frequency estimates from a basis of the signal subspace
+     inputs:
+         us: numpy array of shape [..., M, num_sources]. Any basis of the signal subspace works, it need not be orthonormal
+         solver: 'qr', 'tls' or 'pinv', see shift_invariance_solve
+         return_eigvecs: also return the eigenvectors T of phi. us T is then an estimate of the steering vectors of the sources
+                         (each column up to a scale), which gives their amplitudes by least squares
+     outputs:
+         est_freq: numpy array of shape [..., num_sources]
+         eig_vecs: numpy array of shape [..., num_sources, num_sources], only when return_eigvecs
+    '''
+    us1 = us[...,0:-1,:] # First M-1 rows of us
+    us2 = us[...,1::,:] # Last M-1 rows of us
+    phi = shift_invariance_solve(us1, us2, solver) # phi is similar to D and has same eigen vaues as D. D is a diagonal matrix with elements whose phase is the frequencies
+    if return_eigvecs:
+        eig_vals, eig_vecs = np.linalg.eig(phi)
+        return np.angle(eig_vals), eig_vecs
+    eig_vals = np.linalg.eigvals(phi) # compute eigen values of the phi matrix which are same as the eigen values of the D matrix since phi and D are similar matrices and hence share same eigen values
+    est_freq = np.angle(eig_vals) # Angle/phase of the eigen values gives the frequencies
+
+    return est_freq
+
+
+def unitary_transform_matrix(num_rows):
+    '''
+    Sparse unitary matrix Q that maps centro-Hermitian matrices (R = J R* J) to real ones, Q^H R Q real
+     inputs:
+         num_rows: M
+     outputs:
+         unitary_matrix: complex numpy array of shape M x M. Column k < M//2 is (e_k + e_(M-1-k))/sqrt(2), column M-M//2+k is
+                         1j*(e_k - e_(M-1-k))/sqrt(2) and, for odd M, the middle column is e_(M//2)
+    '''
+    half_rows = num_rows//2
+    index = np.arange(half_rows)
+    unitary_matrix = np.zeros((num_rows,num_rows), dtype=np.complex128)
+    unitary_matrix[index,index] = 1/np.sqrt(2)
+    unitary_matrix[num_rows-1-index,index] = 1/np.sqrt(2)
+    unitary_matrix[index,num_rows-half_rows+index] = 1j/np.sqrt(2)
+    unitary_matrix[num_rows-1-index,num_rows-half_rows+index] = -1j/np.sqrt(2)
+    if num_rows % 2:
+        unitary_matrix[half_rows,half_rows] = 1
+
+    return unitary_matrix
+
+
+def unitary_real_covariance(auto_corr_matrix):
+    '''
+    Real symmetric Re(Q^H R Q) = Q^H Rfb Q for a stack of auto-correlation matrices [..., M, M], Rfb being the forward-backward
+    average of R (see forward_backward_average). Its eigenvectors are those of Rfb rotated by Q^H, at the cost of a real decomposition
+    '''
+    unitary_matrix = unitary_transform_matrix(auto_corr_matrix.shape[-1]).astype(np.result_type(auto_corr_matrix.dtype,np.complex64), copy=False)
+    real_corr_matrix = np.real(np.matmul(unitary_matrix.conj().T, np.matmul(auto_corr_matrix, unitary_matrix)))
+
+    return real_corr_matrix
+
+
+def unitary_shift_invariance(us, solver='qr', return_eigvecs=False):
+    '''
+    Unitary ESPRIT: frequency estimates from a real basis of the signal subspace of unitary_real_covariance.
+    With the real K1 = Q_(M-1)^H (J1 + J2) Q_M and K2 = Q_(M-1)^H 1j*(J1 - J2) Q_M, J1/J2 selecting the first/last M-1 rows,
+    K1 us Y = K2 us is solved in real least squares and the frequencies are 2*arctan of the eigenvalues of Y
+     inputs:
+         us: real numpy array of shape [..., M, num_sources]
+         solver: see shift_invariance_solve
+         return_eigvecs: also return the eigenvectors T of Y. Q us T is then an estimate of the steering vectors of the sources
+                         (each column up to a scale), Q being unitary_transform_matrix(M)
+     outputs:
+         est_freq: numpy array of shape [..., num_sources]
+         eig_vecs: numpy array of shape [..., num_sources, num_sources], only when return_eigvecs
+    '''
+    num_rows = us.shape[-2]
+    selection_sum = unitary_transform_matrix(num_rows-1).conj().T @ (np.eye(num_rows)[0:-1,:] + np.eye(num_rows)[1::,:]) @ unitary_transform_matrix(num_rows)
+    selection_diff = unitary_transform_matrix(num_rows-1).conj().T @ (np.eye(num_rows)[0:-1,:] - np.eye(num_rows)[1::,:]) @ unitary_transform_matrix(num_rows)
+    K1 = np.real(selection_sum).astype(us.dtype) # both are real by construction
+    K2 = np.real(1j*selection_diff).astype(us.dtype)
+    phi = shift_invariance_solve(np.matmul(K1,us), np.matmul(K2,us), solver) # real least squares
+    if return_eigvecs:
+        eig_vals, eig_vecs = np.linalg.eig(phi)
+        return 2*np.arctan(np.real(eig_vals)), eig_vecs
+    eig_vals = np.real(np.linalg.eigvals(phi)) # real up to the noise, tan(w/2)
+    est_freq = 2*np.arctan(eig_vals)
+
+    return est_freq
+
+
+def esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method='eigh', num_snapshots=None, unitary=False, solver='qr', return_eigvecs=False):
+    '''
+    ESPRIT frequency estimates for a stack of auto-correlation matrices
+     inputs:
+         auto_corr_matrix: numpy array of shape num_cells x M x M
+         num_sources: number of sources, or 'auto'/'mdl'/'aic'/'snr' to estimate it for every cell from the eigenvalues of the
+                      same decomposition (see estimate_model_order)
+         subspace_method: see signal_subspace
+         num_snapshots: number of snapshots averaged into auto_corr_matrix, needed only for the model order selection
+         unitary: unitary ESPRIT. The decomposition and the shift invariance solve run in real arithmetic on
+                  unitary_real_covariance(auto_corr_matrix), which also applies forward-backward averaging
+         solver: shift invariance solver, 'qr', 'tls' or 'pinv' (see shift_invariance_solve)
+         return_eigvecs: also return the estimated steering vectors of the sources, i.e. the eigenvectors of the shift
+                         invariance solution mapped back through the signal subspace (see esprit_shift_invariance). Fitting the
+                         signal to them (or to the steering vectors at est_freq) by least squares gives the source amplitudes
+     outputs:
+         est_freq: numpy array of shape num_cells x num_sources. With an estimated model order the rows are padded with NaN
+                   up to the largest order found
+         source_vectors: complex numpy array of shape num_cells x M x num_sources, column k proportional to the steering vector
+                         exp(1j*est_freq[k]*m) of source k (unit norm, arbitrary phase). Only when return_eigvecs, NaN padded
+                         like est_freq
+    '''
+    num_rows = auto_corr_matrix.shape[-1]
+    shift_invariance = esprit_shift_invariance
+    if unitary:
+        auto_corr_matrix = unitary_real_covariance(auto_corr_matrix) # real symmetric, a quarter of the complex decomposition cost
+        shift_invariance = unitary_shift_invariance
+    def source_vectors_of(us, eig_vecs): # us T (Q us T for unitary ESPRIT), normalised per column
+        source_vectors = np.matmul(us, eig_vecs)
+        if unitary:
+            source_vectors = np.matmul(unitary_transform_matrix(num_rows), source_vectors)
+        return source_vectors/np.linalg.norm(source_vectors,axis=-2,keepdims=True)
+    if not isinstance(num_sources, str):
+        us, signal_eig_vals = signal_subspace(auto_corr_matrix, num_sources, subspace_method) # signal subspace of every cell
+        if return_eigvecs:
+            est_freq, eig_vecs = shift_invariance(us, solver, True)
+            return est_freq, source_vectors_of(us, eig_vecs)
+        return shift_invariance(us, solver) # rotational invariance between the first and last M-1 rows of us
+    eig_vecs, num_sources = auto_order_eigh(auto_corr_matrix, num_sources, num_snapshots)
+    est_freq = np.full((auto_corr_matrix.shape[0],np.amax(num_sources)), np.nan)
+    source_vectors = np.full((auto_corr_matrix.shape[0],num_rows,np.amax(num_sources)), np.nan, dtype=np.complex128)
+    for order in np.unique(num_sources[num_sources > 0]): # one stacked call per distinct order
+        cells = np.where(num_sources == order)[0]
+        if return_eigvecs:
+            est_freq[cells,0:order], shift_eig_vecs = shift_invariance(eig_vecs[cells,:,0:order], solver, True)
+            source_vectors[cells,:,0:order] = source_vectors_of(eig_vecs[cells,:,0:order], shift_eig_vecs)
+        else:
+            est_freq[cells,0:order] = shift_invariance(eig_vecs[cells,:,0:order], solver)
+
+    if return_eigvecs:
+        return est_freq, source_vectors
+    return est_freq
+
+
+def esprit_toeplitz(received_signal, num_sources, subspace_method='eigh', unitary=False, solver='qr', return_eigvecs=False):
+    '''num_sources, subspace_method, unitary, solver, return_eigvecs : see esprit_from_covariance ('auto' estimates the number of sources)'''
+    if isinstance(num_sources, str): # the noise eigenvalues of the N x N Toeplitz matrix are too spread for MDL/AIC, use a forward covariance instead
+        num_sources = signal_model_order(received_signal[None,:,:], len(received_signal)//3, num_sources)[0]
+    auto_corr_vec = np.mean(sts_correlate(received_signal.T),axis=0,keepdims=True) # Generate the auto-correlation vector of the same length as the signal, averaged over the snapshot columns
+    auto_corr_matrix = vtoeplitz(auto_corr_vec, read_only=True) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
+    if return_eigvecs:
+        est_freq, source_vectors = esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method, None, unitary, solver, True)
+        return est_freq[0,:], source_vectors[0,:,:]
+    est_freq = esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method, None, unitary, solver)[0,:]
+    return est_freq
+    
+def esprit_forward(received_signal, num_sources, corr_mat_model_order, subspace_method='eigh', forward_backward=False, unitary=False, solver='qr', return_eigvecs=False):
+    '''num_sources, subspace_method, unitary, solver, return_eigvecs : see esprit_from_covariance ('auto' estimates the number of sources)
+       corr_mat_model_order : must be strictly less than half then signal length
+       received_signal : num_samples x L, L snapshot columns (see corr_matrix). forward_backward : see forward_backward_average'''
+    signal_length = len(received_signal)
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order, 'forward') # Generate the auto-correlation matrix using the expectation method. here we use the forward filtering i.e. y[0:m], y[1:m+1]...
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/signal_length # Divide the auto-correlation matrix by the signal length
+    if return_eigvecs:
+        est_freq, source_vectors = esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method, corr_num_snapshots(received_signal[None,:,:], corr_mat_model_order), unitary, solver, True)
+        return est_freq[0,:], source_vectors[0,:,:]
+    est_freq = esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method, corr_num_snapshots(received_signal[None,:,:], corr_mat_model_order), unitary, solver)[0,:]
+    return est_freq   
+
+def esprit_backward(received_signal, num_sources, corr_mat_model_order, subspace_method='eigh', forward_backward=False, unitary=False, solver='qr', return_eigvecs=False):
+    '''num_sources, subspace_method, unitary, solver, return_eigvecs : see esprit_from_covariance ('auto' estimates the number of sources)
+       corr_mat_model_order : must be strictly less than half then signal length
+       received_signal : num_samples x L, L snapshot columns (see corr_matrix). forward_backward : see forward_backward_average'''
+    signal_length = len(received_signal)
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order, 'backward') # snapshots y[m-1], y[m-2],..y[0] and so on
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/signal_length # Divide the auto-correlation matrix by the signal length
+    if return_eigvecs:
+        est_freq, source_vectors = esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method, corr_num_snapshots(received_signal[None,:,:], corr_mat_model_order), unitary, solver, True)
+        return est_freq[0,:], source_vectors[0,:,:]
+    est_freq = esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method, corr_num_snapshots(received_signal[None,:,:], corr_mat_model_order), unitary, solver)[0,:]
+    return est_freq 
+
+
+class SubspaceTracker:
+    '''
+    Streaming signal subspace tracker (PAST/PASTd) for ESPRIT and MUSIC on continuous data. Every new sample forms the
+    forward snapshot [y[n-M+1],..y[n]] and updates the basis with a rank-one step of an exponentially weighted
+    subspace fit, so a hop costs O(M*num_sources) (PASTd) or O(M*num_sources + num_sources^2) (PAST) instead of a
+    covariance build plus an M x M decomposition.
+     inputs:
+         num_sources: dimension of the tracked signal subspace
+         corr_mat_model_order: snapshot length M
+         forgetting_factor: exponential forgetting factor in (0,1]. The effective window is about 1/(1-forgetting_factor) snapshots
+         method: 'pastd' (deflation, one eigenvector at a time) or 'past'
+         num_cells: number of signals tracked in parallel
+    '''
+    def __init__(self, num_sources, corr_mat_model_order, forgetting_factor=0.97, method='pastd', num_cells=1):
+        if method not in ('past','pastd'):
+            raise ValueError('Unknown tracking method {}'.format(method))
+        self.num_sources = num_sources
+        self.corr_mat_model_order = corr_mat_model_order
+        self.forgetting_factor = forgetting_factor
+        self.method = method
+        self.num_cells = num_cells
+        self.reset()
+
+    def reset(self, received_signal=None):
+        '''
+        Restart the tracker. Without received_signal the basis starts at the first num_sources unit vectors. Otherwise it
+        is initialised from the eigendecomposition of the forward covariance of received_signal (num_cells x num_samples)
+        and its last M-1 samples seed the snapshot buffer.
+        '''
+        num_rows, num_sources = self.corr_mat_model_order, self.num_sources
+        self.basis = np.zeros((self.num_cells,num_rows,num_sources),dtype='complex128') # W
+        self.basis[:,np.arange(num_sources),np.arange(num_sources)] = 1
+        self.eig_vals = np.ones((self.num_cells,num_sources)) # PASTd eigenvalue estimates
+        self.inv_proj_corr = np.tile(np.eye(num_sources,dtype='complex128'),(self.num_cells,1,1)) # PAST inverse of W^H R W
+        self.sample_ring = np.zeros((self.num_cells,2*num_rows),dtype='complex128') # last M samples, written twice (at k and k+M) so that the snapshot is always the slice [head:head+M]
+        self.ring_head = 0 # next write position, also the oldest of the last M samples
+        self.num_buffered = 0 # samples in the ring, up to M
+        if received_signal is not None:
+            received_signal = np.asarray(received_signal).reshape(self.num_cells,-1)
+            num_snapshots = received_signal.shape[1] - num_rows + 1
+            memory = num_snapshots if self.forgetting_factor == 1 else 1/(1-self.forgetting_factor)
+            auto_corr_matrix = corr_matrix(received_signal, num_rows, 'forward').astype('complex128')*(memory/num_snapshots) # scale of the exponentially weighted sum
+            us, eig_vals = signal_subspace(auto_corr_matrix, num_sources, 'eigh')
+            self.basis = np.ascontiguousarray(us)
+            self.eig_vals = eig_vals.copy()
+            self.inv_proj_corr = np.zeros_like(self.inv_proj_corr)
+            self.inv_proj_corr[:,np.arange(num_sources),np.arange(num_sources)] = 1/eig_vals
+            for sample in received_signal[:,num_snapshots::].T: # last M-1 samples, start of the next snapshot
+                self._push_sample(sample)
+
+    def update(self, new_samples):
+        '''
+        Feed new samples and return the updated ESPRIT frequency estimates
+         inputs:
+             new_samples: numpy array of shape num_cells x num_new_samples (1-D when num_cells is 1)
+         outputs:
+             est_freq: numpy array of shape num_cells x num_sources
+        '''
+        num_rows = self.corr_mat_model_order
+        for sample in np.asarray(new_samples).reshape(self.num_cells,-1).T:
+            self._push_sample(sample)
+            if self.num_buffered == num_rows:
+                self._rank_one_update(self.sample_ring[:,self.ring_head:self.ring_head+num_rows]) # [y[n-M+1],..y[n]], a view
+
+        return self.esprit()
+
+    def _push_sample(self, sample):
+        num_rows = self.corr_mat_model_order
+        self.sample_ring[:,self.ring_head] = sample
+        self.sample_ring[:,self.ring_head+num_rows] = sample
+        self.ring_head = (self.ring_head + 1) % num_rows
+        self.num_buffered = min(self.num_buffered + 1, num_rows)
+
+    def _rank_one_update(self, snapshot):
+        beta = self.forgetting_factor
+        if self.method == 'pastd':
+            residual = snapshot.copy()
+            for ele in range(self.num_sources):
+                basis_vec = self.basis[:,:,ele] # view, updated in place
+                proj = np.sum(basis_vec.conj()*residual,axis=1)
+                self.eig_vals[:,ele] = beta*self.eig_vals[:,ele] + np.abs(proj)**2
+                basis_vec += (residual - basis_vec*proj[:,None])*(proj.conj()/self.eig_vals[:,ele])[:,None]
+                residual = residual - basis_vec*proj[:,None] # deflate before tracking the next eigenvector
+        else:
+            proj = np.matmul(self.basis.conj().transpose(0,2,1), snapshot[:,:,None]) # y = W^H x
+            gain = np.matmul(self.inv_proj_corr, proj)
+            gain = gain/(beta + np.matmul(proj.conj().transpose(0,2,1), gain)) # g = P y/(beta + y^H P y)
+            inv_proj_corr = (self.inv_proj_corr - np.matmul(gain, np.matmul(proj.conj().transpose(0,2,1), self.inv_proj_corr)))/beta
+            self.inv_proj_corr = 0.5*(inv_proj_corr + inv_proj_corr.conj().transpose(0,2,1)) # keep P Hermitian
+            error = snapshot[:,:,None] - np.matmul(self.basis, proj)
+            self.basis += np.matmul(error, gain.conj().transpose(0,2,1))
+
+    def esprit(self):
+        '''ESPRIT frequency estimates (num_cells x num_sources) from the current basis'''
+        return esprit_shift_invariance(self.basis)
+
+    def music(self, digital_freq_grid, eval_mode='direct'):
+        '''MUSIC pseudo spectrum (num_cells x num_freq) from the current basis, same convention as music_forward with subspace='signal' '''
+        us, r_mat = np.linalg.qr(self.basis) # the tracked basis is only approximately orthonormal
+        AhGGhA = self.corr_mat_model_order - subspace_steering_energy(us, digital_freq_grid, eval_mode)
+        return 1/np.abs(AhGGhA)
+
+
+def load_diagonal(auto_corr_matrix, diagonal_loading):
+    '''
+    Diagonal loading R + delta*(trace(R)/M)*I
+     inputs:
+         auto_corr_matrix: numpy array of shape [..., M, M]
+         diagonal_loading: delta, a fraction of the average eigenvalue trace(R)/M. 0 returns the input unchanged
+     outputs:
+         loaded_matrix: numpy array of shape [..., M, M]
+    '''
+    if not diagonal_loading:
+        return auto_corr_matrix
+    num_rows = auto_corr_matrix.shape[-1]
+    avg_power = np.real(np.trace(auto_corr_matrix,axis1=-2,axis2=-1))/num_rows
+    return auto_corr_matrix + (diagonal_loading*avg_power)[...,None,None]*np.eye(num_rows,dtype=avg_power.dtype)
+
+
+def cholesky_factor(auto_corr_matrix, diagonal_loading=0):
+    '''
+    Lower Cholesky factor of load_diagonal(R, diagonal_loading). Without noise (or at high SNR) R is rank deficient and the
+    factorisation breaks down in floating point, so the cells that fail are retried with the smallest extra loading of
+    eps*M*10^k times trace(R)/M, k = 0,1,.., that makes them factorise
+     inputs:
+         auto_corr_matrix: numpy array of shape [..., M, M], Hermitian positive semi-definite
+         diagonal_loading: see load_diagonal
+     outputs:
+         chol_lower: numpy array of shape [..., M, M], R = LL^H
+    '''
+    loaded_matrix = load_diagonal(auto_corr_matrix, diagonal_loading)
+    try:
+        return np.linalg.cholesky(loaded_matrix)
+    except np.linalg.LinAlgError:
+        pass
+    num_rows = loaded_matrix.shape[-1]
+    min_loading = np.finfo(loaded_matrix.dtype).eps*num_rows
+    cell_matrices = loaded_matrix.reshape(-1,num_rows,num_rows)
+    chol_lower = np.zeros_like(cell_matrices)
+    for cell_num in np.arange(cell_matrices.shape[0]): # only the cells that fail are loaded
+        for extra_loading in np.concatenate(([0],min_loading*10.0**np.arange(9))):
+            try:
+                chol_lower[cell_num] = np.linalg.cholesky(load_diagonal(cell_matrices[cell_num], extra_loading))
+                break
+            except np.linalg.LinAlgError:
+                continue
+        else:
+            raise np.linalg.LinAlgError('auto-correlation matrix is not positive definite even after diagonal loading')
+
+    return chol_lower.reshape(loaded_matrix.shape)
+
+
+def inverse_cholesky_factor(auto_corr_matrix, diagonal_loading=0):
+    '''L^-1 for R = LL^H (see cholesky_factor), batched over the leading axes. R^-1 = L^-H L^-1'''
+    chol_lower = cholesky_factor(auto_corr_matrix, diagonal_loading) # R = LL^H
+    chol_lower_inv = np.linalg.inv(chol_lower) # the inverse of a triangular matrix is triangular, M x M per cell
+
+    return chol_lower_inv
 
-def music_forward(received_signal, num_sources, corr_mat_model_order, digital_freq_grid):
-    '''corr_mat_model_order : must be strictly less than half then signal length'''
-    signal_length = len(received_signal)
-    auto_corr_matrix = np.zeros((corr_mat_model_order,corr_mat_model_order)).astype('complex64')
-    for ele in np.arange(num_samples-corr_mat_model_order+1): # model order dictates the length of the auto-correlation matrix
-        auto_corr_matrix += np.matmul(received_signal[ele:ele+corr_mat_model_order,:],received_signal[ele:ele+corr_mat_model_order,:].T.conj()) # Generate the auto-correlation matrix using the expectation method. here we use the forward filtering i.e. y[0:m], y[1:m+1]...
-    auto_corr_matrix = auto_corr_matrix/signal_length # Divide the auto-correlation matrix by the signal length
-    u, s, vh = np.linalg.svd(auto_corr_matrix) # Perform SVD of the Auto-correlation matrix
-    noise_subspace = u[:,num_sources::] # The first # number of sources eigen vectors belong to the signal subspace and the remaining eigen vectors of U belong to the noise subspace which is orthogonal to the signal subspace. Hence pick these eigen vectors
-    vandermonde_matrix = np.exp(-1j*np.outer(np.arange(corr_mat_model_order),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies
-    GhA = np.matmul(noise_subspace.T.conj(),vandermonde_matrix) #G*A essentially projects the vandermond matrix (which spans the signal subspace) on the noise subspace
-    AhG = GhA.conj() # A*G
-    AhGGhA = np.sum(AhG*GhA,axis=0) # A*GG*A
-    pseudo_spectrum = 1/np.abs(AhGGhA) # Pseudo spectrum
-    return pseudo_spectrum
 
-def music_backward(received_signal, num_sources, corr_mat_model_order, digital_freq_grid):
-    '''corr_mat_model_order : must be strictly less than half the signal length'''
-    signal_length = len(received_signal)
-    auto_corr_matrix = np.zeros((corr_mat_model_order,corr_mat_model_order)).astype('complex64')
-    for ele in np.arange(corr_mat_model_order-1,signal_length):
-        if ele == corr_mat_model_order-1:
-            auto_corr_matrix += np.matmul(received_signal[ele::-1,:],received_signal[ele::-1,:].T.conj())
-        else:
-            auto_corr_matrix += np.matmul(received_signal[ele:ele-corr_mat_model_order:-1,:],received_signal[ele:ele-corr_mat_model_order:-1,:].T.conj())
-    auto_corr_matrix = auto_corr_matrix/signal_length # Divide the auto-correlation matrix by the signal length
-    u, s, vh = np.linalg.svd(auto_corr_matrix) # Perform SVD of the Auto-correlation matrix
-    noise_subspace = u[:,num_sources::] # The first # number of sources eigen vectors belong to the signal subspace and the remaining eigen vectors of U belong to the noise subspace which is orthogonal to the signal subspace. Hence pick these eigen vectors
-    vandermonde_matrix = np.exp(-1j*np.outer(np.arange(corr_mat_model_order),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies
-    GhA = np.matmul(noise_subspace.T.conj(),vandermonde_matrix) #G*A essentially projects the vandermond matrix (which spans the signal subspace) on the noise subspace
-    AhG = GhA.conj() # A*G
-    AhGGhA = np.sum(AhG*GhA,axis=0) # A*GG*A
-    pseudo_spectrum = 1/np.abs(AhGGhA) # Pseudo spectrum
-    return pseudo_spectrum
+def loaded_inverse(auto_corr_matrix, diagonal_loading=0):
+    '''R^-1 = L^-H L^-1 of load_diagonal(R, diagonal_loading) from its Cholesky factor, so that near singular matrices get the
+    minimal loading of cholesky_factor instead of an inverse that overflows. Batched over the leading axes'''
+    chol_lower_inv = inverse_cholesky_factor(auto_corr_matrix, diagonal_loading)
+    auto_corr_matrix_inv = np.matmul(np.swapaxes(chol_lower_inv.conj(),-1,-2), chol_lower_inv)
 
-def esprit_toeplitz(received_signal, num_sources):
-    signal_length = len(received_signal)
-    auto_corr_vec = sts_correlate(received_signal.T) # Generate the auto-correlation vector of the same length as the signal
-    auto_corr_matrix = vtoeplitz(auto_corr_vec) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
-    auto_corr_matrix = auto_corr_matrix[0,:,:]
-    u, s, vh = np.linalg.svd(auto_corr_matrix) # Perform SVD of the Auto-correlation matrix
-    us = u[:,0:num_sources] # signal subspace
-    us1 = us[0:signal_length-1,:] # First N-1 rows of us
-    us2 = us[1:signal_length,:] # Last N-1 rows of us
-    phi = np.matmul(np.linalg.pinv(us1), us2) # phi = pinv(us1)*us2, phi is similar to D and has same eigen vaues as D. D is a diagonal matrix with elements whose phase is the frequencies
-    eig_vals = np.linalg.eigvals(phi) # compute eigen values of the phi matrix which are same as the eigen values of the D matrix since phi and D are similar matrices and hence share same eigen values
-    est_freq = np.angle(eig_vals) # Angle/phase of the eigen values gives the frequencies
-    return est_freq
-    
-def esprit_forward(received_signal, num_sources, corr_mat_model_order):
-    '''corr_mat_model_order : must be strictly less than half then signal length'''
-    signal_length = len(received_signal)
-    auto_corr_matrix = np.zeros((corr_mat_model_order,corr_mat_model_order)).astype('complex64')
-    for ele in np.arange(signal_length-corr_mat_model_order+1): # model order dictates the length of the auto-correlation matrix
-        auto_corr_matrix += np.matmul(received_signal[ele:ele+corr_mat_model_order,:],received_signal[ele:ele+corr_mat_model_order,:].T.conj()) # Generate the auto-correlation matrix using the expectation method. here we use the forward filtering i.e. y[0:m], y[1:m+1]...
-    auto_corr_matrix = auto_corr_matrix/signal_length # Divide the auto-correlation matrix by the signal length
-    u, s, vh = np.linalg.svd(auto_corr_matrix) # Perform SVD of the Auto-correlation matrix
-    us = u[:,0:num_sources] # signal subspace
-    us1 = us[0:corr_mat_model_order-1,:] # First N-1 rows of us
-    us2 = us[1:corr_mat_model_order,:] # Last N-1 rows of us
-    phi = np.matmul(np.linalg.pinv(us1), us2) # phi = pinv(us1)*us2, phi is similar to D and has same eigen vaues as D. D is a diagonal matrix with elements whose phase is the frequencies
-    eig_vals = np.linalg.eigvals(phi) # compute eigen values of the phi matrix which are same as the eigen values of the D matrix since phi and D are similar matrices and hence share same eigen values
-    est_freq = np.angle(eig_vals) # Angle/phase of the eigen values gives the frequencies
-    return est_freq   
+    return auto_corr_matrix_inv
 
-def esprit_backward(received_signal, num_sources, corr_mat_model_order):
-    '''corr_mat_model_order : must be strictly less than half then signal length'''
-    signal_length = len(received_signal)
-    auto_corr_matrix = np.zeros((corr_mat_model_order,corr_mat_model_order)).astype('complex64')
-    for ele in np.arange(corr_mat_model_order-1,signal_length):
-        if ele == corr_mat_model_order-1:
-            auto_corr_matrix += np.matmul(received_signal[ele::-1,:],received_signal[ele::-1,:].T.conj())
-        else:
-            auto_corr_matrix += np.matmul(received_signal[ele:ele-corr_mat_model_order:-1,:],received_signal[ele:ele-corr_mat_model_order:-1,:].T.conj())
-    auto_corr_matrix = auto_corr_matrix/signal_length # Divide the auto-correlation matrix by the signal length
-    u, s, vh = np.linalg.svd(auto_corr_matrix) # Perform SVD of the Auto-correlation matrix
-    us = u[:,0:num_sources] # signal subspace
-    us1 = us[0:corr_mat_model_order-1,:] # First N-1 rows of us
-    us2 = us[1:corr_mat_model_order,:] # Last N-1 rows of us
-    phi = np.matmul(np.linalg.pinv(us1), us2) # phi = pinv(us1)*us2, phi is similar to D and has same eigen vaues as D. D is a diagonal matrix with elements whose phase is the frequencies
-    eig_vals = np.linalg.eigvals(phi) # compute eigen values of the phi matrix which are same as the eigen values of the D matrix since phi and D are similar matrices and hence share same eigen values
-    est_freq = np.angle(eig_vals) # Angle/phase of the eigen values gives the frequencies
-    return est_freq 
 
+def capon_quadratic_forms(auto_corr_matrix, digital_freq_grid, diagonal_loading=0, compute_rinv2=False, eval_mode='direct', vandermonde_matrix=None):
+    '''
+    Capon beam quadratic forms a^H R^-1 a (and a^H R^-2 a) from one Cholesky factorisation R = LL^H, without an explicit inverse.
+    With z = L^-1 A, a^H R^-1 a = ||z||^2 and a^H R^-2 a = ||L^-H z||^2
+     inputs:
+         auto_corr_matrix: numpy array of shape [..., M, M], Hermitian positive definite (near singular matrices get the
+                           minimal loading of cholesky_factor)
+         digital_freq_grid: numpy array of length num_freq
+         diagonal_loading: see load_diagonal
+         compute_rinv2: also return a^H R^-2 a
+         eval_mode : 'direct' (triangular solves against the steering matrix) or 'fft' (R^-1 from the Cholesky factor,
+                     then steering_quadratic_form)
+         vandermonde_matrix: precomputed M x num_freq steering matrix for 'direct' (e.g. from a SpectralPlan). None uses steering_matrix
+     outputs:
+         Ah_Rinv_A: numpy array of shape [..., num_freq]
+         Ah_Rinv_2_A: numpy array of shape [..., num_freq], None unless compute_rinv2
+    '''
+    num_rows = auto_corr_matrix.shape[-1]
+    chol_lower_inv = inverse_cholesky_factor(auto_corr_matrix, diagonal_loading) # L^-1
+    chol_lower_inv_h = np.swapaxes(chol_lower_inv.conj(),-1,-2)
+    Ah_Rinv_2_A = None
+    if eval_mode == 'fft':
+        auto_corr_matrix_inv = np.matmul(chol_lower_inv_h, chol_lower_inv) # R^-1 = L^-H L^-1
+        Ah_Rinv_A = steering_quadratic_form(auto_corr_matrix_inv, digital_freq_grid, -1, eval_mode)
+        if compute_rinv2:
+            Ah_Rinv_2_A = steering_quadratic_form(np.matmul(auto_corr_matrix_inv,auto_corr_matrix_inv), digital_freq_grid, -1, eval_mode)
+    else:
+        if vandermonde_matrix is None:
+            vandermonde_matrix = steering_matrix(num_rows, digital_freq_grid, -1)
+        whitened_steering = np.matmul(chol_lower_inv, vandermonde_matrix) # z = L^-1 A, the only M x M x K product needed for a^H R^-1 a
+        Ah_Rinv_A = np.sum(np.abs(whitened_steering)**2,axis=-2)
+        if compute_rinv2:
+            Rinv_A = np.matmul(chol_lower_inv_h, whitened_steering) # R^-1 A = L^-H z
+            Ah_Rinv_2_A = np.sum(np.abs(Rinv_A)**2,axis=-2)
+
+    return Ah_Rinv_A, Ah_Rinv_2_A
 
-def capon_toeplitz(received_signal, digital_freq_grid):
-    signal_length = len(received_signal)
-    auto_corr_vec = sts_correlate(received_signal.T) # Generate the auto-correlation vector of the same length as the signal
-    auto_corr_matrix = vtoeplitz(auto_corr_vec) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
+
+def capon_toeplitz(received_signal, digital_freq_grid, eval_mode='direct', diagonal_loading=0):
+    '''eval_mode, diagonal_loading : see capon_quadratic_forms'''
+    auto_corr_vec = np.mean(sts_correlate(received_signal.T),axis=0,keepdims=True) # Generate the auto-correlation vector of the same length as the signal, averaged over the snapshot columns
+    auto_corr_matrix = vtoeplitz(auto_corr_vec, read_only=True) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
     auto_corr_matrix = auto_corr_matrix[0,:,:]
-    auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
-    vandermonde_matrix = np.exp(-1j*np.outer(np.arange(signal_length),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies
-    auto_corr_matrix_inv_pow_2 = np.matmul(auto_corr_matrix_inv,auto_corr_matrix_inv)
-#    filter_bw_beta = corr_mat_model_order + 1
-    Ah_Rinv_2_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv_pow_2,vandermonde_matrix),axis=0)
-    Ah_Rinv_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv,vandermonde_matrix),axis=0)
+    Ah_Rinv_A, Ah_Rinv_2_A = capon_quadratic_forms(auto_corr_matrix, digital_freq_grid, diagonal_loading, True, eval_mode) # both from one Cholesky factor
     filter_bw_beta = Ah_Rinv_2_A/(Ah_Rinv_A)**2
     psd = np.abs((1/(Ah_Rinv_A))/filter_bw_beta)
     return psd
 
-def capon_forward(received_signal, corr_mat_model_order, digital_freq_grid):
-    '''corr_mat_model_order : must be strictly less than half then signal length'''
+def capon_forward(received_signal, corr_mat_model_order, digital_freq_grid, eval_mode='direct', diagonal_loading=0, forward_backward=False):
+    '''eval_mode, diagonal_loading : see capon_quadratic_forms
+       corr_mat_model_order : must be strictly less than half then signal length
+       received_signal : num_samples x L, L snapshot columns (see corr_matrix). forward_backward : see forward_backward_average'''
     signal_length = len(received_signal)
-    auto_corr_matrix = np.zeros((corr_mat_model_order,corr_mat_model_order)).astype('complex64')
-    for ele in np.arange(signal_length-corr_mat_model_order+1): # model order dictates the length of the auto-correlation matrix
-        auto_corr_matrix += np.matmul(received_signal[ele:ele+corr_mat_model_order,:],received_signal[ele:ele+corr_mat_model_order,:].T.conj()) # Generate the auto-correlation matrix using the expectation method. here we use the forward filtering i.e. y[0:m], y[1:m+1]...
-    auto_corr_matrix = auto_corr_matrix/(signal_length-corr_mat_model_order) # Divide the auto-correlation matrix by the (signal length-corr_mat_model_order)
-    auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
-    vandermonde_matrix = np.exp(-1j*np.outer(np.arange(corr_mat_model_order),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies
-    auto_corr_matrix_inv_pow_2 = np.matmul(auto_corr_matrix_inv,auto_corr_matrix_inv)
-    Ah_Rinv_2_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv_pow_2,vandermonde_matrix),axis=0)
-    Ah_Rinv_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv,vandermonde_matrix),axis=0)
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order, 'forward') # Generate the auto-correlation matrix using the expectation method. here we use the forward filtering i.e. y[0:m], y[1:m+1]...
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/max(signal_length-corr_mat_model_order,1) # Divide the auto-correlation matrix by the (signal length-corr_mat_model_order)
+    Ah_Rinv_A, Ah_Rinv_2_A = capon_quadratic_forms(auto_corr_matrix[0,:,:], digital_freq_grid, diagonal_loading, False, eval_mode)
 #    filter_bw_beta = Ah_Rinv_2_A/(Ah_Rinv_A)**2
     filter_bw_beta = corr_mat_model_order + 1
     psd = np.abs((1/(Ah_Rinv_A))/filter_bw_beta)
     return psd
     
     
-def capon_backward(received_signal, corr_mat_model_order, digital_freq_grid):
-    '''corr_mat_model_order : must be strictly less than half then signal length'''
+def capon_backward(received_signal, corr_mat_model_order, digital_freq_grid, eval_mode='direct', diagonal_loading=0, forward_backward=False):
+    '''eval_mode, diagonal_loading : see capon_quadratic_forms
+       corr_mat_model_order : must be strictly less than half then signal length
+       received_signal : num_samples x L, L snapshot columns (see corr_matrix). forward_backward : see forward_backward_average'''
     signal_length = len(received_signal)
-    auto_corr_matrix = np.zeros((corr_mat_model_order+1,corr_mat_model_order+1)).astype('complex64')
-    for ele in np.arange(corr_mat_model_order,signal_length):
-        if ele == corr_mat_model_order:
-            auto_corr_matrix += np.matmul(received_signal[ele::-1,:],received_signal[ele::-1,:].T.conj())
-        else:
-            auto_corr_matrix += np.matmul(received_signal[ele:ele-corr_mat_model_order-1:-1,:],received_signal[ele:ele-corr_mat_model_order-1:-1,:].T.conj())
-    auto_corr_matrix = auto_corr_matrix/(signal_length-corr_mat_model_order) # Divide the auto-correlation matrix by the (signal length-corr_mat_model_order)
-    auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
-    vandermonde_matrix = np.exp(-1j*np.outer(np.arange(corr_mat_model_order+1),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies
-    auto_corr_matrix_inv_pow_2 = np.matmul(auto_corr_matrix_inv,auto_corr_matrix_inv)
-    Ah_Rinv_2_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv_pow_2,vandermonde_matrix),axis=0)
-    Ah_Rinv_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv,vandermonde_matrix),axis=0)
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order+1, 'backward') # snapshots y[m], y[m-1],..y[0] and so on
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/max(signal_length-corr_mat_model_order,1) # Divide the auto-correlation matrix by the (signal length-corr_mat_model_order)
+    Ah_Rinv_A, Ah_Rinv_2_A = capon_quadratic_forms(auto_corr_matrix[0,:,:], digital_freq_grid, diagonal_loading, False, eval_mode)
     filter_bw_beta = corr_mat_model_order + 1
 #    filter_bw_beta = Ah_Rinv_2_A/(Ah_Rinv_A)**2
     psd = np.abs((1/(Ah_Rinv_A))/filter_bw_beta)
@@ -254,115 +1396,1159 @@ def capon_backward(received_signal, corr_mat_model_order, digital_freq_grid):
 
 
 
-def apes(received_signal, corr_mat_model_order, digital_freq_grid):
-    '''corr_mat_model_order : must be strictly less than half then signal length'''
-    signal_length = len(received_signal)
-    auto_corr_matrix = np.zeros((corr_mat_model_order+1,corr_mat_model_order+1)).astype('complex64')
-    y_tilda = np.zeros((corr_mat_model_order+1,0)).astype('complex64')
-    for ele in np.arange(corr_mat_model_order,signal_length):
-        if ele == corr_mat_model_order:
-            auto_corr_matrix += np.matmul(received_signal[ele::-1,:],received_signal[ele::-1,:].T.conj())
-            y_tilda = np.hstack((y_tilda,received_signal[ele::-1,:]))
-        else:
-            auto_corr_matrix += np.matmul(received_signal[ele:ele-corr_mat_model_order-1:-1,:],received_signal[ele:ele-corr_mat_model_order-1:-1,:].T.conj())
-            y_tilda = np.hstack((y_tilda,received_signal[ele:ele-corr_mat_model_order-1:-1,:]))
-    auto_corr_matrix = auto_corr_matrix/(signal_length-corr_mat_model_order) # Divide the auto-correlation matrix by the (signal length-corr_mat_model_order)
-    auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
-    vandermonde_matrix = np.exp(-1j*np.outer(np.arange(corr_mat_model_order+1),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies
-    temp_phasor = np.exp(-1j*np.outer(np.arange(corr_mat_model_order, signal_length),digital_freq_grid))
-    G_omega = np.matmul(y_tilda, temp_phasor)/(signal_length-corr_mat_model_order+1)
-    Ah_Rinv_G = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv, G_omega),axis=0)
-    Gh_Rinv_G = np.sum(G_omega.conj()*np.matmul(auto_corr_matrix_inv, G_omega),axis=0)
-    Ah_Rinv_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv,vandermonde_matrix),axis=0)
-    spectrum = Ah_Rinv_G/((1-Gh_Rinv_G)*Ah_Rinv_A + np.abs(Ah_Rinv_G)**2) # Actual APES based spectrum
+def root_capon_forward(received_signal, num_sources, corr_mat_model_order, diagonal_loading=0):
+    '''
+    Gridless Capon: the num_sources frequencies at which capon_forward peaks, from the roots of the polynomial a^H R^-1 a
+    closest to the unit circle (see steering_polynomial_roots)
+     inputs:
+         received_signal: numpy array of shape num_samples x 1, or num_samples x L for L snapshot columns (see corr_matrix)
+         num_sources: number of frequencies to return
+         corr_mat_model_order : must be strictly less than half the signal length
+         diagonal_loading: see load_diagonal. Near singular matrices (e.g. noiseless signals) also get the minimal loading
+                           of cholesky_factor, as in capon_forward
+     outputs:
+         est_freq: numpy array of length num_sources
+    '''
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order, 'forward') # the roots do not depend on the normalisation
+    auto_corr_matrix_inv = loaded_inverse(auto_corr_matrix, diagonal_loading)
+    est_freq = steering_polynomial_roots(auto_corr_matrix_inv, num_sources)[0,:]
+    return est_freq
+
+
+def root_capon_backward(received_signal, num_sources, corr_mat_model_order, diagonal_loading=0):
+    '''Gridless version of capon_backward, see root_capon_forward'''
+    auto_corr_matrix = corr_matrix(received_signal[None,:,:], corr_mat_model_order+1, 'backward')
+    auto_corr_matrix_inv = loaded_inverse(auto_corr_matrix, diagonal_loading)
+    est_freq = steering_polynomial_roots(auto_corr_matrix_inv, num_sources)[0,:]
+    return est_freq
+
+
+def apes(received_signal, corr_mat_model_order, digital_freq_grid, eval_mode='direct'):
+    '''eval_mode : 'direct' or 'fft' (see apes_batch)
+       corr_mat_model_order : must be strictly less than half then signal length
+       received_signal : num_samples x L. With L > 1 snapshot columns the spectrum is num_freq x L (see apes_batch)'''
+    spectrum = apes_batch(received_signal[None,:,:], corr_mat_model_order, digital_freq_grid, eval_mode)[0]
+    if spectrum.shape[1] == 1:
+        spectrum = spectrum[:,0]
 #    spectrum = Ah_Rinv_G/Ah_Rinv_A # Capon based spectrum
     
     return spectrum
 
 
-def iaa_approx_nonrecursive(received_signal, digital_freq_grid):
-    '''corr_mat_model_order : must be strictly less than half then signal length'''
+def ar_yule_walker(received_signal, model_order, digital_freq_grid, eval_mode='fft', return_model=False):
+    '''eval_mode : 'fft' or 'direct' (see ar_spectrum)
+       model_order : order p of the AR model, at most num_samples-1
+       received_signal : num_samples x L. The L snapshot columns share one AR model (see ar_yule_walker_batch)
+       return_model : also return the AR model (see ar_yule_walker_batch)'''
+    psd, model = ar_yule_walker_batch(received_signal[None,:,:], model_order, digital_freq_grid, eval_mode, True)
+    if return_model:
+        return psd[0], {key: value[0] for key, value in model.items()}
+    return psd[0]
+
+
+def ar_burg(received_signal, model_order, digital_freq_grid, eval_mode='fft', return_model=False):
+    '''eval_mode : 'fft' or 'direct' (see ar_spectrum)
+       model_order : order p of the AR model, at most num_samples-1
+       received_signal : num_samples x L. The L snapshot columns share one AR model (see ar_burg_batch)
+       return_model : also return the AR model (see ar_burg_batch)'''
+    psd, model = ar_burg_batch(received_signal[None,:,:], model_order, digital_freq_grid, eval_mode, True)
+    if return_model:
+        return psd[0], {key: value[0] for key, value in model.items()}
+    return psd[0]
+
+
+class StreamingCovariance:
+    '''
+    Sliding-window covariance for Capon and APES on streaming data. Every new sample adds the newest snapshot and drops the
+    oldest one as two rank-one updates, and the inverse follows by Sherman-Morrison in O(M^2) per sample instead of a
+    covariance rebuild plus an O(M^3) inverse. The window always holds signal_length samples, so capon() and apes() return
+    what capon_forward/capon_backward/apes return on the current window. The inverse (and the APES G_omega) are recomputed
+    from the window every refresh_interval samples to bound the round-off drift of the recursions.
+     inputs:
+         corr_mat_model_order: model order M, as in capon_forward / capon_backward / apes
+         signal_length: window length N in samples
+         digital_freq_grid: numpy array of length num_freq
+         method: 'forward' (capon_forward, M x M covariance) or 'backward' (capon_backward and apes, M+1 x M+1 covariance)
+         num_cells: number of signals processed in parallel
+         refresh_interval: number of samples between exact recomputations, None to never recompute
+    '''
+    def __init__(self, corr_mat_model_order, signal_length, digital_freq_grid, method='backward', num_cells=1, refresh_interval=1024):
+        if method not in ('forward','backward'):
+            raise ValueError('Unknown covariance method {}'.format(method))
+        self.corr_mat_model_order = corr_mat_model_order
+        self.snapshot_length = corr_mat_model_order + 1 if method == 'backward' else corr_mat_model_order
+        self.signal_length = signal_length
+        self.digital_freq_grid = digital_freq_grid
+        self.method = method
+        self.num_cells = num_cells
+        self.refresh_interval = refresh_interval
+        self.phase_drop = np.exp(-1j*corr_mat_model_order*digital_freq_grid)
+        self.phase_add = np.exp(-1j*signal_length*digital_freq_grid)
+        self.phase_shift = np.exp(1j*digital_freq_grid)
+        self.sample_ring = None
+
+    @property
+    def window(self):
+        '''Current window, num_cells x signal_length, oldest sample first (a view of the ring buffer)'''
+        if self.sample_ring is None:
+            return None
+        return self.sample_ring[:,self.ring_head:self.ring_head+self.signal_length]
+
+    def reset(self, received_signal):
+        '''
+        (Re)build the covariance, its inverse and G_omega from a full window
+         inputs:
+             received_signal: numpy array of shape num_cells x signal_length (1-D when num_cells is 1)
+        '''
+        window = np.asarray(received_signal).reshape(self.num_cells,-1).astype('complex128')
+        if window.shape[1] != self.signal_length:
+            raise ValueError('The window must hold exactly signal_length = {} samples'.format(self.signal_length))
+        self.sample_ring = np.hstack((window, window)) # every sample is written twice (at k and k+N) so that the window is always the slice [head:head+N]
+        self.ring_head = 0 # oldest sample of the window, also the next write position
+        snapshots = hankel_view(window, self.snapshot_length) # forward snapshots y[k:k+L]
+        self.corr_sum = np.matmul(snapshots.transpose(0,2,1), snapshots.conj()) # un-normalised forward covariance, kept in complex128
+        self.corr_sum_inv = np.linalg.inv(self.corr_sum)
+        if self.method == 'backward':
+            temp_phasor = steering_matrix(self.signal_length, self.digital_freq_grid, -1)[self.corr_mat_model_order:,:]
+            self.g_omega_sum = np.matmul(snapshots[:,:,::-1].transpose(0,2,1), temp_phasor) # sum over the backward snapshots, as in apes
+        self.samples_since_refresh = 0
+
+    def update(self, new_samples):
+        '''
+        Slide the window by the new samples
+         inputs:
+             new_samples: numpy array of shape num_cells x num_new_samples (1-D when num_cells is 1)
+        '''
+        new_samples = np.asarray(new_samples).reshape(self.num_cells,-1)
+        snapshot_length, signal_length = self.snapshot_length, self.signal_length
+        for ele in range(new_samples.shape[1]):
+            head = self.ring_head
+            oldest_snapshot = self.sample_ring[:,head:head+snapshot_length].copy() # its first sample is overwritten next
+            self.sample_ring[:,head] = new_samples[:,ele]
+            self.sample_ring[:,head+signal_length] = new_samples[:,ele]
+            head = self.ring_head = (head + 1) % signal_length
+            newest_snapshot = self.sample_ring[:,head+signal_length-snapshot_length:head+signal_length]
+            self._rank_one_update(newest_snapshot, 1)
+            self._rank_one_update(oldest_snapshot, -1)
+            if self.method == 'backward':
+                # G = sum_k yb_k exp(-j(M+k)w). Sliding by one sample drops yb_0, adds yb_new at k = N-M and shifts k by one
+                self.g_omega_sum -= oldest_snapshot[:,::-1,None]*self.phase_drop
+                self.g_omega_sum += newest_snapshot[:,::-1,None]*self.phase_add
+                self.g_omega_sum *= self.phase_shift
+            self.samples_since_refresh += 1
+            if self.refresh_interval is not None and self.samples_since_refresh >= self.refresh_interval:
+                self.reset(self.window)
+
+    def _rank_one_update(self, snapshot, sign):
+        # (S + sign x x^H)^-1 = S^-1 - sign (S^-1 x)(S^-1 x)^H/(1 + sign x^H S^-1 x)
+        inv_x = np.matmul(self.corr_sum_inv, snapshot[:,:,None])
+        denominator = 1 + sign*np.real(np.sum(snapshot.conj()*inv_x[:,:,0],axis=1))
+        self.corr_sum += sign*snapshot[:,:,None]*snapshot[:,None,:].conj()
+        self.corr_sum_inv -= sign*np.matmul(inv_x, inv_x.conj().transpose(0,2,1))/denominator[:,None,None]
+
+    def inverse(self):
+        '''Inverse of the normalised covariance used by capon_forward/capon_backward/apes, num_cells x L x L'''
+        auto_corr_matrix_inv = self.corr_sum_inv*(self.signal_length-self.corr_mat_model_order) # R = S/(N-M)
+        if self.method == 'backward':
+            auto_corr_matrix_inv = auto_corr_matrix_inv[:,::-1,::-1] # Rb = J Rf J
+        return auto_corr_matrix_inv
+
+    def capon(self, eval_mode='direct'):
+        '''Capon psd of the current window, num_cells x num_freq'''
+        Ah_Rinv_A = steering_quadratic_form(self.inverse(), self.digital_freq_grid, -1, eval_mode)
+        filter_bw_beta = self.corr_mat_model_order + 1
+        psd = np.abs((1/(Ah_Rinv_A))/filter_bw_beta)
+        return psd
+
+    def apes(self, eval_mode='direct'):
+        '''APES spectrum of the current window, num_cells x num_freq (method must be 'backward')'''
+        if self.method != 'backward':
+            raise ValueError('APES uses the backward covariance')
+        auto_corr_matrix_inv = self.inverse()
+        vandermonde_matrix = steering_matrix(self.snapshot_length, self.digital_freq_grid, -1)
+        G_omega = self.g_omega_sum/(self.signal_length-self.corr_mat_model_order+1)
+        Rinv_G = np.matmul(auto_corr_matrix_inv, G_omega)
+        Ah_Rinv_G = np.sum(vandermonde_matrix.conj()*Rinv_G,axis=1)
+        Gh_Rinv_G = np.sum(G_omega.conj()*Rinv_G,axis=1)
+        Ah_Rinv_A = steering_quadratic_form(auto_corr_matrix_inv, self.digital_freq_grid, -1, eval_mode)
+        spectrum = Ah_Rinv_G/((1-Gh_Rinv_G)*Ah_Rinv_A + np.abs(Ah_Rinv_G)**2)
+        return spectrum
+
+
+def iaa_approx_nonrecursive(received_signal, digital_freq_grid, eval_mode='direct'):
+    '''eval_mode : 'direct' or 'fft' (see steering_quadratic_form)
+       received_signal : num_samples x L. With L > 1 snapshot columns the spectrum is num_freq x L, one amplitude per column'''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
     signal_length = len(received_signal)
-    auto_corr_vec = sts_correlate(received_signal.T) # Generate the auto-correlation vector of the same length as the signal
-    auto_corr_matrix = vtoeplitz(auto_corr_vec) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
+    auto_corr_vec = np.mean(sts_correlate(received_signal.T),axis=0,keepdims=True) # Generate the auto-correlation vector of the same length as the signal, averaged over the snapshot columns
+    auto_corr_matrix = vtoeplitz(auto_corr_vec, read_only=True) # Create a toeplitz matrix which is variant of the Auto-correlation matrix
     auto_corr_matrix = auto_corr_matrix[0,:,:]    
     auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
-    vandermonde_matrix = np.exp(1j*np.outer(np.arange(signal_length),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies. Notice the posititve sign inside the exponential
-    Ah_Rinv_y = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv, received_signal),axis=0)
-    Ah_Rinv_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv,vandermonde_matrix),axis=0)
+    Ah_Rinv_y = steering_inner_product(np.matmul(auto_corr_matrix_inv, received_signal).T, digital_freq_grid, 1, eval_mode).T # Notice the posititve sign inside the exponential of the steering vector
+    Ah_Rinv_A = steering_quadratic_form(auto_corr_matrix_inv, digital_freq_grid, 1, eval_mode)
 #    spectrum = Ah_Rinv_G/((1-Gh_Rinv_G)*Ah_Rinv_A + np.abs(Ah_Rinv_G)**2) # Actual APES based spectrum
-    spectrum = Ah_Rinv_y/Ah_Rinv_A 
+    spectrum = Ah_Rinv_y/Ah_Rinv_A[:,None] # [num_freq, L]
+    if spectrum.shape[1] == 1:
+        spectrum = spectrum[:,0]
     
     return spectrum
 
 
-def iaa_approx_recursive_computeheavy(received_signal, digital_freq_grid, iterations):
-    '''corr_mat_model_order : must be strictly less than half the signal length'''
-    signal_length = len(received_signal)
+def iaa_approx_recursive_computeheavy(received_signal, digital_freq_grid, iterations, grid_chunk_size=None):
+    '''
+    Reference IAA for any grid. R = A P A^H is a Hermitian Toeplitz matrix whose first column is r_l = sum_k p_k exp(1j*w_k*l),
+    so it is built from A p without the num_freq x num_freq diagonal matrix P. A^H R^-1 y and A^H R^-1 A are explicit
+    products with the steering matrix
+     inputs:
+         received_signal: numpy array of shape num_samples x 1, or num_samples x L for L snapshot columns, whose powers are
+                          averaged into R (as in iaa_recursive)
+         digital_freq_grid: numpy array of length num_freq
+         iterations: number of IAA iterations
+         grid_chunk_size: None evaluates the whole grid at once with the cached steering matrix. An integer evaluates it in blocks
+                          of grid_chunk_size grid points whose steering vectors are recomputed every time, which bounds the
+                          working memory to about num_samples x grid_chunk_size whatever the size of the grid
+     outputs:
+         spectrum: complex numpy array of length num_freq, or num_freq x L (one amplitude per column)
+    '''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    signal_length, num_columns = received_signal.shape
     num_freq_grid_points = len(digital_freq_grid)
-    spectrum = np.fft.fftshift(np.fft.fft(received_signal.squeeze(),num_freq_grid_points)/(signal_length),axes=(0,))
-    vandermonde_matrix = np.exp(1j*np.outer(np.arange(signal_length),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies. Notice the posititve sign inside the exponential
+    spectrum = np.fft.fftshift(np.fft.fft(received_signal,num_freq_grid_points,axis=0)/(signal_length),axes=(0,)) # [num_freq, L]
+    vandermonde_matrix = None
+    if grid_chunk_size is None:
+        vandermonde_matrix = steering_matrix(signal_length, digital_freq_grid, 1) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies. Notice the posititve sign inside the exponential
+        grid_chunk_size = num_freq_grid_points
+    grid_chunks = [slice(start,start+grid_chunk_size) for start in np.arange(0,num_freq_grid_points,grid_chunk_size)]
+    def vandermonde_chunk(chunk):
+        if vandermonde_matrix is not None:
+            return vandermonde_matrix[:,chunk]
+        return np.exp(1j*np.arange(signal_length)[:,None]*digital_freq_grid[None,chunk]).astype(working_dtype('steering'), copy=False) # not cached
     for iter_num in np.arange(iterations):
-        power_vals = np.abs(spectrum)**2
-        diagonal_mat_power_vals = np.diag(power_vals)
-        A_P_Ah = np.matmul(vandermonde_matrix,np.matmul(diagonal_mat_power_vals,vandermonde_matrix.T.conj()))
-        auto_corr_matrix = A_P_Ah.copy()
+        power_vals = np.mean(np.abs(spectrum)**2,axis=1)
+        corr_vec = np.zeros(signal_length, dtype=working_dtype('steering'))
+        for chunk in grid_chunks:
+            corr_vec += np.matmul(vandermonde_chunk(chunk), power_vals[chunk]) # first column of A P A^H
+        auto_corr_matrix = vtoeplitz(corr_vec[None,:], dtype=corr_vec.dtype, read_only=True)[0,:,:] # Hermitian Toeplitz with first column corr_vec, kept at the steering precision (this is the accurate reference)
         auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
-        Ah_Rinv_y = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv, received_signal),axis=0)
-        Ah_Rinv_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv,vandermonde_matrix),axis=0)
-        spectrum = Ah_Rinv_y/Ah_Rinv_A 
-    
+        Rinv_y = np.matmul(auto_corr_matrix_inv, received_signal) # [num_samples, L]
+        Ah_Rinv_y = np.zeros((num_freq_grid_points,num_columns), dtype=corr_vec.dtype)
+        Ah_Rinv_A = np.zeros(num_freq_grid_points, dtype=corr_vec.dtype)
+        for chunk in grid_chunks:
+            vandermonde_block = vandermonde_chunk(chunk)
+            Ah_Rinv_y[chunk] = np.matmul(vandermonde_block.conj().T, Rinv_y)
+            Ah_Rinv_A[chunk] = np.sum(vandermonde_block.conj()*np.matmul(auto_corr_matrix_inv,vandermonde_block),axis=0)
+        spectrum = Ah_Rinv_y/Ah_Rinv_A[:,None]
+    if num_columns == 1:
+        spectrum = spectrum[:,0]
+
     return spectrum
 
 
-def iaa_recursive(received_signal, digital_freq_grid, iterations):
-    '''corr_mat_model_order : must be strictly less than half the signal length'''
+def iaa_iterate(iaa_step, received_signal, spectrum, iterations, tolerance=None):
+    '''
+    Runs the IAA iterations of a stack of cells, each cell stopping on its own once its spectrum settles
+     inputs:
+         iaa_step: function (received_signal, spectrum) -> next spectrum, called on the cells (axis 0) still iterating
+         received_signal: numpy array whose axis 0 is the cell
+         spectrum: starting spectrum, numpy array whose axis 0 is the cell
+         iterations: maximum number of iterations
+         tolerance: a cell stops once ||s_new - s_old|| / ||s_old|| <= tolerance. None runs all the iterations on every cell
+     outputs:
+         spectrum: numpy array of the same shape as the starting spectrum
+         info: dict with 'iterations', the number of iterations run by every cell, and 'residual', the relative spectrum
+               change of the last iteration of every cell (nan when no iteration ran)
+    '''
+    num_cells = spectrum.shape[0]
+    num_iterations = np.zeros(num_cells, dtype=int)
+    residual = np.full(num_cells, np.nan)
+    active_cells = np.arange(num_cells)
+    for iter_num in np.arange(iterations):
+        if active_cells.size == 0:
+            break
+        if active_cells.size == num_cells: # no gather while every cell iterates
+            spectrum_old = spectrum
+            spectrum_new = iaa_step(received_signal, spectrum_old)
+        else:
+            spectrum_old = spectrum[active_cells]
+            spectrum_new = iaa_step(received_signal[active_cells], spectrum_old)
+        spectrum_change = np.linalg.norm((spectrum_new - spectrum_old).reshape(active_cells.size,-1),axis=1)
+        spectrum_norm = np.linalg.norm(spectrum_old.reshape(active_cells.size,-1),axis=1)
+        cell_residual = spectrum_change/np.maximum(spectrum_norm,np.finfo(np.float64).tiny)
+        if active_cells.size == num_cells:
+            spectrum = spectrum_new
+        else:
+            spectrum[active_cells] = spectrum_new
+        num_iterations[active_cells] += 1
+        residual[active_cells] = cell_residual
+        if tolerance is not None:
+            active_cells = active_cells[cell_residual > tolerance]
+
+    return spectrum, {'iterations': num_iterations, 'residual': residual}
+
+
+def iaa_recursive(received_signal, digital_freq_grid, iterations, eval_mode='direct', tolerance=None, initial_spectrum=None, return_info=False):
+    '''eval_mode : 'direct' or 'fft' (see steering_quadratic_form)
+       received_signal : num_samples x L. With L > 1 snapshot columns the power of every frequency is averaged over the columns
+       and the spectrum is num_freq x L, one amplitude per column
+       iterations, tolerance : at most iterations iterations, stopping early once the relative spectrum change is below tolerance
+       initial_spectrum : warm start (e.g. the spectrum of the previous frame) instead of the FFT, in the layout of the output
+       return_info : also return the number of iterations run and the last relative change (see iaa_iterate)'''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
     signal_length = len(received_signal)
     num_freq_grid_points = len(digital_freq_grid)    
-    spectrum = np.fft.fftshift(np.fft.fft(received_signal.squeeze(),num_freq_grid_points)/(signal_length),axes=(0,))
+    if initial_spectrum is None:
+        spectrum = np.fft.fftshift(np.fft.fft(received_signal,num_freq_grid_points,axis=0)/(signal_length),axes=(0,)) # [num_freq, L]
+    else:
+        spectrum = np.asarray(initial_spectrum).reshape(num_freq_grid_points,-1)
 #    spectrum = np.ones(num_freq_grid_points)
-    vandermonde_matrix = np.exp(1j*np.outer(np.arange(signal_length),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies. Notice the posititve sign inside the exponential
-    for iter_num in np.arange(iterations):
-        spectrum_without_fftshift = np.fft.fftshift(spectrum,axes=(0,))
-        power_vals = np.abs(spectrum_without_fftshift)**2
+    def iaa_step(cell_signal, cell_spectrum): # one cell, [1, num_samples, L] and [1, num_freq, L]
+        spectrum_without_fftshift = np.fft.fftshift(cell_spectrum[0],axes=(0,))
+        power_vals = np.mean(np.abs(spectrum_without_fftshift)**2,axis=1)
         double_sided_corr_vect = np.fft.fft(power_vals,num_freq_grid_points)/(num_freq_grid_points)
         single_sided_corr_vec = double_sided_corr_vect[0:signal_length] # r0,r1,..rM-1
-        auto_corr_matrix = vtoeplitz(single_sided_corr_vec[None,:])[0,:,:].T
+        auto_corr_matrix = vtoeplitz(single_sided_corr_vec[None,:], read_only=True)[0,:,:].T
         auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
-        Ah_Rinv_y = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv, received_signal),axis=0)
-        Ah_Rinv_A = np.sum(vandermonde_matrix.conj()*np.matmul(auto_corr_matrix_inv,vandermonde_matrix),axis=0)
-        spectrum = Ah_Rinv_y/Ah_Rinv_A
-        print(iter_num)
+        Ah_Rinv_y = steering_inner_product(np.matmul(auto_corr_matrix_inv, cell_signal[0]).T, digital_freq_grid, 1, eval_mode).T # Notice the posititve sign inside the exponential of the steering vector
+        Ah_Rinv_A = steering_quadratic_form(auto_corr_matrix_inv, digital_freq_grid, 1, eval_mode)
+        return (Ah_Rinv_y/Ah_Rinv_A[:,None])[None,:,:]
+    spectrum, info = iaa_iterate(iaa_step, received_signal[None,:,:], spectrum[None,:,:], iterations, tolerance)
+    spectrum = spectrum[0]
+    if spectrum.shape[1] == 1:
+        spectrum = spectrum[:,0]
+    if return_info:
+        return spectrum, info
     return spectrum
 
 
 def iaa_recursive_levinson_temp(received_signal, digital_freq_grid, iterations):
     '''corr_mat_model_order : must be strictly less than half then signal length'''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    if received_signal.size != len(received_signal):
+        raise ValueError('iaa_recursive_levinson_temp takes a num_samples x 1 signal, got shape {}. Use iaa_recursive for num_samples x L snapshot matrices'.format(received_signal.shape))
     signal_length = len(received_signal)
     num_freq_grid_points = len(digital_freq_grid)    
     spectrum = np.fft.fftshift(np.fft.fft(received_signal.squeeze(),num_freq_grid_points)/(signal_length),axes=(0,))
 #    spectrum = np.ones(num_freq_grid_points)
-    vandermonde_matrix = np.exp(1j*np.outer(np.arange(signal_length),digital_freq_grid)) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies. Notice the posititve sign inside the exponential
+    vandermonde_matrix = steering_matrix(signal_length, digital_freq_grid, 1) # [num_samples,num_freq] # construct the vandermond matrix for several uniformly spaced frequencies. Notice the posititve sign inside the exponential
     for iter_num in np.arange(iterations):
         spectrum_without_fftshift = np.fft.fftshift(spectrum,axes=(0,))
         power_vals = np.abs(spectrum_without_fftshift)**2
         double_sided_corr_vect = np.fft.fft(power_vals,num_freq_grid_points)/(num_freq_grid_points)
         single_sided_corr_vec = double_sided_corr_vect[0:signal_length] # r0,r1,..rM-1
-        auto_corr_matrix = vtoeplitz(single_sided_corr_vec[None,:])[0,:,:].T
+        auto_corr_matrix = vtoeplitz(single_sided_corr_vec[None,:], read_only=True)[0,:,:].T
 #        auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
         Rinv_y = solve_levinson_durbin(auto_corr_matrix, received_signal.squeeze())
         Ah_Rinv_y = np.sum(vandermonde_matrix.conj()*Rinv_y[:,None],axis=0)
         Rinv_A = solve_levinson_durbin_ymatrix(auto_corr_matrix, vandermonde_matrix)
         Ah_Rinv_A = np.sum(vandermonde_matrix.conj()*Rinv_A,axis=0)
         spectrum = Ah_Rinv_y/Ah_Rinv_A
-        print(iter_num)
     return spectrum
 
 
+def iaa_recursive_fast(received_signal, digital_freq_grid, iterations, tolerance=None, initial_spectrum=None, return_info=False):
+    '''
+    Same estimate as iaa_recursive, computed without ever forming or inverting the auto-correlation matrix. See iaa_recursive_fast_batch.
+    For a single cell the Levinson recursion runs M small numpy steps per iteration, whose call overhead outweighs the M x M
+    inverse of iaa_recursive(..., 'fft') below about M = 128 (e.g. 0.86 ms against 0.63 ms per iteration at M = 32, 3200 grid
+    points, but 3.7 ms against 7.5 ms at M = 256). Use this variant for long signals, or iaa_recursive_fast_batch for many cells
+     inputs:
+         received_signal: numpy array of shape num_samples x 1
+         digital_freq_grid: uniform grid with a step of 2*pi/num_freq, as used by iaa_recursive
+         iterations: maximum number of IAA iterations
+         tolerance, return_info: see iaa_recursive_fast_batch
+         initial_spectrum: warm start, numpy array of length num_freq
+     outputs:
+         spectrum: complex numpy array of length num_freq
+         info: see iaa_iterate, only when return_info
+    '''
+    received_signal = np.asarray(received_signal)
+    if received_signal.size != len(received_signal):
+        raise ValueError('iaa_recursive_fast takes a num_samples x 1 signal, got shape {}. Use iaa_recursive for num_samples x L snapshot matrices'.format(received_signal.shape))
+    if initial_spectrum is not None:
+        initial_spectrum = np.asarray(initial_spectrum)[None,:]
+    spectrum, info = iaa_recursive_fast_batch(received_signal.reshape(1,-1), digital_freq_grid, iterations, tolerance, initial_spectrum, True)
+    if return_info:
+        return spectrum[0,:], info
+    return spectrum[0,:]
+
+
+def iaa_missing_data(observed_signal, observed_indices, signal_length, digital_freq_grid, iterations, eval_mode='direct',
+                     tolerance=None, initial_spectrum=None, return_info=False):
+    '''
+    IAA spectrum of a signal of which only some samples were observed (e.g. chirps lost to interference). See iaa_missing_data_batch
+     inputs:
+         observed_signal: numpy array of shape num_observed x 1, the samples y[observed_indices]
+         observed_indices: integer numpy array of length num_observed, sample indices between 0 and signal_length-1
+         signal_length: length of the complete signal
+         digital_freq_grid: numpy array of length num_freq
+         iterations, eval_mode, tolerance, return_info: see iaa_missing_data_batch
+         initial_spectrum: warm start, numpy array of length num_freq
+     outputs:
+         spectrum: complex numpy array of length num_freq
+         info: see iaa_iterate, only when return_info
+    '''
+    observed_signal = np.asarray(observed_signal)
+    if observed_signal.size != len(observed_signal):
+        raise ValueError('iaa_missing_data takes a num_observed x 1 signal, got shape {}'.format(observed_signal.shape))
+    if initial_spectrum is not None:
+        initial_spectrum = np.asarray(initial_spectrum)[None,:]
+    spectrum, info = iaa_missing_data_batch(observed_signal.reshape(1,-1), observed_indices, signal_length, digital_freq_grid, iterations, eval_mode,
+                                            tolerance, initial_spectrum, True)
+    if return_info:
+        return spectrum[0,:], info
+    return spectrum[0,:]
+
+
+def music_forward_batch(received_signal, num_sources, corr_mat_model_order, digital_freq_grid, eval_mode='direct', subspace='noise', subspace_method='eigh', forward_backward=False, unitary=False):
+    '''
+    Batched version of music_forward
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell (see corr_matrix)
+         num_sources: number of sources, or 'auto' to estimate it for every cell (see music_null_spectrum)
+         corr_mat_model_order : must be strictly less than half the signal length
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode, subspace, subspace_method: see music_null_spectrum
+         forward_backward: also average the auto-correlation matrix with J R* J (see forward_backward_average)
+         unitary: unitary MUSIC in real arithmetic (see music_null_spectrum)
+     outputs:
+         pseudo_spectrum: numpy array of shape num_cells x num_freq
+    '''
+    signal_length = received_signal.shape[1]
+    auto_corr_matrix = corr_matrix(received_signal, corr_mat_model_order, 'forward') # [num_cells, corr_mat_model_order, corr_mat_model_order], all the cells and lags in one batched GEMM
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/signal_length
+    AhGGhA = music_null_spectrum(auto_corr_matrix, num_sources, digital_freq_grid, subspace, subspace_method, eval_mode, corr_num_snapshots(received_signal, corr_mat_model_order),
+                                 None, unitary) # Stacked eigendecomposition across the cells
+    pseudo_spectrum = 1/np.abs(AhGGhA) # Pseudo spectrum, [num_cells, num_freq]
+    return pseudo_spectrum
+
+
+def music_backward_batch(received_signal, num_sources, corr_mat_model_order, digital_freq_grid, eval_mode='direct', subspace='noise', subspace_method='eigh', forward_backward=False, unitary=False):
+    '''
+    Batched version of music_backward
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell (see corr_matrix)
+         num_sources: number of sources, or 'auto' to estimate it for every cell (see music_null_spectrum)
+         corr_mat_model_order : must be strictly less than half the signal length
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode, subspace, subspace_method: see music_null_spectrum
+         forward_backward: also average the auto-correlation matrix with J R* J (see forward_backward_average)
+         unitary: unitary MUSIC in real arithmetic (see music_null_spectrum)
+     outputs:
+         pseudo_spectrum: numpy array of shape num_cells x num_freq
+    '''
+    signal_length = received_signal.shape[1]
+    auto_corr_matrix = corr_matrix(received_signal, corr_mat_model_order, 'backward')
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/signal_length
+    AhGGhA = music_null_spectrum(auto_corr_matrix, num_sources, digital_freq_grid, subspace, subspace_method, eval_mode, corr_num_snapshots(received_signal, corr_mat_model_order),
+                                 None, unitary) # Stacked eigendecomposition across the cells
+    pseudo_spectrum = 1/np.abs(AhGGhA) # Pseudo spectrum, [num_cells, num_freq]
+    return pseudo_spectrum
+
+
+def esprit_forward_batch(received_signal, num_sources, corr_mat_model_order, subspace_method='eigh', forward_backward=False, unitary=False, solver='qr', return_eigvecs=False):
+    '''
+    Batched version of esprit_forward
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell (see corr_matrix)
+         num_sources: number of sources, or 'auto' to estimate it for every cell (see esprit_from_covariance)
+         corr_mat_model_order : must be strictly less than half the signal length
+         subspace_method: see signal_subspace
+         forward_backward: also average the auto-correlation matrix with J R* J (see forward_backward_average)
+         unitary: unitary ESPRIT in real arithmetic (see esprit_from_covariance)
+         solver: 'qr', 'tls' or 'pinv' (see shift_invariance_solve)
+         return_eigvecs: also return the estimated source steering vectors (see esprit_from_covariance)
+     outputs:
+         est_freq: numpy array of shape num_cells x num_sources
+         source_vectors: numpy array of shape num_cells x M x num_sources, only when return_eigvecs
+    '''
+    signal_length = received_signal.shape[1]
+    auto_corr_matrix = corr_matrix(received_signal, corr_mat_model_order, 'forward')
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/signal_length
+    est_freq = esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method, corr_num_snapshots(received_signal, corr_mat_model_order), unitary, solver, return_eigvecs) # [num_cells, num_sources]
+    return est_freq
+
+
+def esprit_backward_batch(received_signal, num_sources, corr_mat_model_order, subspace_method='eigh', forward_backward=False, unitary=False, solver='qr', return_eigvecs=False):
+    '''
+    Batched version of esprit_backward
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell (see corr_matrix)
+         num_sources: number of sources, or 'auto' to estimate it for every cell (see esprit_from_covariance)
+         corr_mat_model_order : must be strictly less than half the signal length
+         subspace_method: see signal_subspace
+         forward_backward: also average the auto-correlation matrix with J R* J (see forward_backward_average)
+         unitary: unitary ESPRIT in real arithmetic (see esprit_from_covariance)
+         solver: 'qr', 'tls' or 'pinv' (see shift_invariance_solve)
+         return_eigvecs: also return the estimated source steering vectors (see esprit_from_covariance)
+     outputs:
+         est_freq: numpy array of shape num_cells x num_sources
+         source_vectors: numpy array of shape num_cells x M x num_sources, only when return_eigvecs
+    '''
+    signal_length = received_signal.shape[1]
+    auto_corr_matrix = corr_matrix(received_signal, corr_mat_model_order, 'backward')
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/signal_length
+    est_freq = esprit_from_covariance(auto_corr_matrix, num_sources, subspace_method, corr_num_snapshots(received_signal, corr_mat_model_order), unitary, solver, return_eigvecs) # [num_cells, num_sources]
+    return est_freq
+
+
+def capon_forward_batch(received_signal, corr_mat_model_order, digital_freq_grid, eval_mode='direct', diagonal_loading=0, forward_backward=False):
+    '''
+    Batched version of capon_forward
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell (see corr_matrix)
+         corr_mat_model_order : must be strictly less than half the signal length
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode, diagonal_loading: see capon_quadratic_forms
+         forward_backward: also average the auto-correlation matrix with J R* J (see forward_backward_average)
+     outputs:
+         psd: numpy array of shape num_cells x num_freq
+    '''
+    signal_length = received_signal.shape[1]
+    auto_corr_matrix = corr_matrix(received_signal, corr_mat_model_order, 'forward')
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/max(signal_length-corr_mat_model_order,1)
+    Ah_Rinv_A, Ah_Rinv_2_A = capon_quadratic_forms(auto_corr_matrix, digital_freq_grid, diagonal_loading, False, eval_mode) # Stacked Cholesky and triangular solves across the cells, [num_cells, num_freq]
+    filter_bw_beta = corr_mat_model_order + 1
+    psd = np.abs((1/(Ah_Rinv_A))/filter_bw_beta)
+    return psd
+
+
+def capon_backward_batch(received_signal, corr_mat_model_order, digital_freq_grid, eval_mode='direct', diagonal_loading=0, forward_backward=False):
+    '''
+    Batched version of capon_backward
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell (see corr_matrix)
+         corr_mat_model_order : must be strictly less than half the signal length
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode, diagonal_loading: see capon_quadratic_forms
+         forward_backward: also average the auto-correlation matrix with J R* J (see forward_backward_average)
+     outputs:
+         psd: numpy array of shape num_cells x num_freq
+    '''
+    signal_length = received_signal.shape[1]
+    auto_corr_matrix = corr_matrix(received_signal, corr_mat_model_order+1, 'backward')
+    if forward_backward:
+        auto_corr_matrix = forward_backward_average(auto_corr_matrix)
+    auto_corr_matrix = auto_corr_matrix/max(signal_length-corr_mat_model_order,1)
+    Ah_Rinv_A, Ah_Rinv_2_A = capon_quadratic_forms(auto_corr_matrix, digital_freq_grid, diagonal_loading, False, eval_mode) # Stacked Cholesky and triangular solves across the cells, [num_cells, num_freq]
+    filter_bw_beta = corr_mat_model_order + 1
+    psd = np.abs((1/(Ah_Rinv_A))/filter_bw_beta)
+    return psd
+
+
+def apes_batch(received_signal, corr_mat_model_order, digital_freq_grid, eval_mode='direct'):
+    '''
+    Batched version of apes
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell. R is then averaged over the columns (see corr_matrix) and
+                          Q = R - (1/L) sum_l g_l g_l^H, whose inverse follows from R^-1 and an L x L solve per frequency (Woodbury)
+         corr_mat_model_order : must be strictly less than half the signal length
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode: 'direct' : G_omega and a^H R^-1 a as matrix products with the steering matrices
+                    'fft' : G_omega as zero-padded FFTs of the rows of the snapshot matrix and a^H R^-1 a from the
+                            diagonal sums of R^-1 (see steering_quadratic_form). Non-uniform grids fall back to 'direct'
+     outputs:
+         spectrum: complex numpy array of shape num_cells x num_freq, or num_cells x num_freq x L (one amplitude per column)
+    '''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    signal_columns = received_signal if received_signal.ndim == 3 else received_signal[:,:,None]
+    num_cells, signal_length, num_columns = signal_columns.shape
+    num_snapshots = signal_length-corr_mat_model_order
+    auto_corr_matrix = corr_matrix(received_signal, corr_mat_model_order+1, 'backward')
+    column_signals = signal_columns.transpose(0,2,1).reshape(num_cells*num_columns, signal_length) # one row per column of every cell
+    y_tilda = hankel_view(column_signals, corr_mat_model_order+1)[:,:,::-1].transpose(0,2,1) # [num_cells*L, corr_mat_model_order+1, num_snapshots] view
+    auto_corr_matrix = auto_corr_matrix/num_snapshots
+    auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
+    vandermonde_matrix = steering_matrix(corr_mat_model_order+1, digital_freq_grid, -1)
+    if eval_mode == 'fft' and uniform_grid_fft_size(digital_freq_grid) is not None:
+        G_omega = grid_dtft(y_tilda, corr_mat_model_order, digital_freq_grid, -1) # row i of y_tilda carries the phases exp(-1j*(M+k)*w), k = 0,1..num_snapshots-1
+    else:
+        temp_phasor = steering_matrix(signal_length, digital_freq_grid, -1)[corr_mat_model_order:,:] # rows M..N-1 of the cached steering matrix
+        G_omega = np.matmul(y_tilda, temp_phasor)
+    G_omega = G_omega.reshape(num_cells, num_columns, corr_mat_model_order+1, -1)/(signal_length-corr_mat_model_order+1) # [num_cells, L, corr_mat_model_order+1, num_freq]
+    Rinv_G = np.matmul(auto_corr_matrix_inv[:,None,:,:], G_omega)
+    Ah_Rinv_G = np.sum(vandermonde_matrix.conj()*Rinv_G,axis=2) # [num_cells, L, num_freq]
+    Ah_Rinv_A = steering_quadratic_form(auto_corr_matrix_inv, digital_freq_grid, -1, eval_mode)[:,None,:]
+    if num_columns == 1:
+        Gh_Rinv_G = np.sum(G_omega.conj()*Rinv_G,axis=2)
+        spectrum = Ah_Rinv_G/((1-Gh_Rinv_G)*Ah_Rinv_A + np.abs(Ah_Rinv_G)**2)
+    else:
+        # With W = G^H R^-1 G and b = G^H R^-1 a, a^H Q^-1 G = L b^H (L I - W)^-1 and a^H Q^-1 a = a^H R^-1 a + b^H (L I - W)^-1 b
+        Gh_Rinv_G = np.einsum('clmf,cnmf->cfln', G_omega.conj(), Rinv_G) # W, [num_cells, num_freq, L, L]
+        Gh_Rinv_A = Ah_Rinv_G.conj().transpose(0,2,1) # b, [num_cells, num_freq, L]
+        Sinv_b = np.linalg.solve(num_columns*np.eye(num_columns) - Gh_Rinv_G, Gh_Rinv_A[...,None])[...,0]
+        Ah_Qinv_A = Ah_Rinv_A[:,0,:] + np.sum(Gh_Rinv_A.conj()*Sinv_b,axis=-1)
+        spectrum = (num_columns*Sinv_b.conj()/Ah_Qinv_A[...,None]).transpose(0,2,1) # [num_cells, L, num_freq]
+    if received_signal.ndim == 3:
+        spectrum = spectrum.transpose(0,2,1) # [num_cells, num_freq, L]
+    else:
+        spectrum = spectrum[:,0,:]
+    return spectrum
+
+
+def ar_yule_walker_batch(received_signal, model_order, digital_freq_grid, eval_mode='fft', return_model=False):
+    '''
+    Yule-Walker (autocorrelation method) AR spectrum. The biased auto-correlation r0,..rp of every cell is solved for the
+    predictor with the batched Levinson-Durbin recursion, so a cell costs O(N log N + p^2 + num_freq log num_freq), and the
+    biased estimate keeps the model stable (all |reflection_coeffs| < 1)
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell, whose auto-correlations are averaged
+         model_order: order p of the AR model, at most num_samples-1
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode: see ar_spectrum
+         return_model: also return the AR model
+     outputs:
+         psd: numpy array of shape num_cells x num_freq
+         model: dict with 'predictor' (num_cells x p+1, [1,a1,..ap]), 'prediction_error' (num_cells) and
+                'reflection_coeffs' (num_cells x p), only when return_model
+    '''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    signal_columns = received_signal if received_signal.ndim == 3 else received_signal[:,:,None]
+    num_cells, signal_length, num_columns = signal_columns.shape
+    column_signals = signal_columns.transpose(0,2,1).reshape(num_cells*num_columns, signal_length)
+    auto_corr_vec = sts_correlate(column_signals)[:,0:model_order+1].reshape(num_cells, num_columns, model_order+1) # r_k = sum_t y[t+k]y*[t]
+    auto_corr_vec = np.mean(auto_corr_vec,axis=1)/signal_length
+    predictor, prediction_error, reflection_coeffs = levinson_durbin_predictor(auto_corr_vec)
+    psd = ar_spectrum(predictor, prediction_error, digital_freq_grid, eval_mode)
+    if return_model:
+        return psd, {'predictor': predictor, 'prediction_error': prediction_error, 'reflection_coeffs': reflection_coeffs}
+    return psd
+
+
+def ar_burg_batch(received_signal, model_order, digital_freq_grid, eval_mode='fft', return_model=False):
+    '''
+    Burg AR spectrum. Each reflection coefficient minimises the sum of the forward and backward prediction error powers of
+    the data, k = -2 sum f b* / sum (|f|^2 + |b|^2), and the predictor is stepped up with it as in levinson_durbin_predictor.
+    Burg resolves closer peaks than Yule-Walker on short records, still in O(N p + num_freq log num_freq) per cell
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row), or num_cells x num_samples x L
+                          for L snapshot columns per cell, whose error powers are summed
+         model_order: order p of the AR model, at most num_samples-1
+         digital_freq_grid: numpy array of length num_freq
+         eval_mode: see ar_spectrum
+         return_model: also return the AR model
+     outputs:
+         psd: numpy array of shape num_cells x num_freq
+         model: dict with 'predictor' (num_cells x p+1, [1,a1,..ap]), 'prediction_error' (num_cells) and
+                'reflection_coeffs' (num_cells x p), only when return_model
+    '''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    signal_columns = received_signal if received_signal.ndim == 3 else received_signal[:,:,None]
+    num_cells, signal_length, num_columns = signal_columns.shape
+    forward_error = signal_columns.astype(np.result_type(signal_columns.dtype,np.complex64)) # f_0[t] = b_0[t] = y[t]
+    backward_error = forward_error.copy()
+    predictor = np.zeros((num_cells,model_order+1), dtype=forward_error.dtype)
+    predictor[:,0] = 1
+    prediction_error = np.mean(np.abs(forward_error)**2,axis=(1,2))
+    reflection_coeffs = np.zeros((num_cells,model_order), dtype=predictor.dtype)
+    for order in np.arange(model_order):
+        forward_error_cur = forward_error[:,order+1:,:] # f_p[t], t = p+1,..N-1
+        backward_error_prev = backward_error[:,order:-1,:] # b_p[t-1]
+        numerator = np.sum(forward_error_cur*backward_error_prev.conj(),axis=(1,2))
+        denominator = np.sum(np.abs(forward_error_cur)**2 + np.abs(backward_error_prev)**2,axis=(1,2))
+        reflection_coeff = -2*numerator/denominator
+        predictor[:,0:order+2] = predictor[:,0:order+2] + reflection_coeff[:,None]*predictor[:,order+1::-1].conj() # [a,0] + k*[0,J a*]
+        prediction_error = prediction_error*(1-np.abs(reflection_coeff)**2)
+        reflection_coeffs[:,order] = reflection_coeff
+        forward_error_next = forward_error_cur + reflection_coeff[:,None,None]*backward_error_prev # f_p+1[t] = f_p[t] + k b_p[t-1]
+        backward_error[:,order+1:,:] = backward_error_prev + reflection_coeff.conj()[:,None,None]*forward_error_cur # b_p+1[t] = b_p[t-1] + k* f_p[t]
+        forward_error[:,order+1:,:] = forward_error_next
+    psd = ar_spectrum(predictor, prediction_error, digital_freq_grid, eval_mode)
+    if return_model:
+        return psd, {'predictor': predictor, 'prediction_error': prediction_error, 'reflection_coeffs': reflection_coeffs}
+    return psd
+
+
+def iaa_recursive_batch(received_signal, digital_freq_grid, iterations, eval_mode='direct', tolerance=None, initial_spectrum=None, return_info=False):
+    '''
+    Batched version of iaa_recursive
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row)
+         digital_freq_grid: numpy array of length num_freq
+         iterations: maximum number of IAA iterations
+         tolerance: stop a cell once its relative spectrum change is below tolerance (see iaa_iterate). None runs all the iterations
+         initial_spectrum: warm start, e.g. the previous frame, numpy array of shape num_cells x num_freq. None starts from the FFT
+         return_info: also return the dict of iteration counts and residuals of iaa_iterate
+     outputs:
+         spectrum: complex numpy array of shape num_cells x num_freq
+         info: see iaa_iterate, only when return_info
+    '''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    signal_length = received_signal.shape[1]
+    num_freq_grid_points = len(digital_freq_grid)
+    if initial_spectrum is None:
+        spectrum = np.fft.fftshift(np.fft.fft(received_signal,num_freq_grid_points,axis=1)/(signal_length),axes=(1,))
+    else:
+        spectrum = np.asarray(initial_spectrum)
+    def iaa_step(received_signal, spectrum): # the cells still iterating
+        spectrum_without_fftshift = np.fft.fftshift(spectrum,axes=(1,))
+        power_vals = np.abs(spectrum_without_fftshift)**2
+        double_sided_corr_vect = np.fft.fft(power_vals,num_freq_grid_points,axis=1)/(num_freq_grid_points)
+        single_sided_corr_vec = double_sided_corr_vect[:,0:signal_length] # r0,r1,..rM-1 for every cell
+        auto_corr_matrix = vtoeplitz(single_sided_corr_vec, read_only=True).transpose(0,2,1) # vtoeplitz is already batched across the rows
+        auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
+        Ah_Rinv_y = steering_inner_product(np.matmul(auto_corr_matrix_inv, received_signal[:,:,None])[:,:,0], digital_freq_grid, 1, eval_mode) # Notice the posititve sign inside the exponential of the steering vector
+        Ah_Rinv_A = steering_quadratic_form(auto_corr_matrix_inv, digital_freq_grid, 1, eval_mode)
+        return Ah_Rinv_y/Ah_Rinv_A
+    spectrum, info = iaa_iterate(iaa_step, received_signal, spectrum, iterations, tolerance)
+    if return_info:
+        return spectrum, info
+    return spectrum
+
+
+def iaa_recursive_fast_batch(received_signal, digital_freq_grid, iterations, tolerance=None, initial_spectrum=None, return_info=False):
+    '''
+    Fast recursive IAA. Every iteration gets the Levinson predictor of the Toeplitz auto-correlation matrix R once and evaluates
+    A^H R^-1 y and A^H R^-1 A through the Gohberg-Semencul representation of R^-1 with FFTs, i.e. O(M^2 + num_freq log num_freq)
+    per iteration instead of an M x M inverse and two M x M x num_freq products. The recursion is vectorised over the cells, so
+    its per order overhead is shared by the whole batch (e.g. 45 ms against 377 ms per iteration of iaa_recursive_batch(..., 'fft')
+    for 200 cells of M = 128, 18 ms against 27 ms for 200 cells of M = 32). See iaa_recursive_fast for a single cell.
+     inputs:
+         received_signal: numpy array of shape num_cells x num_samples (one signal per row)
+         digital_freq_grid: uniform grid with a step of 2*pi/num_freq, as used by iaa_recursive
+         iterations: maximum number of IAA iterations
+         tolerance: stop a cell once its relative spectrum change is below tolerance (see iaa_iterate). None runs all the iterations
+         initial_spectrum: warm start, e.g. the previous frame, numpy array of shape num_cells x num_freq. None starts from the FFT
+         return_info: also return the dict of iteration counts and residuals of iaa_iterate
+     outputs:
+         spectrum: complex numpy array of shape num_cells x num_freq
+         info: see iaa_iterate, only when return_info
+    '''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    signal_length = received_signal.shape[1]
+    num_freq_grid_points = len(digital_freq_grid)
+    fft_size = uniform_grid_fft_size(digital_freq_grid) # checked once, not in every iteration
+    if fft_size is None:
+        raise ValueError('iaa_recursive_fast needs a uniform frequency grid with a step of 2*pi/L')
+    if initial_spectrum is None:
+        spectrum = np.fft.fftshift(np.fft.fft(received_signal,num_freq_grid_points,axis=1)/(signal_length),axes=(1,))
+    else:
+        spectrum = np.asarray(initial_spectrum)
+    def iaa_step(received_signal, spectrum): # the cells still iterating
+        spectrum_without_fftshift = np.fft.fftshift(spectrum,axes=(1,))
+        power_vals = np.abs(spectrum_without_fftshift)**2
+        double_sided_corr_vect = np.fft.fft(power_vals,num_freq_grid_points,axis=1)/(num_freq_grid_points)
+        single_sided_corr_vec = double_sided_corr_vect[:,0:signal_length] # r0,r1,..rM-1 is the first row of R, so its first column is the conjugate
+        predictor, prediction_error, reflection_coeffs = levinson_durbin_predictor(single_sided_corr_vec.conj())
+        Rinv_y = gohberg_semencul_solve(predictor, prediction_error, received_signal)
+        Ah_Rinv_y = grid_dtft(Rinv_y, 0, digital_freq_grid, -1, fft_size) # steering vector is exp(1j*w*n)
+        Ah_Rinv_A = grid_dtft(gohberg_semencul_diagonal_sums(predictor, prediction_error), -(signal_length-1), digital_freq_grid, -1, fft_size)
+        return Ah_Rinv_y/Ah_Rinv_A
+    spectrum, info = iaa_iterate(iaa_step, received_signal, spectrum, iterations, tolerance)
+    if return_info:
+        return spectrum, info
+    return spectrum
+
+
+def iaa_missing_data_batch(observed_signal, observed_indices, signal_length, digital_freq_grid, iterations, eval_mode='direct',
+                           tolerance=None, initial_spectrum=None, return_info=False):
+    '''
+    Missing-data IAA on the observed samples only. With the power p of the grid, the covariance of the complete signal is the
+    Hermitian Toeplitz matrix with first column r_l = sum_k p_k exp(1j*w_k*l), so the covariance of the observed samples is
+    gathered from r at the index differences, R_g[i,j] = r(n_i - n_j). The steering vectors are the rows observed_indices of the
+    complete steering matrix. No selection matrix or dictionary of the complete signal is formed.
+     inputs:
+         observed_signal: numpy array of shape num_cells x num_observed, the samples y[observed_indices] of every cell
+         observed_indices: integer numpy array of length num_observed, the same for all the cells
+         signal_length: length of the complete signal
+         digital_freq_grid: numpy array of length num_freq
+         iterations: maximum number of IAA iterations
+         eval_mode: 'direct' : products with the num_observed x num_freq gathered steering matrix
+                    'fft' : R_g^-1 y and R_g^-1 scattered back to the complete index range and evaluated with FFTs (see
+                            steering_inner_product and steering_quadratic_form). Needs a uniform grid, else falls back to 'direct'
+         tolerance, return_info: see iaa_iterate
+         initial_spectrum: warm start, numpy array of shape num_cells x num_freq. None starts from a^H y / num_observed
+     outputs:
+         spectrum: complex numpy array of shape num_cells x num_freq
+         info: see iaa_iterate, only when return_info
+    '''
+    observed_signal = working_signal(observed_signal) # precision policy, see set_precision
+    observed_indices = np.asarray(observed_indices)
+    num_cells, num_observed = observed_signal.shape
+    vandermonde_matrix = steering_matrix(signal_length, digital_freq_grid, 1) # [signal_length, num_freq], cached. Notice the posititve sign inside the exponential
+    observed_vandermonde = vandermonde_matrix[observed_indices,:] # [num_observed, num_freq]
+    lag_index = observed_indices[:,None] - observed_indices[None,:] + signal_length - 1 # n_i - n_j, shifted to index the two sided r
+    def scatter(vectors): # [..., num_observed] -> [..., signal_length] with zeros at the missing samples
+        complete_vectors = np.zeros(vectors.shape[:-1] + (signal_length,), dtype=vectors.dtype)
+        complete_vectors[...,observed_indices] = vectors
+        return complete_vectors
+    if initial_spectrum is None:
+        spectrum = steering_inner_product(scatter(observed_signal), digital_freq_grid, 1, eval_mode)/num_observed
+    else:
+        spectrum = np.asarray(initial_spectrum)
+    def iaa_step(observed_signal, spectrum): # the cells still iterating
+        power_vals = np.abs(spectrum)**2
+        corr_vec = np.matmul(power_vals, vandermonde_matrix.T) # r_0,..r_(N-1), [cells, signal_length]
+        two_sided_corr_vec = np.concatenate((corr_vec[:,:0:-1].conj(),corr_vec),axis=1) # r_-(N-1),..r_(N-1)
+        auto_corr_matrix = two_sided_corr_vec[:,lag_index].astype(working_dtype('covariance'), copy=False) # [cells, num_observed, num_observed]
+        auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
+        Rinv_y = np.matmul(auto_corr_matrix_inv, observed_signal[:,:,None])[:,:,0]
+        if eval_mode == 'fft' and uniform_grid_fft_size(digital_freq_grid) is not None:
+            Ah_Rinv_y = steering_inner_product(scatter(Rinv_y), digital_freq_grid, 1, 'fft')
+            complete_inv = np.zeros(auto_corr_matrix_inv.shape[:-2] + (signal_length,signal_length), dtype=auto_corr_matrix_inv.dtype)
+            complete_inv[:,observed_indices[:,None],observed_indices[None,:]] = auto_corr_matrix_inv
+            Ah_Rinv_A = steering_quadratic_form(complete_inv, digital_freq_grid, 1, 'fft') # only the diagonal sums of R_g^-1 are needed
+        else:
+            Ah_Rinv_y = np.matmul(Rinv_y, observed_vandermonde.conj())
+            Ah_Rinv_A = np.sum(observed_vandermonde.conj()*np.matmul(auto_corr_matrix_inv,observed_vandermonde),axis=-2)
+        return Ah_Rinv_y/Ah_Rinv_A
+    spectrum, info = iaa_iterate(iaa_step, observed_signal, spectrum, iterations, tolerance)
+    if return_info:
+        return spectrum, info
+    return spectrum
+
+
+def capon_2d_batch(received_signal, corr_mat_model_orders, digital_freq_grids, eval_mode='direct', diagonal_loading=0):
+    '''
+    2D Capon (e.g. joint range-Doppler) on the (M1+1)(M2+1) x (M1+1)(M2+1) auto-correlation matrix of the 2D subarrays
+    (see corr_matrix_2d). a^H R^-1 a is evaluated from the two-level diagonal sums of R^-1 with a 2D FFT
+    (see steering_quadratic_form_2d). With P = (M1+1)(M2+1), every cell costs O(N1 N2 P^2) to form R and O(P^3) to factor it,
+    i.e. O((M1 M2)^3), plus O(P (M1 + M2) + num_freq_1 num_freq_2 log) for the grid. The full two-level R resolves targets
+    that share neither frequency without cross-term ghosts, but the cubic cost limits the subarrays to a few hundred elements
+    (a 16 x 16 subarray is already a 289 x 289 factorisation per cell). iaa_2d_batch scales to larger patches with a
+    separable model
+     inputs:
+         received_signal: numpy array of shape num_cells x N1 x N2
+         corr_mat_model_orders : (M1, M2), each strictly less than half the signal length along its axis
+         digital_freq_grids: (digital_freq_grid_1, digital_freq_grid_2)
+         eval_mode: 'direct' or 'fft' (see steering_quadratic_form_2d)
+         diagonal_loading: see load_diagonal
+     outputs:
+         psd: numpy array of shape num_cells x num_freq_1 x num_freq_2
+    '''
+    corr_mat_model_order_1, corr_mat_model_order_2 = corr_mat_model_orders
+    subarray_shape = (corr_mat_model_order_1+1, corr_mat_model_order_2+1)
+    auto_corr_matrix = corr_matrix_2d(received_signal, subarray_shape, 'backward')
+    auto_corr_matrix_inv = loaded_inverse(auto_corr_matrix, diagonal_loading)
+    Ah_Rinv_A = steering_quadratic_form_2d(auto_corr_matrix_inv, subarray_shape, digital_freq_grids, -1, eval_mode)
+    filter_bw_beta = subarray_shape[0]*subarray_shape[1]
+    psd = np.abs((1/(Ah_Rinv_A))/filter_bw_beta)
+    return psd
+
+
+def apes_2d_batch(received_signal, corr_mat_model_orders, digital_freq_grids, eval_mode='direct'):
+    '''
+    2D APES on the auto-correlation matrix of the (M1+1) x (M2+1) subarrays (see corr_matrix_2d). The subarray DFTs
+    G(w1,w2) are 2D FFTs of the subarray samples, a^H R^-1 a comes from the two-level diagonal sums of R^-1
+    (see steering_quadratic_form_2d) and Q = R - g g^H is handled as in apes_batch (Woodbury). The cost per cell is that of
+    capon_2d_batch, O((M1 M2)^3) for the inverse of R, plus a P x P x num_freq_1 num_freq_2 product for R^-1 G
+     inputs:
+         received_signal: numpy array of shape num_cells x N1 x N2
+         corr_mat_model_orders : (M1, M2), each strictly less than half the signal length along its axis
+         digital_freq_grids: (digital_freq_grid_1, digital_freq_grid_2)
+         eval_mode: 'direct' or 'fft' (see steering_inner_product_2d and steering_quadratic_form_2d). Non-uniform grids fall
+                    back to 'direct'
+     outputs:
+         spectrum: complex numpy array of shape num_cells x num_freq_1 x num_freq_2
+    '''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    num_cells, signal_length_1, signal_length_2 = received_signal.shape
+    corr_mat_model_order_1, corr_mat_model_order_2 = corr_mat_model_orders
+    digital_freq_grid_1, digital_freq_grid_2 = digital_freq_grids
+    subarray_shape = (corr_mat_model_order_1+1, corr_mat_model_order_2+1)
+    num_snapshots_1 = signal_length_1-corr_mat_model_order_1
+    num_snapshots_2 = signal_length_2-corr_mat_model_order_2
+    auto_corr_matrix = corr_matrix_2d(received_signal, subarray_shape, 'backward')
+    auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
+    cell_stride, sample_stride_1, sample_stride_2 = received_signal.strides
+    y_tilda = np.lib.stride_tricks.as_strided(received_signal, shape=(num_cells,subarray_shape[0],subarray_shape[1],num_snapshots_1,num_snapshots_2),
+                                              strides=(cell_stride,sample_stride_1,sample_stride_2,sample_stride_1,sample_stride_2), writeable=False)
+    y_tilda = y_tilda[:,::-1,::-1,:,:] # backward subarrays, y_tilda[:,i1,i2,k1,k2] = y[M1+k1-i1, M2+k2-i2], a zero-copy view
+    G_omega = steering_inner_product_2d(y_tilda, digital_freq_grids, 1, eval_mode) # sum over k of y_tilda exp(-1j*(k1*w1+k2*w2)), [num_cells, M1+1, M2+1, num_freq_1, num_freq_2]
+    G_omega = G_omega*(np.exp(-1j*corr_mat_model_order_1*digital_freq_grid_1)[:,None]*np.exp(-1j*corr_mat_model_order_2*digital_freq_grid_2)[None,:]) # subarray k starts at sample M+k
+    G_omega = G_omega.reshape(num_cells, subarray_shape[0]*subarray_shape[1], -1)/(num_snapshots_1*num_snapshots_2) # subarray vectors as in corr_matrix_2d, averaged over the subarrays
+    Rinv_G = np.matmul(auto_corr_matrix_inv, G_omega) # [num_cells, (M1+1)(M2+1), num_freq_1*num_freq_2]
+    Gh_Rinv_G = np.sum(G_omega.conj()*Rinv_G,axis=1).reshape(num_cells, len(digital_freq_grid_1), len(digital_freq_grid_2))
+    vandermonde_matrix_1 = steering_matrix(subarray_shape[0], digital_freq_grid_1, -1)
+    vandermonde_matrix_2 = steering_matrix(subarray_shape[1], digital_freq_grid_2, -1)
+    Rinv_G = Rinv_G.reshape(num_cells, subarray_shape[0], subarray_shape[1], len(digital_freq_grid_1), len(digital_freq_grid_2))
+    Ah_Rinv_G = np.einsum('ia,jb,cijab->cab', vandermonde_matrix_1.conj(), vandermonde_matrix_2.conj(), Rinv_G) # (a1 kron a2)^H R^-1 g
+    Ah_Rinv_A = steering_quadratic_form_2d(auto_corr_matrix_inv, subarray_shape, digital_freq_grids, -1, eval_mode)
+    spectrum = Ah_Rinv_G/((1-Gh_Rinv_G)*Ah_Rinv_A + np.abs(Ah_Rinv_G)**2)
+    return spectrum
+
+
+def iaa_2d_batch(received_signal, digital_freq_grids, iterations, eval_mode='direct', tolerance=None, initial_spectrum=None, return_info=False):
+    '''
+    2D IAA (e.g. joint range-Doppler) with a Kronecker model of the IAA covariance. The power map P of the 2D grid is reduced to
+    its marginals p1 = P 1 and p2 = P^T 1, and R = A P A^H is replaced by (A1 diag(p1) A1^H) kron (A2 diag(p2) A2^H) / sum(P),
+    which is only exact when P is separable, P = p1 p2^T / sum(P), e.g. a single target. Both factors are Hermitian Toeplitz,
+    so every iteration inverts an N1 x N1 and an N2 x N2 matrix, and a^H R^-1 y = a1^H R1^-1 Y R2^-T conj(a2) is one 2D FFT,
+    instead of inverting the N1N2 x N1N2 matrix. With several targets the model also puts power at the cross positions
+    (w1 of one target, w2 of another). The data term keeps the peaks on the targets, but residual peaks can remain at the
+    cross positions (about -28 dB in the two target check of the test cases) and mask weaker targets there. capon_2d_batch
+    and apes_2d_batch use the exact two-level covariance at a higher cost
+     inputs:
+         received_signal: numpy array of shape num_cells x N1 x N2
+         digital_freq_grids: (digital_freq_grid_1, digital_freq_grid_2)
+         iterations: maximum number of IAA iterations
+         eval_mode: 'direct' or 'fft' (see steering_inner_product_2d and steering_quadratic_form)
+         tolerance: stop a cell once its relative spectrum change is below tolerance (see iaa_iterate). None runs all the iterations
+         initial_spectrum: warm start, numpy array of shape num_cells x num_freq_1 x num_freq_2. None starts from the 2D FFT
+         return_info: also return the dict of iteration counts and residuals of iaa_iterate
+     outputs:
+         spectrum: complex numpy array of shape num_cells x num_freq_1 x num_freq_2
+         info: see iaa_iterate, only when return_info
+    '''
+    received_signal = working_signal(received_signal) # precision policy, see set_precision
+    num_cells, signal_length_1, signal_length_2 = received_signal.shape
+    digital_freq_grid_1, digital_freq_grid_2 = digital_freq_grids
+    vandermonde_matrix_1 = steering_matrix(signal_length_1, digital_freq_grid_1, 1) # Notice the posititve sign inside the exponential
+    vandermonde_matrix_2 = steering_matrix(signal_length_2, digital_freq_grid_2, 1)
+    if initial_spectrum is None:
+        spectrum = steering_inner_product_2d(received_signal, digital_freq_grids, 1, eval_mode)/(signal_length_1*signal_length_2)
+    else:
+        spectrum = np.asarray(initial_spectrum)
+    def iaa_step(received_signal, spectrum): # the cells still iterating
+        power_vals = np.abs(spectrum)**2
+        corr_vec_1 = np.matmul(np.sum(power_vals,axis=2), vandermonde_matrix_1.T) # r1_l = sum_k p1_k exp(1j*w_k*l), [cells, N1]
+        corr_vec_2 = np.matmul(np.sum(power_vals,axis=1), vandermonde_matrix_2.T)
+        auto_corr_matrix_inv_1 = np.linalg.inv(vtoeplitz(corr_vec_1, read_only=True))
+        auto_corr_matrix_inv_2 = np.linalg.inv(vtoeplitz(corr_vec_2, read_only=True))
+        Rinv_y = np.matmul(np.matmul(auto_corr_matrix_inv_1, received_signal), np.swapaxes(auto_corr_matrix_inv_2,-1,-2)) # the common factor sum(P) cancels in the ratio below
+        Ah_Rinv_y = steering_inner_product_2d(Rinv_y, digital_freq_grids, 1, eval_mode)
+        Ah_Rinv_A_1 = steering_quadratic_form(auto_corr_matrix_inv_1, digital_freq_grid_1, 1, eval_mode)
+        Ah_Rinv_A_2 = steering_quadratic_form(auto_corr_matrix_inv_2, digital_freq_grid_2, 1, eval_mode)
+        return Ah_Rinv_y/(Ah_Rinv_A_1[:,:,None]*Ah_Rinv_A_2[:,None,:])
+    spectrum, info = iaa_iterate(iaa_step, received_signal, spectrum, iterations, tolerance)
+    if return_info:
+        return spectrum, info
+    return spectrum
+
+
+class SpectralPlan:
+    '''
+    Precomputed estimator for repeated calls with identical geometry, in the spirit of an FFTW plan. The steering matrices,
+    FFT size, snapshot geometry and normalisation are fixed when the plan is built, and every thread gets its own work
+    buffers (signal, conjugate signal and covariance), so calls do not allocate them again and a plan can be shared
+    read-only across threads.
+     inputs:
+         method: 'music_forward', 'music_backward', 'esprit_forward', 'esprit_backward', 'capon_forward', 'capon_backward' or 'apes'
+         num_samples: signal length N
+         corr_mat_model_order: model order M, as in the corresponding function
+         digital_freq_grid: numpy array of length num_freq (not needed for ESPRIT)
+         num_sources: number of sources (MUSIC and ESPRIT)
+         dtype: complex dtype of the work buffers and steering matrices
+         eval_mode: 'direct' or 'fft' (see steering_quadratic_form)
+         subspace, subspace_method: see music_null_spectrum (MUSIC and ESPRIT)
+         diagonal_loading: see load_diagonal (Capon)
+
+        plan(received_signal) takes a num_samples x 1 (or 1-D) signal and returns what the corresponding function returns.
+        A num_cells x num_samples array is processed as a batch and returns one row per cell.
+    '''
+    _geometry = {'music_forward': ('forward',0), 'music_backward': ('backward',0), 'esprit_forward': ('forward',0),
+                 'esprit_backward': ('backward',0), 'capon_forward': ('forward',0), 'capon_backward': ('backward',1),
+                 'apes': ('backward',1)} # direction and extra snapshot length over corr_mat_model_order
+
+    def __init__(self, method, num_samples, corr_mat_model_order, digital_freq_grid=None, num_sources=None, dtype='complex64',
+                 eval_mode='direct', subspace='noise', subspace_method='eigh', diagonal_loading=0):
+        if method not in self._geometry:
+            raise ValueError('Unknown method {}'.format(method))
+        if (digital_freq_grid is None) and not method.startswith('esprit'):
+            raise ValueError('{} needs a frequency grid'.format(method))
+        if (num_sources is None) and method.split('_')[0] in ('music','esprit'):
+            raise ValueError('{} needs the number of sources'.format(method))
+        self.method = method
+        self.estimator = method.split('_')[0]
+        self.num_samples = num_samples
+        self.corr_mat_model_order = corr_mat_model_order
+        self.num_sources = num_sources
+        self.dtype = np.dtype(dtype)
+        self.eval_mode = eval_mode
+        self.subspace = subspace
+        self.subspace_method = subspace_method
+        self.diagonal_loading = diagonal_loading
+        self.direction, extra_length = self._geometry[method]
+        self.snapshot_length = corr_mat_model_order + extra_length
+        if self.estimator in ('music','esprit'):
+            self.normalisation = 1/num_samples
+        else:
+            self.normalisation = 1/(num_samples-corr_mat_model_order)
+        if digital_freq_grid is not None:
+            self.digital_freq_grid = np.array(digital_freq_grid, dtype=np.float64)
+            self.digital_freq_grid.setflags(write=False)
+            self.fft_size = uniform_grid_fft_size(self.digital_freq_grid)
+            if self.fft_size is None:
+                self.eval_mode = 'direct' # same fallback as steering_quadratic_form
+            self.vandermonde_matrix = steering_matrix(self.snapshot_length, self.digital_freq_grid, -1, self.dtype)
+            if self.estimator == 'apes':
+                self.temp_phasor = steering_matrix(num_samples, self.digital_freq_grid, -1, self.dtype)[corr_mat_model_order:,:] # rows M..N-1
+        self._local = threading.local() # per thread work buffers
+
+    def _buffers(self, num_cells):
+        buffers = getattr(self._local, 'buffers', None)
+        if (buffers is None) or (buffers['signal'].shape[0] != num_cells):
+            buffers = {'signal': np.zeros((num_cells,self.num_samples),dtype=self.dtype),
+                       'signal_conj': np.zeros((num_cells,self.num_samples),dtype=self.dtype),
+                       'corr': np.zeros((num_cells,self.snapshot_length,self.snapshot_length),dtype=self.dtype)}
+            self._local.buffers = buffers
+        return buffers
+
+    def __call__(self, received_signal):
+        received_signal = np.asarray(received_signal)
+        single_signal = (received_signal.ndim == 1) or (received_signal.shape == (self.num_samples,1))
+        signal_rows = received_signal.reshape(1,-1) if single_signal else received_signal
+        if (signal_rows.ndim != 2) or (signal_rows.shape[1] != self.num_samples):
+            raise ValueError('The plan takes a num_samples x 1 signal or a num_cells x num_samples batch with num_samples = {}, got shape {}. '
+                             'num_samples x L snapshot matrices are not supported'.format(self.num_samples, received_signal.shape))
+        result = self._run(signal_rows)
+        if single_signal:
+            result = result[0]
+        return result
+
+    def _run(self, received_signal):
+        buffers = self._buffers(received_signal.shape[0])
+        signal, auto_corr_matrix = buffers['signal'], buffers['corr']
+        np.copyto(signal, received_signal, casting='unsafe')
+        np.conjugate(signal, out=buffers['signal_conj'])
+        data_matrix = hankel_view(signal, self.snapshot_length)
+        np.matmul(data_matrix.transpose(0,2,1), hankel_view(buffers['signal_conj'], self.snapshot_length), out=auto_corr_matrix) # same sum as corr_matrix
+        auto_corr_matrix *= self.normalisation
+        if self.direction == 'backward':
+            auto_corr_matrix = auto_corr_matrix[:,::-1,::-1]
+
+        if self.estimator == 'esprit':
+            us, signal_eig_vals = signal_subspace(auto_corr_matrix, self.num_sources, self.subspace_method)
+            return esprit_shift_invariance(us)
 
+        if self.estimator == 'music':
+            AhGGhA = music_null_spectrum(auto_corr_matrix, self.num_sources, self.digital_freq_grid, self.subspace, self.subspace_method,
+                                         self.eval_mode, None, self.vandermonde_matrix) # with the plan's steering matrix
+            return 1/np.abs(AhGGhA)
 
+        if self.estimator == 'capon':
+            Ah_Rinv_A, Ah_Rinv_2_A = capon_quadratic_forms(auto_corr_matrix, self.digital_freq_grid, self.diagonal_loading, False, self.eval_mode,
+                                                           self.vandermonde_matrix)
+            return np.abs((1/(Ah_Rinv_A))/(self.corr_mat_model_order + 1))
 
+        # apes
+        auto_corr_matrix_inv = np.linalg.inv(auto_corr_matrix)
+        y_tilda = data_matrix[:,:,::-1].transpose(0,2,1) # backward snapshots, as in apes_batch
+        if self.eval_mode == 'fft':
+            G_omega = grid_dtft(y_tilda, self.corr_mat_model_order, self.digital_freq_grid, -1)
+        else:
+            G_omega = np.matmul(y_tilda, self.temp_phasor)
+        G_omega = G_omega/(self.num_samples-self.corr_mat_model_order+1)
+        Rinv_G = np.matmul(auto_corr_matrix_inv, G_omega)
+        Ah_Rinv_G = np.sum(self.vandermonde_matrix.conj()*Rinv_G,axis=1)
+        Gh_Rinv_G = np.sum(G_omega.conj()*Rinv_G,axis=1)
+        Ah_Rinv_A = steering_quadratic_form(auto_corr_matrix_inv, self.digital_freq_grid, -1, self.eval_mode)
+        spectrum = Ah_Rinv_G/((1-Gh_Rinv_G)*Ah_Rinv_A + np.abs(Ah_Rinv_G)**2)
+        return spectrum
+
+
+def coarse_to_fine_peaks(spectrum_function, num_peaks, coarse_grid_size=256, refinement='zoom', num_refinements=4, zoom_points=9, num_candidates=None):
+    '''
+    Peak search that evaluates a (pseudo) spectrum on a coarse uniform grid, picks its local maxima and refines every one of
+    them on small local grids instead of evaluating the whole band densely. All the local grids of one refinement step go to
+    spectrum_function in a single call, so the estimator runs 1 + num_refinements times with
+    coarse_grid_size + num_candidates*num_refinements*zoom_points (zoom) or *3 (newton) frequencies in all.
+     inputs:
+         spectrum_function: callable mapping a 1-D array of digital frequencies to the spectrum at those frequencies, e.g.
+                            lambda grid: music_backward(received_signal, num_sources, corr_mat_model_order, grid).
+                            Complex spectra (APES, IAA) are ranked by magnitude. For IAA see iaa_spectrum_function
+         num_peaks: number of peaks to return
+         coarse_grid_size: points of the coarse grid over [-pi, pi). It must put a few points on every peak's mainlobe
+         refinement: 'zoom' : each step evaluates zoom_points frequencies over +-1 step of the previous grid around every peak
+                     'newton' : each step fits a parabola to the log spectrum at (f-h, f, f+h), i.e. a Newton step with
+                                finite difference derivatives, and moves to its vertex. h shrinks by 4 every step
+         num_refinements: number of refinement steps
+         zoom_points: points of every local grid (zoom only)
+         num_candidates: number of coarse maxima refined. Defaults to 2*num_peaks since close peaks may be out of order on the coarse grid
+     outputs:
+         peak_freq: numpy array of length num_peaks (fewer if the coarse spectrum has fewer maxima), by decreasing peak value
+         peak_vals: numpy array, the spectrum at peak_freq
+    '''
+    if refinement not in ('zoom','newton'):
+        raise ValueError('refinement must be zoom or newton')
+    if num_candidates is None:
+        num_candidates = 2*num_peaks
+    coarse_step = 2*np.pi/coarse_grid_size
+    coarse_grid = -np.pi + coarse_step*np.arange(coarse_grid_size)
+    coarse_vals = np.abs(spectrum_function(coarse_grid))
+    local_max = np.where((coarse_vals >= np.roll(coarse_vals,1)) & (coarse_vals > np.roll(coarse_vals,-1)))[0] # the grid wraps around at +-pi
+    candidates = local_max[np.argsort(coarse_vals[local_max])[::-1][0:num_candidates]]
+    peak_freq = coarse_grid[candidates]
+    peak_vals = coarse_vals[candidates]
+    num_cand = len(candidates)
+    half_width = coarse_step
+    for iter_num in np.arange(num_refinements):
+        if refinement == 'zoom':
+            local_grid = peak_freq[:,None] + np.linspace(-half_width,half_width,zoom_points)[None,:] # [num_candidates, zoom_points]
+            with uncached_steering(): # the local grids are never seen again
+                local_vals = np.abs(spectrum_function(local_grid.ravel())).reshape(num_cand,zoom_points)
+            best_index = np.argmax(local_vals,axis=1)
+            peak_freq = local_grid[np.arange(num_cand),best_index]
+            peak_vals = local_vals[np.arange(num_cand),best_index]
+            half_width = 2*half_width/(zoom_points-1) # new local grid spans one old step on either side
+        else:
+            stencil = peak_freq[:,None] + half_width*np.array([-1,0,1])[None,:]
+            with uncached_steering():
+                stencil_vals = np.abs(spectrum_function(stencil.ravel())).reshape(num_cand,3)
+            log_vals = np.log(np.maximum(stencil_vals,np.finfo(np.float64).tiny))
+            first_diff = (log_vals[:,2] - log_vals[:,0])/2
+            second_diff = log_vals[:,2] - 2*log_vals[:,1] + log_vals[:,0]
+            concave = second_diff < 0
+            step = np.where(concave, -first_diff/np.where(concave,second_diff,-1), np.sign(first_diff)) # Newton step (in units of h), uphill by h where the fit is not concave
+            step = np.clip(step,-1,1)
+            best_index = np.argmax(stencil_vals,axis=1)
+            improved = stencil_vals[np.arange(num_cand),best_index] > peak_vals
+            peak_freq = np.where(concave | improved, peak_freq + step*half_width, peak_freq)
+            peak_vals = np.maximum(peak_vals, stencil_vals[:,1])
+            half_width = half_width/4
+    if refinement == 'newton':
+        with uncached_steering():
+            peak_vals = np.abs(spectrum_function(peak_freq)) # value at the final vertex
+    peak_freq = np.angle(np.exp(1j*peak_freq)) # back to [-pi, pi)
+    order = np.argsort(peak_vals)[::-1]
+    peak_freq, peak_vals = peak_freq[order], peak_vals[order]
+    distinct = np.ones(num_cand,dtype=bool) # candidates that climbed to an already found peak are dropped
+    for ele in np.arange(1,num_cand):
+        distinct[ele] = np.all(np.abs(np.angle(np.exp(1j*(peak_freq[ele]-peak_freq[0:ele][distinct[0:ele]])))) > coarse_step/2)
+    peak_freq, peak_vals = peak_freq[distinct][0:num_peaks], peak_vals[distinct][0:num_peaks]
+
+    return peak_freq, peak_vals
 
 
+def iaa_spectrum_function(received_signal, digital_freq_grid, iterations):
+    '''
+    Runs recursive IAA on a uniform grid and returns a callable that evaluates the next IAA update,
+    a^H R^-1 y / a^H R^-1 a with the converged R, at arbitrary frequencies (for coarse_to_fine_peaks). IAA itself cannot be
+    evaluated on arbitrary grids since its covariance update is an FFT over the grid
+     inputs:
+         received_signal: numpy array of shape num_samples x 1
+         digital_freq_grid: uniform grid as used by iaa_recursive
+         iterations: number of IAA iterations
+     outputs:
+         spectrum_function: callable, 1-D array of digital frequencies -> complex spectrum
+    '''
+    received_signal = working_signal(received_signal)
+    signal_length = len(received_signal)
+    num_freq_grid_points = len(digital_freq_grid)
+    spectrum = iaa_recursive_batch(received_signal.T, digital_freq_grid, iterations)
+    power_vals = np.abs(np.fft.fftshift(spectrum,axes=(1,)))**2
+    single_sided_corr_vec = (np.fft.fft(power_vals,num_freq_grid_points,axis=1)/(num_freq_grid_points))[:,0:signal_length]
+    auto_corr_matrix_inv = np.linalg.inv(vtoeplitz(single_sided_corr_vec, read_only=True).transpose(0,2,1))
+    Rinv_y = np.matmul(auto_corr_matrix_inv, received_signal[None,:,:])[:,:,0]
 
+    def spectrum_function(freq_grid):
+        return (steering_inner_product(Rinv_y, freq_grid, 1)/steering_quadratic_form(auto_corr_matrix_inv, freq_grid, 1))[0,:]
 
+    return spectrum_function
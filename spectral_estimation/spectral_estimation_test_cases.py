@@ -259,3 +259,302 @@ if 0:
 
 
 
+
+
+
+### Batched estimators vs a loop of single signal calls
+if 0:
+    num_cells = 1000
+    num_samples = 32
+    num_sources = 2
+    noise_power_db = -40 # Noise Power in dB
+    noise_variance = 10**(noise_power_db/10)
+    noise_sigma = np.sqrt(noise_variance)
+    source_freq = np.random.uniform(low=-np.pi, high=np.pi, size = (num_cells,num_sources))
+    source_signals = np.sum(np.exp(1j*source_freq[:,None,:]*np.arange(num_samples)[None,:,None]),axis=2) # [num_cells, num_samples]
+    wgn_noise = np.random.normal(0,noise_sigma/np.sqrt(2),source_signals.shape) + 1j*np.random.normal(0,noise_sigma/np.sqrt(2),source_signals.shape)
+    received_signal = source_signals + wgn_noise
+    corr_mat_model_order = num_samples//2-2 # must be strictly less than num_samples/2
+    digital_freq_grid = np.arange(-np.pi,np.pi,2*np.pi/(10*num_samples))
+
+    t1 = time()
+    pseudo_spectrum_loop = np.array([spec_est.music_backward(received_signal[ele,:][:,None], num_sources, corr_mat_model_order, digital_freq_grid) for ele in np.arange(num_cells)])
+    t2 = time()
+    pseudo_spectrum_batch = spec_est.music_backward_batch(received_signal, num_sources, corr_mat_model_order, digital_freq_grid)
+    t3 = time()
+    print('MUSIC: loop over cells {0:.1f} ms, batched {1:.1f} ms'.format((t2-t1)*1000,(t3-t2)*1000))
+    print('Max relative deviation: {0:.2e}'.format(np.amax(np.abs(pseudo_spectrum_loop-pseudo_spectrum_batch)/np.abs(pseudo_spectrum_loop))))
+
+    t1 = time()
+    est_freq_loop = np.array([spec_est.esprit_backward(received_signal[ele,:][:,None], num_sources, corr_mat_model_order) for ele in np.arange(num_cells)])
+    t2 = time()
+    est_freq_batch = spec_est.esprit_backward_batch(received_signal, num_sources, corr_mat_model_order)
+    t3 = time()
+    print('ESPRIT: loop over cells {0:.1f} ms, batched {1:.1f} ms'.format((t2-t1)*1000,(t3-t2)*1000))
+
+
+
+### Streaming ESPRIT with the PASTd subspace tracker vs re-running esprit_forward on every hop
+if 0:
+    num_samples = 4096
+    hop_size = 32
+    window_length = 128
+    corr_mat_model_order = 16
+    num_sources = 2
+    noise_power_db = -30 # Noise Power in dB
+    noise_sigma = np.sqrt(10**(noise_power_db/10))
+    source_freq = np.array([0.5,-1.2])
+    chirp_phase = np.cumsum(source_freq[0] + 0.3*np.arange(num_samples)/num_samples) # first source drifts slowly
+    received_signal = np.exp(1j*chirp_phase) + np.exp(1j*source_freq[1]*np.arange(num_samples))
+    received_signal += np.random.normal(0,noise_sigma/np.sqrt(2),num_samples) + 1j*np.random.normal(0,noise_sigma/np.sqrt(2),num_samples)
+
+    tracker = spec_est.SubspaceTracker(num_sources, corr_mat_model_order, forgetting_factor=1-1/window_length)
+    tracker.reset(received_signal[0:window_length])
+    est_freq_tracker = []
+    est_freq_esprit = []
+    time_tracker = 0
+    time_esprit = 0
+    for hop_start in np.arange(window_length,num_samples,hop_size):
+        t1 = time()
+        est_freq_tracker.append(np.sort(tracker.update(received_signal[hop_start:hop_start+hop_size])[0]))
+        t2 = time()
+        est_freq_esprit.append(np.sort(spec_est.esprit_forward(received_signal[hop_start+hop_size-window_length:hop_start+hop_size][:,None], num_sources, corr_mat_model_order)))
+        t3 = time()
+        time_tracker += t2-t1
+        time_esprit += t3-t2
+    print('Tracker {0:.1f} ms, ESPRIT per hop {1:.1f} ms'.format(time_tracker*1000,time_esprit*1000))
+
+    plt.figure(9)
+    plt.title('Streaming ESPRIT')
+    plt.plot(np.array(est_freq_esprit),'o',label='esprit_forward per hop')
+    plt.plot(np.array(est_freq_tracker),'-',label='PASTd tracker')
+    plt.xlabel('Hop index')
+    plt.ylabel('Digital Frequencies')
+    plt.legend()
+    plt.grid(True)
+
+
+
+### Accuracy of the complex64 precision policy against the complex128 path, and of the 'mixed' default against both
+if 1:
+    rng = np.random.RandomState(0) # fixed seed, the tolerances below are checked
+    num_cells = 200
+    num_samples = 64
+    num_sources = 2
+    corr_mat_model_order = num_samples//2-2
+    noise_power_db = -30 # Noise Power in dB
+    noise_sigma = np.sqrt(10**(noise_power_db/10))
+    source_freq = rng.uniform(low=-np.pi, high=np.pi, size = (num_cells,num_sources))
+    received_signal = np.sum(np.exp(1j*source_freq[:,None,:]*np.arange(num_samples)[None,:,None]),axis=2)
+    received_signal += rng.normal(0,noise_sigma/np.sqrt(2),received_signal.shape) + 1j*rng.normal(0,noise_sigma/np.sqrt(2),received_signal.shape)
+    digital_freq_grid = np.arange(-np.pi,np.pi,2*np.pi/(10*num_samples))
+    estimators = {'MUSIC': lambda sig: spec_est.music_backward_batch(sig, num_sources, corr_mat_model_order, digital_freq_grid),
+                  'Capon': lambda sig: spec_est.capon_backward_batch(sig, corr_mat_model_order, digital_freq_grid),
+                  'Capon fft': lambda sig: spec_est.capon_backward_batch(sig, corr_mat_model_order, digital_freq_grid, 'fft'),
+                  'APES': lambda sig: np.abs(spec_est.apes_batch(sig, corr_mat_model_order, digital_freq_grid, 'fft')),
+                  'IAA': lambda sig: np.abs(spec_est.iaa_recursive_batch(sig, digital_freq_grid, 10, 'fft'))}
+    min_identical_peaks = {'MUSIC': 0.99, 'Capon': 0.99, 'Capon fft': 0.99, 'APES': 0.9, 'IAA': 0.95} # fraction of cells whose peaks do not move
+    for name, estimator in estimators.items():
+        spectra = {}
+        run_time = {}
+        for policy in ('complex128','complex64','mixed'):
+            spec_est.set_precision(policy)
+            t1 = time()
+            spectra[policy] = estimator(received_signal)
+            run_time[policy] = time() - t1
+        spec_est.set_precision('mixed')
+        peaks = {policy: np.sort(np.argsort(spectra[policy],axis=1)[:,-num_sources::],axis=1) for policy in spectra}
+        identical_peaks = {policy: np.mean(np.all(peaks['complex128']==peaks[policy],axis=1)) for policy in ('complex64','mixed')}
+        spectrum_dev_db = np.amax(np.abs(10*np.log10(spectra['complex64']/spectra['complex128'])))
+        print('{0}: {1} single precision, max spectrum deviation {2:.2e} dB, peaks identical in {3:.1f} % of cells, {4:.1f} ms vs {5:.1f} ms'.format(
+              name, spectra['complex64'].dtype, spectrum_dev_db, 100*identical_peaks['complex64'], run_time['complex64']*1000, run_time['complex128']*1000))
+        assert spectra['complex64'].dtype == np.float32, '{} does not stay in single precision under complex64'.format(name)
+        assert spectra['mixed'].dtype == np.float64, '{} output drops to single precision under mixed'.format(name)
+        for policy in ('complex64','mixed'):
+            assert identical_peaks[policy] >= min_identical_peaks[name], '{} peaks moved in {:.1f} % of the cells under {}'.format(name, 100*(1-identical_peaks[policy]), policy)
+    # fft and direct evaluation agree under the default policy (the fft path accumulates at the steering precision)
+    for name, (spectrum_fft, spectrum_direct) in {'Capon': (spec_est.capon_backward_batch(received_signal, corr_mat_model_order, digital_freq_grid, 'fft'),
+                                                            spec_est.capon_backward_batch(received_signal, corr_mat_model_order, digital_freq_grid, 'direct')),
+                                                  'IAA': (np.abs(spec_est.iaa_recursive_batch(received_signal, digital_freq_grid, 10, 'fft')),
+                                                          np.abs(spec_est.iaa_recursive_batch(received_signal, digital_freq_grid, 10, 'direct')))}.items():
+        fft_error = np.median(np.amax(np.abs(spectrum_fft-spectrum_direct),axis=1)/np.amax(spectrum_direct,axis=1))
+        assert fft_error < 1e-3, '{} fft and direct evaluation differ by {:.2e}'.format(name, fft_error)
+    # vtoeplitz keeps the precision of its input with dtype=None and follows the policy by default
+    corr_vec = np.exp(1j*np.arange(8))[None,:]
+    assert spec_est.vtoeplitz(corr_vec, dtype=None).dtype == np.complex128
+    assert spec_est.vtoeplitz(corr_vec).dtype == np.dtype(spec_est.working_dtype('covariance'))
+    print('Precision policy checks passed')
+
+
+
+### IAA with missing samples (e.g. a block of chirps lost to interference) against IAA on the complete signal
+if 0:
+    num_samples = 128
+    num_sources = 2
+    noise_power_db = -20 # Noise Power in dB
+    noise_sigma = np.sqrt(10**(noise_power_db/10))
+    source_freq = np.random.uniform(low=-np.pi, high=np.pi, size = num_sources)
+    received_signal = np.sum(np.exp(1j*source_freq[None,:]*np.arange(num_samples)[:,None]),axis=1)[:,None]
+    received_signal += np.random.normal(0,noise_sigma/np.sqrt(2),received_signal.shape) + 1j*np.random.normal(0,noise_sigma/np.sqrt(2),received_signal.shape)
+    observed_indices = np.r_[0:num_samples//3, num_samples//2:num_samples] # samples num_samples//3 to num_samples//2 are lost
+    digital_freq_grid = np.arange(-np.pi,np.pi,2*np.pi/(10*num_samples))
+    spectrum_complete = spec_est.iaa_recursive(received_signal, digital_freq_grid, 10, 'fft')
+    spectrum_missing = spec_est.iaa_missing_data(received_signal[observed_indices,:], observed_indices, num_samples, digital_freq_grid, 10, 'fft')
+    zero_filled_signal = np.zeros_like(received_signal)
+    zero_filled_signal[observed_indices,:] = received_signal[observed_indices,:]
+    spectrum_zero_filled = np.fft.fftshift(np.fft.fft(zero_filled_signal[:,0],len(digital_freq_grid)))/len(observed_indices)
+    plt.figure(10)
+    plt.title('IAA with {0} of {1} samples observed'.format(len(observed_indices), num_samples))
+    plt.plot(digital_freq_grid, 20*np.log10(np.abs(spectrum_complete)), label='IAA, complete signal')
+    plt.plot(digital_freq_grid, 20*np.log10(np.abs(spectrum_missing)), label='Missing-data IAA')
+    plt.plot(digital_freq_grid, 20*np.log10(np.abs(spectrum_zero_filled)), alpha=0.6, label='Zero-filled FFT')
+    plt.vlines(source_freq,-80,10, linestyles='dashed')
+    plt.xlabel('Digital Frequencies')
+    plt.ylabel('Power (dB)')
+    plt.legend()
+    plt.grid(True)
+
+
+
+### Joint 2D (e.g. range-Doppler) super-resolution with the IAA/Capon/APES against the 2D FFT
+if 0:
+    num_samples_1 = 16 # e.g. range samples of the patch
+    num_samples_2 = 16 # e.g. chirps
+    noise_power_db = -30 # Noise Power in dB
+    noise_sigma = np.sqrt(10**(noise_power_db/10))
+    source_freq = np.array([[0.5, 0.8], [0.5 + 0.6*2*np.pi/num_samples_1, 0.8 + 0.6*2*np.pi/num_samples_2], [-1.5, 2]]) # first two targets closer than a bin in both dimensions
+    received_signal = np.sum(np.exp(1j*(source_freq[:,0][:,None,None]*np.arange(num_samples_1)[None,:,None] + source_freq[:,1][:,None,None]*np.arange(num_samples_2)[None,None,:])),axis=0)
+    received_signal += np.random.normal(0,noise_sigma/np.sqrt(2),received_signal.shape) + 1j*np.random.normal(0,noise_sigma/np.sqrt(2),received_signal.shape)
+    digital_freq_grids = (np.arange(-np.pi,np.pi,2*np.pi/(8*num_samples_1)), np.arange(-np.pi,np.pi,2*np.pi/(8*num_samples_2)))
+    spectra = {'2D FFT': np.fft.fftshift(np.fft.fft2(received_signal,(len(digital_freq_grids[0]),len(digital_freq_grids[1]))))/(num_samples_1*num_samples_2),
+               'Separable IAA': spec_est.iaa_2d_batch(received_signal[None,:,:], digital_freq_grids, 15, 'fft')[0],
+               '2D Capon': spec_est.capon_2d_batch(received_signal[None,:,:], (num_samples_1//2-2,num_samples_2//2-2), digital_freq_grids, 'fft')[0],
+               '2D APES': spec_est.apes_2d_batch(received_signal[None,:,:], (num_samples_1//2-2,num_samples_2//2-2), digital_freq_grids, 'fft')[0]}
+    plt.figure(11)
+    for plot_num, (name, spectrum) in enumerate(spectra.items()):
+        plt.subplot(1,len(spectra),plot_num+1)
+        plt.title(name)
+        plt.imshow(20*np.log10(np.abs(spectrum)), origin='lower', aspect='auto', vmin=-40, vmax=5,
+                   extent=[digital_freq_grids[1][0],digital_freq_grids[1][-1],digital_freq_grids[0][0],digital_freq_grids[0][-1]])
+        plt.plot(source_freq[:,1], source_freq[:,0], 'rx')
+        plt.xlabel('Digital Frequencies (axis 2)')
+        plt.ylabel('Digital Frequencies (axis 1)')
+
+
+
+### AR (Yule-Walker / Burg) spectra as a cheap screening step against Capon
+if 0:
+    num_samples = 64
+    model_order = num_samples//4
+    noise_power_db = -30 # Noise Power in dB
+    noise_sigma = np.sqrt(10**(noise_power_db/10))
+    source_freq = np.array([0.7, 0.7 + 0.6*2*np.pi/num_samples, -1.5]) # first two tones closer than a bin
+    received_signal = np.sum(np.exp(1j*source_freq[None,:]*np.arange(num_samples)[:,None]),axis=1)[:,None]
+    received_signal += np.random.normal(0,noise_sigma/np.sqrt(2),received_signal.shape) + 1j*np.random.normal(0,noise_sigma/np.sqrt(2),received_signal.shape)
+    digital_freq_grid = np.arange(-np.pi,np.pi,2*np.pi/(16*num_samples))
+    psd_yule_walker = spec_est.ar_yule_walker(received_signal, model_order, digital_freq_grid)
+    psd_burg, burg_model = spec_est.ar_burg(received_signal, model_order, digital_freq_grid, 'fft', True)
+    psd_capon = spec_est.capon_backward(received_signal, model_order, digital_freq_grid, 'fft')
+    print('Burg reflection coefficient magnitudes: {}'.format(np.round(np.abs(burg_model['reflection_coeffs']),3)))
+    plt.figure(12)
+    plt.title('AR spectra, model order {}'.format(model_order))
+    plt.plot(digital_freq_grid, 10*np.log10(psd_yule_walker/np.amax(psd_yule_walker)), label='Yule-Walker')
+    plt.plot(digital_freq_grid, 10*np.log10(psd_burg/np.amax(psd_burg)), label='Burg')
+    plt.plot(digital_freq_grid, 10*np.log10(psd_capon/np.amax(psd_capon)), label='Capon')
+    plt.vlines(source_freq,-80,10, linestyles='dashed')
+    plt.xlabel('Digital Frequencies')
+    plt.ylabel('Power (dB)')
+    plt.legend()
+    plt.grid(True)
+
+
+
+### Regression: Capon on noiseless / high SNR signals, whose auto-correlation matrix is numerically singular
+if 1:
+    num_samples = 24
+    corr_mat_model_order = 8
+    source_freq = np.array([0.7, -1.3])
+    digital_freq_grid = np.arange(-np.pi,np.pi,2*np.pi/256)
+    for noise_sigma in (0, 1e-4):
+        received_signal = np.sum(np.array([1,0.5])[None,:]*np.exp(1j*source_freq[None,:]*np.arange(num_samples)[:,None]),axis=1)[:,None]
+        received_signal += noise_sigma*np.random.normal(0,1/np.sqrt(2),received_signal.shape)*(1+1j)
+        for eval_mode in ('direct','fft'):
+            psd_b = spec_est.capon_backward(received_signal, corr_mat_model_order, digital_freq_grid, eval_mode)
+            psd_plan = spec_est.SpectralPlan('capon_backward', num_samples, corr_mat_model_order, digital_freq_grid, eval_mode=eval_mode)(received_signal)
+            for psd in (psd_b, psd_plan):
+                assert np.all(np.isfinite(psd)), 'Capon spectrum is not finite on a near singular auto-correlation matrix'
+                assert np.allclose(np.sort(digital_freq_grid[np.argsort(psd)[-2:]]), np.sort(source_freq), atol=2*np.pi/256), 'Capon peaks moved'
+        est_freq_forward = spec_est.root_capon_forward(received_signal, 2, corr_mat_model_order) # the forward snapshots see the conjugate frequencies
+        est_freq_backward = spec_est.root_capon_backward(received_signal, 2, corr_mat_model_order)
+        assert np.allclose(np.sort(-est_freq_forward), np.sort(source_freq), atol=1e-3), 'root Capon (forward) on a near singular auto-correlation matrix'
+        assert np.allclose(np.sort(est_freq_backward), np.sort(source_freq), atol=1e-3), 'root Capon (backward) on a near singular auto-correlation matrix'
+    print('Capon near singular auto-correlation matrix checks passed')
+
+
+
+### 2D estimators locate both targets of a two-target scene (no cross-term ghosts at (w1 of one target, w2 of the other))
+if 1:
+    num_samples_1 = 16
+    num_samples_2 = 16
+    noise_sigma = np.sqrt(10**(-30/10))
+    source_freq = np.array([[0.5, 0.8], [-1.5, 2]])
+    rand_gen = np.random.RandomState(0)
+    received_signal = np.sum(np.exp(1j*(source_freq[:,0][:,None,None]*np.arange(num_samples_1)[None,:,None] + source_freq[:,1][:,None,None]*np.arange(num_samples_2)[None,None,:])),axis=0)
+    received_signal = received_signal + noise_sigma*(rand_gen.normal(0,1/np.sqrt(2),received_signal.shape) + 1j*rand_gen.normal(0,1/np.sqrt(2),received_signal.shape))
+    digital_freq_grids = (np.arange(-np.pi,np.pi,2*np.pi/128), np.arange(-np.pi,np.pi,2*np.pi/128))
+    for eval_mode in ('direct','fft'):
+        spectra = {'capon_2d_batch': spec_est.capon_2d_batch(received_signal[None,:,:], (num_samples_1//2-2,num_samples_2//2-2), digital_freq_grids, eval_mode)[0],
+                   'apes_2d_batch': spec_est.apes_2d_batch(received_signal[None,:,:], (num_samples_1//2-2,num_samples_2//2-2), digital_freq_grids, eval_mode)[0],
+                   'iaa_2d_batch': spec_est.iaa_2d_batch(received_signal[None,:,:], digital_freq_grids, 15, eval_mode)[0]}
+        for name, spectrum in spectra.items():
+            spectrum = np.abs(spectrum)
+            local_max = np.ones(spectrum.shape, dtype=bool) # local maxima over the 8 neighbours, the grids wrap around
+            for shift in ((0,1),(0,-1),(1,0),(-1,0),(1,1),(1,-1),(-1,1),(-1,-1)):
+                local_max &= spectrum >= np.roll(spectrum, shift, axis=(0,1))
+            peak_indices = np.flatnonzero(local_max)[np.argsort(spectrum[local_max])[::-1]]
+            peaks = np.stack(np.unravel_index(peak_indices, spectrum.shape), axis=1)
+            peak_freq = np.stack((digital_freq_grids[0][peaks[:,0]], digital_freq_grids[1][peaks[:,1]]), axis=1)
+            for target in source_freq:
+                assert np.any(np.all(np.abs(peak_freq[:2] - target) <= 2*np.pi/128, axis=1)), name + ' (' + eval_mode + ') misses the target at ' + str(target)
+            assert spectrum.flat[peak_indices[2]] < 0.1*spectrum.flat[peak_indices[1]], name + ' (' + eval_mode + ') has a spurious third peak'
+    print('2D two target peak checks passed')
+
+
+
+### ESPRIT source steering vectors (return_eigvecs) and least squares amplitudes
+if 1:
+    num_samples = 48
+    corr_mat_model_order = 12
+    source_freq = np.array([0.7, -1.3])
+    complex_signal_amplitudes = np.array([1, 0.5*np.exp(1j)])
+    rand_gen = np.random.RandomState(0)
+    received_signal = np.matmul(np.exp(1j*np.outer(np.arange(num_samples),source_freq)),complex_signal_amplitudes)[:,None]
+    received_signal = received_signal + 1e-3*(rand_gen.normal(0,1/np.sqrt(2),received_signal.shape) + 1j*rand_gen.normal(0,1/np.sqrt(2),received_signal.shape))
+    for unitary in (False, True):
+        for esprit_function in (spec_est.esprit_forward, spec_est.esprit_backward):
+            est_freq, source_vectors = esprit_function(received_signal, 2, corr_mat_model_order, unitary=unitary, return_eigvecs=True)
+            steering_vectors = np.exp(1j*np.outer(np.arange(corr_mat_model_order),est_freq))/np.sqrt(corr_mat_model_order)
+            assert np.allclose(np.abs(np.sum(steering_vectors.conj()*source_vectors,axis=0)), 1, atol=1e-4), 'ESPRIT source vectors are not the steering vectors'
+    est_freq = spec_est.esprit_forward(received_signal, 2, corr_mat_model_order)
+    est_amplitudes = np.linalg.lstsq(np.exp(1j*np.outer(np.arange(num_samples),est_freq)), received_signal[:,0], rcond=None)[0]
+    est_amplitudes = est_amplitudes[np.argsort(est_freq)[::-1]] # same order as source_freq
+    assert np.allclose(est_amplitudes, complex_signal_amplitudes, atol=1e-2), 'ESPRIT amplitudes'
+    print('ESPRIT source vector checks passed')
+
+
+
+### Unitary (real arithmetic) MUSIC gives the forward-backward MUSIC spectrum
+if 1:
+    num_samples = 64
+    corr_mat_model_order = 20
+    digital_freq_grid = np.arange(-np.pi,np.pi,2*np.pi/512)
+    rand_gen = np.random.RandomState(0)
+    received_signal = np.exp(1j*np.outer(rand_gen.uniform(-3,3,20),np.arange(num_samples))) + np.exp(1j*0.5*np.arange(num_samples))[None,:]
+    received_signal = received_signal + 0.1*(rand_gen.normal(0,1/np.sqrt(2),received_signal.shape) + 1j*rand_gen.normal(0,1/np.sqrt(2),received_signal.shape))
+    for music_function in (spec_est.music_forward_batch, spec_est.music_backward_batch):
+        for num_sources, subspace in ((2,'noise'), (2,'signal'), ('mdl','noise')):
+            for eval_mode in ('direct','fft'):
+                pseudo_spectrum_fb = music_function(received_signal, num_sources, corr_mat_model_order, digital_freq_grid, eval_mode, subspace, forward_backward=True)
+                pseudo_spectrum_unitary = music_function(received_signal, num_sources, corr_mat_model_order, digital_freq_grid, eval_mode, subspace, unitary=True)
+                assert np.amax(np.abs(1/pseudo_spectrum_fb - 1/pseudo_spectrum_unitary)) < 1e-5*corr_mat_model_order, 'Unitary MUSIC differs from forward-backward MUSIC'
+    print('Unitary MUSIC checks passed')